@@ -0,0 +1,173 @@
+"""
+Analysis handles: run an analysis once and serve every derived endpoint from it.
+
+``/upload`` and ``/analyze`` return an ``analysis_id``, a digest of the
+analysis inputs (image pair or probabilities, years, model version), so
+identical inputs always map to the same id. The stored entry holds the full
+``analyze_pair`` result, including the LLM recommendations, plus the inputs
+needed to interpret it.
+
+``/report``, ``/export``, ``/predict`` and ``/recommend`` accept the id and
+read the entry from the cache, falling back to the history table once the
+cache entry has expired. They never re-run the analysis. Requests that still
+send raw probabilities are mapped to the same kind of entry, so repeated
+calls with the same input are computed once too. Generated reports are
+cached per (id, detail, horizon).
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+import structlog
+
+from .config import settings
+from .cache import cache, analysis_handle_key, result_cache_key
+from .database import AsyncSessionLocal
+from . import history
+
+logger = structlog.get_logger()
+
+# Horizon used by /upload, which takes no future_years parameter
+DEFAULT_FUTURE_YEARS = 5
+
+
+class AnalysisInput(BaseModel):
+    """Either an ``analysis_id`` from /upload or /analyze, or raw probabilities and years."""
+
+    analysis_id: Optional[str] = Field(None, description="Handle returned by /upload or /analyze")
+    before_probs: Optional[List[float]] = None
+    after_probs: Optional[List[float]] = None
+    before_year: Optional[int] = None
+    after_year: Optional[int] = None
+    future_years: int = Field(DEFAULT_FUTURE_YEARS, ge=0, le=settings.MAX_FUTURE_YEARS)
+
+
+def make_analysis_id(kind: str, *parts: Any) -> str:
+    """Deterministic handle for an analysis of ``kind`` over ``parts``."""
+    raw = ":".join([kind, *(str(p) for p in parts)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def probs_analysis_id(before_probs, after_probs, before_year: int, after_year: int, future_years: int) -> str:
+    """Handle for an analysis computed from probability vectors (float32-rounded)."""
+    digest = hashlib.sha256(
+        np.asarray(before_probs, dtype="<f4").tobytes() + np.asarray(after_probs, dtype="<f4").tobytes()
+    ).hexdigest()
+    return make_analysis_id("probs", digest, before_year, after_year, future_years)
+
+
+def make_entry(analysis_id: str, analysis: Dict[str, Any], before_year: int, after_year: int,
+               future_years: int, model_version: Optional[str] = None,
+               before_probs=None, after_probs=None) -> Dict[str, Any]:
+    return {
+        "analysis_id": analysis_id,
+        "analysis": analysis,
+        "before_year": before_year,
+        "after_year": after_year,
+        "future_years": future_years,
+        "model_version": model_version,
+        "before_probs": None if before_probs is None else np.asarray(before_probs, dtype=float).tolist(),
+        "after_probs": None if after_probs is None else np.asarray(after_probs, dtype=float).tolist(),
+    }
+
+
+async def save_analysis(entry: Dict[str, Any]) -> bool:
+    return await cache.set(analysis_handle_key(entry["analysis_id"]), entry, ttl=settings.ANALYSIS_HANDLE_TTL)
+
+
+async def load_analysis(analysis_id: str) -> Dict[str, Any]:
+    """Stored entry for ``analysis_id`` from the cache, else the history table; 404 if unknown."""
+    entry = await cache.get(analysis_handle_key(analysis_id))
+    if entry is not None:
+        return entry
+
+    async with AsyncSessionLocal() as db:
+        record = await history.get_analysis_by_handle(db, analysis_id)
+    if record is None or not (record.get("analysis_results") or {}).get("analysis"):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired analysis_id '{analysis_id}'")
+    results = record["analysis_results"]
+    entry = make_entry(
+        analysis_id, results["analysis"], record["before_year"], record["after_year"],
+        results.get("future_years", DEFAULT_FUTURE_YEARS), record["model_version"],
+        record["before_probs"], record["after_probs"],
+    )
+    await save_analysis(entry)
+    return entry
+
+
+async def resolve_analysis(payload: AnalysisInput, svc) -> Dict[str, Any]:
+    """Entry for a request carrying either an ``analysis_id`` or raw inputs.
+
+    Raw inputs are analyzed at most once per distinct (probabilities, years,
+    horizon) while the entry stays cached.
+    """
+    if payload.analysis_id:
+        return await load_analysis(payload.analysis_id)
+    if None in (payload.before_probs, payload.after_probs, payload.before_year, payload.after_year):
+        raise HTTPException(
+            status_code=422,
+            detail="Provide analysis_id, or before_probs, after_probs, before_year and after_year",
+        )
+
+    analysis_id = probs_analysis_id(payload.before_probs, payload.after_probs,
+                                    payload.before_year, payload.after_year, payload.future_years)
+    entry = await cache.get(analysis_handle_key(analysis_id))
+    if entry is not None:
+        return entry
+    analysis = await run_in_threadpool(
+        svc.analyze_pair,
+        np.array(payload.before_probs),
+        np.array(payload.after_probs),
+        payload.before_year,
+        payload.after_year,
+        payload.future_years,
+    )
+    entry = make_entry(analysis_id, analysis, payload.before_year, payload.after_year, payload.future_years,
+                       before_probs=payload.before_probs, after_probs=payload.after_probs)
+    await save_analysis(entry)
+    return entry
+
+
+def analysis_for_horizon(entry: Dict[str, Any], future_years: int, svc) -> Dict[str, Any]:
+    """The stored analysis, with future trends re-projected if another horizon is asked for.
+
+    Only the Markov projection depends on the horizon; change detection,
+    impact and recommendations are reused as stored.
+    """
+    analysis = entry["analysis"]
+    if future_years == entry.get("future_years", DEFAULT_FUTURE_YEARS):
+        return analysis
+    future_trends = {"predictions": [], "confidence": 0}
+    years_passed = analysis.get("years_passed", 0)
+    if years_passed > 0:
+        future_trends = svc.change_detector.predict_future_trends(analysis["change_info"], years_passed, future_years)
+    return {**analysis, "future_trends": _json_safe(future_trends)}
+
+
+async def cached_reports(entry: Dict[str, Any], analysis: Dict[str, Any], detail: str,
+                         future_years: int, svc) -> Dict[str, Any]:
+    """LLM reports for an analysis, generated once per (analysis_id, detail, horizon).
+
+    Failed generations (``ai_report_generated`` False) are returned but not
+    cached, so a transient LLM error is retried by the next /report or /export.
+    """
+    key = result_cache_key("report", f"{entry['analysis_id']}:{detail}:{future_years}")
+    return await cache.get_or_compute(
+        key, lambda: run_in_threadpool(svc.generate_reports, analysis, detail, future_years),
+        cacheable=lambda reports: reports.get("ai_report_generated", False),
+    )
+
+
+def _json_safe(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, dict):
+        return {k: _json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_json_safe(v) for v in obj]
+    return obj
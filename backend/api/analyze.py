@@ -1,13 +1,23 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import base64
+import binascii
+import time
 import numpy as np
 
 # Handle both relative and absolute imports
 try:
-    from ..services.model_service import get_service
+    from ..services.model_service import get_service, get_class_names
+    from ..persistence import analysis_writer
+    from ..config import settings
+    from ..analysis_store import AnalysisInput, resolve_analysis
 except ImportError:
-    from services.model_service import get_service
+    from services.model_service import get_service, get_class_names
+    from persistence import analysis_writer
+    from config import settings
+    from analysis_store import AnalysisInput, resolve_analysis
 
 router = APIRouter()
 
@@ -16,20 +26,93 @@ class AnalyzeRequest(BaseModel):
     after_probs: List[float] = Field(..., description="Probabilities for after image across classes")
     before_year: int
     after_year: int
-    future_years: int = 5
+    future_years: int = Field(5, ge=0, le=settings.MAX_FUTURE_YEARS)
 
 
 @router.post("/analyze")
-def analyze(payload: AnalyzeRequest) -> Dict[str, Any]:
+async def analyze(payload: AnalyzeRequest) -> Dict[str, Any]:
     svc = get_service()
-    result = svc.analyze_pair(
-        np.array(payload.before_probs),
-        np.array(payload.after_probs),
+    started = time.perf_counter()
+    # Identical inputs map to the same analysis_id and are analyzed once while cached
+    entry = await resolve_analysis(AnalysisInput(**payload.dict()), svc)
+    result = entry['analysis']
+    analysis_writer.record(
+        analysis_id=entry['analysis_id'],
+        before_year=payload.before_year, after_year=payload.after_year,
+        processing_time=time.perf_counter() - started,
+        before_class=result['change_info']['before_class'],
+        after_class=result['change_info']['after_class'],
+        impact_type=result['environmental_impact'].get('impact_type'),
+        before_probs=payload.before_probs, after_probs=payload.after_probs,
+        analysis_results={'analysis': result, 'future_years': payload.future_years}, status='completed',
+    )
+    return {"status": "success", "analysis_id": entry['analysis_id'], "analysis": result}
+
+
+class ProbabilityPair(BaseModel):
+    before_probs: List[float]
+    after_probs: List[float]
+
+
+class AnalyzeBatchRequest(BaseModel):
+    pairs: Optional[List[ProbabilityPair]] = Field(None, description="Probability pairs as JSON lists")
+    packed: Optional[str] = Field(
+        None, description="Base64 little-endian float32 array of shape (N, 2, C): before/after per pair"
+    )
+    before_year: int
+    after_year: int
+    future_years: int = Field(5, ge=0, le=settings.MAX_FUTURE_YEARS)
+    layout: str = Field('records', description="records (one object per pair) or columnar (one list per field)")
+
+
+def _batch_matrices(payload: AnalyzeBatchRequest) -> np.ndarray:
+    """(N, 2, C) float64 array from either request encoding."""
+    n_classes = len(get_class_names())
+    if (payload.pairs is None) == (payload.packed is None):
+        raise HTTPException(status_code=422, detail="Provide exactly one of 'pairs' or 'packed'")
+    if payload.packed is not None:
+        try:
+            raw = base64.b64decode(payload.packed, validate=True)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=422, detail="'packed' is not valid base64")
+        if len(raw) % (4 * 2 * n_classes):
+            raise HTTPException(status_code=422, detail=f"'packed' must hold float32 (N, 2, {n_classes}) data")
+        matrices = np.frombuffer(raw, dtype='<f4').reshape(-1, 2, n_classes).astype(np.float64)
+    else:
+        if any(len(p.before_probs) != n_classes or len(p.after_probs) != n_classes for p in payload.pairs):
+            raise HTTPException(status_code=422, detail=f"Each probability vector must have {n_classes} entries")
+        matrices = np.array([[p.before_probs, p.after_probs] for p in payload.pairs], dtype=np.float64)
+        matrices = matrices.reshape(-1, 2, n_classes)
+    if len(matrices) == 0:
+        raise HTTPException(status_code=422, detail="No pairs to analyze")
+    if len(matrices) > settings.ANALYZE_BATCH_MAX_PAIRS:
+        raise HTTPException(
+            status_code=422, detail=f"At most {settings.ANALYZE_BATCH_MAX_PAIRS} pairs per request"
+        )
+    if not np.isfinite(matrices).all():
+        raise HTTPException(status_code=422, detail="Probabilities must be finite numbers")
+    return matrices
+
+
+@router.post("/analyze/batch")
+async def analyze_batch(payload: AnalyzeBatchRequest) -> Dict[str, Any]:
+    if payload.layout not in ('records', 'columnar'):
+        raise HTTPException(status_code=422, detail="layout must be 'records' or 'columnar'")
+    matrices = _batch_matrices(payload)
+    svc = get_service()
+    started = time.perf_counter()
+    result = await run_in_threadpool(
+        svc.analyze_batch,
+        matrices[:, 0],
+        matrices[:, 1],
         payload.before_year,
         payload.after_year,
         payload.future_years,
+        payload.layout,
     )
-    # Ensure serializable
-    if isinstance(result.get('change_info', {}).get('probability_difference'), np.ndarray):
-        result['change_info']['probability_difference'] = result['change_info']['probability_difference'].tolist()
-    return {"status": "success", "analysis": result}
+    # Batch calls are not written to the analysis history one row per pair
+    return {
+        "status": "success",
+        "processing_time": round(time.perf_counter() - started, 4),
+        **result,
+    }
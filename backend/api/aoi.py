@@ -0,0 +1,130 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+import time
+import urllib.error
+
+import numpy as np
+
+# Handle both relative and absolute imports
+try:
+    from ..services.model_service import get_service, get_class_names
+    from ..services import tile_store as tiles
+    from ..services.time_series import parse_observation_date
+    from ..metrics import stage_timer
+    from ..config import settings
+except ImportError:
+    from services.model_service import get_service, get_class_names
+    from services import tile_store as tiles
+    from services.time_series import parse_observation_date
+    from metrics import stage_timer
+    from config import settings
+
+router = APIRouter()
+
+
+class AOIRequest(BaseModel):
+    bbox: List[float] = Field(..., min_length=4, max_length=4, description="west, south, east, north (WGS84 degrees)")
+    zoom: int = Field(..., ge=0, le=tiles.MAX_ZOOM)
+    date: str = Field(..., description="Imagery date, YYYY or YYYY-MM-DD")
+    include_tiles: bool = True
+
+
+def _classify_missing(missing: List[tiles.Tile], date: str, model_version: str) -> Dict[tiles.Tile, np.ndarray]:
+    """Fetch and classify tiles in batches, storing each batch as soon as it is done."""
+    svc = get_service()
+    store = tiles.get_tile_store()
+    results: Dict[tiles.Tile, np.ndarray] = {}
+    with ThreadPoolExecutor(max_workers=settings.TILE_FETCH_CONCURRENCY) as pool:
+        for start in range(0, len(missing), settings.AOI_INFERENCE_BATCH):
+            chunk = missing[start:start + settings.AOI_INFERENCE_BATCH]
+            with stage_timer("tile_fetch"):
+                blobs = list(pool.map(lambda t: tiles.fetch_tile(*t, date), chunk))
+            batch, _ = svc.preprocess_batch(blobs)
+            predictions = svc.predict_batch(batch, model_version)
+            classified = [(tile, probs) for tile, (_, _, probs) in zip(chunk, predictions)]
+            store.put_many(model_version, date, classified)
+            results.update(classified)
+    return results
+
+
+def _summarize(found: Dict[tiles.Tile, np.ndarray], include_tiles: bool) -> Dict[str, Any]:
+    """Area-weighted class distribution over the AOI tiles."""
+    class_names = get_class_names()
+    keys = sorted(found)
+    probs = np.stack([found[k] for k in keys])
+    areas = np.array([tiles.tile_area_m2(z, y) for z, _, y in keys]) / 1_000_000
+    predicted = probs.argmax(axis=1)
+    distribution = areas @ probs / areas.sum()
+    class_areas = np.bincount(predicted, weights=areas, minlength=len(class_names))
+    summary: Dict[str, Any] = {
+        'total_area_km2': float(areas.sum()),
+        'class_distribution': dict(zip(class_names, distribution.tolist())),
+        'class_areas_km2': dict(zip(class_names, class_areas.tolist())),
+        'dominant_class': class_names[int(class_areas.argmax())],
+    }
+    if include_tiles:
+        summary['tiles'] = [
+            {'z': z, 'x': x, 'y': y, 'quadkey': tiles.tile_quadkey(z, x, y),
+             'pred_class': class_names[int(predicted[i])], 'confidence': float(probs[i, predicted[i]])}
+            for i, (z, x, y) in enumerate(keys)
+        ]
+    return summary
+
+
+@router.post("/aoi")
+async def analyze_aoi(payload: AOIRequest) -> Dict[str, Any]:
+    """Classify every XYZ tile of an area of interest for one imagery date.
+
+    Tiles already in the tile store for (date, model version) are read from it;
+    only the missing ones are fetched from ``TILE_SOURCE_URL`` and classified.
+    """
+    started = time.perf_counter()
+    west, south, east, north = payload.bbox
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise HTTPException(status_code=422, detail="bbox must be west < east and south < north in WGS84 degrees")
+    try:
+        date, _ = parse_observation_date(payload.date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="date must be YYYY or YYYY-MM-DD")
+
+    z = payload.zoom
+    x0, y0, x1, y1 = tiles.tile_range(payload.bbox, z)
+    total = (x1 - x0 + 1) * (y1 - y0 + 1)
+    if total > settings.AOI_MAX_TILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"AOI covers {total} tiles at zoom {z}; at most {settings.AOI_MAX_TILES} are allowed",
+        )
+
+    # The active model serves every AOI so stored tiles are shared across requests
+    with get_service().model_lease() as model_version:
+        store = tiles.get_tile_store()
+        with stage_timer("tile_lookup"):
+            found = await run_in_threadpool(store.get_range, model_version, date, z, x0, y0, x1, y1)
+        cached = len(found)
+        missing: List[Tuple[int, int, int]] = [
+            (z, x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1) if (z, x, y) not in found
+        ]
+        if missing:
+            if not settings.TILE_SOURCE_URL:
+                raise HTTPException(status_code=503, detail=f"{len(missing)} tiles are not stored and no tile source is configured")
+            try:
+                found.update(await run_in_threadpool(_classify_missing, missing, date, model_version))
+            except (urllib.error.URLError, TimeoutError, ValueError) as e:
+                raise HTTPException(status_code=502, detail=f"Tile source error: {e}")
+
+    return {
+        'status': 'success',
+        'model_version': model_version,
+        'date': date,
+        'zoom': z,
+        'bbox': payload.bbox,
+        'tiles_total': total,
+        'tiles_cached': cached,
+        'tiles_classified': len(missing),
+        'processing_time': round(time.perf_counter() - started, 4),
+        **_summarize(found, payload.include_tiles),
+    }
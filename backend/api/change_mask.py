@@ -0,0 +1,73 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict
+import base64
+import time
+
+import numpy as np
+
+# Handle both relative and absolute imports
+try:
+    from ..services.model_service import get_service
+    from ..cache import cache, result_cache_key
+    from ..metrics import stage_timer
+    from ..upload_stream import pair_digest, parse_image_upload
+except ImportError:
+    from services.model_service import get_service
+    from cache import cache, result_cache_key
+    from metrics import stage_timer
+    from upload_stream import pair_digest, parse_image_upload
+
+router = APIRouter()
+
+
+def _encode_mask(mask: np.ndarray) -> str:
+    """Change mask as a base64 grayscale PNG (255 = changed)."""
+    import cv2
+    ok, png = cv2.imencode('.png', mask * np.uint8(255))
+    if not ok:
+        raise RuntimeError("Failed to encode change mask")
+    return base64.b64encode(png.tobytes()).decode('utf-8')
+
+
+@router.post("/change-mask")
+async def change_mask(request: Request,
+                      min_region_cells: int = Query(1, ge=1, description="Smallest region reported, in grid cells"),
+                      max_regions: int = Query(50, ge=0, le=1000, description="Largest regions reported; 0 skips region extraction"),
+                      include_mask: bool = Query(True, description="Return the mask as a base64 PNG")) -> Dict[str, Any]:
+    """Multipart form: before, after (aligned JPEG/PNG/TIFF files of equal dimensions).
+
+    Segments both images and diffs them cell by cell: transition matrix
+    (from-class by to-class km²), change mask and connected change regions.
+    """
+    files, _ = await parse_image_upload(request, ("before", "after"))
+    before, after = files["before"], files["after"]
+    svc = get_service()
+    started = time.perf_counter()
+    pair_hash = pair_digest(before, after)
+    with svc.model_lease(pair_hash) as model_version:
+        def _run() -> Dict[str, Any]:
+            _, (before_image, after_image) = svc.preprocess_batch([before.data, after.data])
+            try:
+                result = svc.compute_change_map(before_image, after_image, model_version,
+                                                min_region_cells=min_region_cells, max_regions=max_regions)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            with stage_timer("serialize"):
+                mask = result.pop('mask')
+                result['mask_shape'] = list(mask.shape)
+                result['mask_png_b64'] = _encode_mask(mask)
+            return result
+
+        key = result_cache_key(
+            'change_mask', f"{pair_hash}:{min_region_cells}:{max_regions}", model_version
+        )
+        result = await cache.get_or_compute(key, lambda: run_in_threadpool(_run))
+    if not include_mask:
+        result = {k: v for k, v in result.items() if k != 'mask_png_b64'}
+    return {
+        'status': 'success',
+        'model_version': model_version,
+        'processing_time': round(time.perf_counter() - started, 4),
+        **result,
+    }
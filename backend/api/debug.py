@@ -0,0 +1,59 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict
+
+# Handle both relative and absolute imports
+try:
+    from ..tracing import trace_store, profiling_control
+except ImportError:
+    from tracing import trace_store, profiling_control
+
+router = APIRouter()
+
+
+class ProfilingRequest(BaseModel):
+    requests: int = Field(1, ge=0, le=1000, description="Profile the next N requests (0 disarms)")
+
+
+@router.get("/debug/traces")
+def list_traces() -> Dict[str, Any]:
+    """Recent slow or profiled requests, newest first."""
+    traces = list(trace_store.traces.values())[::-1]
+    return {
+        "status": "success",
+        "traces": [
+            {"trace_id": t.trace_id, "name": t.name, "started_at": t.started_at,
+             "duration_ms": round(t.duration_ms, 1), "profiled": t.profile}
+            for t in traces
+        ],
+    }
+
+
+@router.get("/debug/traces/{trace_id}")
+def get_trace(trace_id: str) -> Dict[str, Any]:
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found or already evicted")
+    return {"status": "success", **trace.to_dict()}
+
+
+@router.get("/debug/profile/{trace_id}", response_class=PlainTextResponse)
+def get_profile(trace_id: str) -> PlainTextResponse:
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    trace = trace_store.profiles.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile not found or already evicted")
+    return PlainTextResponse(trace.collapsed_stacks())
+
+
+@router.get("/debug/profiling")
+def profiling_status() -> Dict[str, Any]:
+    return {"status": "success", "armed_requests": profiling_control.remaining}
+
+
+@router.post("/debug/profiling")
+def arm_profiling(payload: ProfilingRequest) -> Dict[str, Any]:
+    """Profile the next N requests on this worker without a restart."""
+    profiling_control.arm(payload.requests)
+    return {"status": "success", "armed_requests": profiling_control.remaining}
@@ -1,62 +1,99 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, Any
+import os
+import tempfile
 
 # Handle both relative and absolute imports
 try:
     from ..services.model_service import get_service
+    from ..analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon, cached_reports
+    from ..upload_stream import pair_digest, parse_image_upload
 except ImportError:
     from services.model_service import get_service
+    from analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon, cached_reports
+    from upload_stream import pair_digest, parse_image_upload
 
-
-def _json_safe(obj):
-    import numpy as np
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    if isinstance(obj, (np.integer,)):
-        return int(obj)
-    if isinstance(obj, (np.floating,)):
-        return float(obj)
-    if isinstance(obj, (np.bool_,)):
-        return bool(obj)
-    if isinstance(obj, dict):
-        return {k: _json_safe(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_json_safe(v) for v in obj]
-    if isinstance(obj, tuple):
-        return tuple(_json_safe(v) for v in obj)
-    return obj
+from src.ml_modules.vector_export import (
+    geojson_chunks, geopackage_available, iter_change_features, reproject_features,
+    vector_export_available, write_geopackage,
+)
 
 router = APIRouter()
 
-class ExportRequest(BaseModel):
-    before_probs: List[float]
-    after_probs: List[float]
-    before_year: int
-    after_year: int
-    future_years: int = 5
+class ExportRequest(AnalysisInput):
     include_reports: bool = False
     report_detail: str = "Both"
 
 
 @router.post("/export")
-def export(payload: ExportRequest) -> Dict[str, Any]:
+async def export(payload: ExportRequest) -> Dict[str, Any]:
     svc = get_service()
-    analysis = svc.analyze_pair(
-        np.array(payload.before_probs),
-        np.array(payload.after_probs),
-        payload.before_year,
-        payload.after_year,
-        payload.future_years,
-    )
+    entry = await resolve_analysis(payload, svc)
+    analysis = analysis_for_horizon(entry, payload.future_years, svc)
     export_data = {
-        'before_year': payload.before_year,
-        'after_year': payload.after_year,
+        'analysis_id': entry['analysis_id'],
+        'before_year': entry['before_year'],
+        'after_year': entry['after_year'],
         **analysis,
     }
-    if isinstance(export_data.get('change_info', {}).get('probability_difference'), np.ndarray):
-        export_data['change_info']['probability_difference'] = export_data['change_info']['probability_difference'].tolist()
     if payload.include_reports:
-        export_data['reports'] = svc.generate_reports(analysis, payload.report_detail, payload.future_years)
-    return {"status": "success", "data": _json_safe(export_data)}
+        # Shares the cached generation with /report
+        export_data['reports'] = await cached_reports(
+            entry, analysis, payload.report_detail, payload.future_years, svc
+        )
+    return {"status": "success", "data": export_data}
+
+
+@router.post("/export/vector")
+async def export_vector(request: Request,
+                        output_format: str = Query('geojson', alias='format', description="geojson or gpkg"),
+                        simplify: float = Query(0.5, ge=0, le=10, description="Simplification tolerance in grid cells"),
+                        min_cells: int = Query(1, ge=1, description="Skip polygons smaller than this many cells")):
+    """Multipart form: before, after (aligned images; GeoTIFFs give CRS coordinates).
+
+    Change polygons with transition, area and impact attributes. GeoJSON is
+    streamed in WGS84 (source pixel coordinates for non-georeferenced
+    images); GeoPackage keeps the source CRS and is written feature by feature.
+    """
+    if output_format not in ('geojson', 'gpkg'):
+        raise HTTPException(status_code=422, detail="format must be 'geojson' or 'gpkg'")
+    if not vector_export_available() or (output_format == 'gpkg' and not geopackage_available()):
+        raise HTTPException(status_code=501, detail=f"{output_format} export is not available on this server")
+
+    files, _ = await parse_image_upload(request, ("before", "after"))
+    before, after = files["before"], files["after"]
+    svc = get_service()
+    with svc.model_lease(pair_digest(before, after)) as model_version:
+        def _layer():
+            _, (before_image, after_image) = svc.preprocess_batch([before.data, after.data])
+            return svc.change_layer(before_image, after_image, model_version)
+
+        try:
+            layer = await run_in_threadpool(_layer)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    features = iter_change_features(layer, simplify_tolerance=simplify, min_cells=min_cells)
+    headers = {'X-Model-Version': model_version}
+
+    if output_format == 'geojson':
+        headers['Content-Disposition'] = 'attachment; filename="changes.geojson"'
+        # Iterated lazily in the threadpool while the response streams
+        return StreamingResponse(
+            geojson_chunks(reproject_features(features, layer.crs)),
+            media_type='application/geo+json', headers=headers,
+        )
+
+    fd, path = tempfile.mkstemp(suffix='.gpkg')
+    os.close(fd)
+    os.remove(path)  # the GPKG driver creates the file itself
+    try:
+        await run_in_threadpool(write_geopackage, path, features, layer.crs)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return FileResponse(path, media_type='application/geopackage+sqlite3', filename='changes.gpkg',
+                        headers=headers, background=BackgroundTask(os.remove, path))
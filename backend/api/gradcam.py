@@ -1,38 +1,149 @@
-from fastapi import APIRouter, UploadFile, File
-from typing import Dict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from typing import Dict, Optional, Tuple
 import base64
 import io
+import json
+import time
+import uuid
+import numpy as np
 from PIL import Image
 
 # Handle both relative and absolute imports
 try:
     from ..services.model_service import get_service
+    from ..persistence import analysis_writer
+    from ..metrics import stage_timer, GRADCAM_ENCODE_SECONDS, GRADCAM_PAYLOAD_BYTES
+    from ..upload_stream import pair_digest, parse_image_upload
 except ImportError:
     from services.model_service import get_service
+    from persistence import analysis_writer
+    from metrics import stage_timer, GRADCAM_ENCODE_SECONDS, GRADCAM_PAYLOAD_BYTES
+    from upload_stream import pair_digest, parse_image_upload
 
 router = APIRouter()
 
+# format -> (file extension, media type)
+OUTPUT_FORMATS = {
+    'png': ('png', 'image/png'),
+    'webp': ('webp', 'image/webp'),
+    'jpeg': ('jpg', 'image/jpeg'),
+    # Raw activation map (7x7 float16) for client-side colorizing
+    'heatmap': ('f16', 'application/octet-stream'),
+}
+
+
+def encode_output(overlay: Optional[np.ndarray], heatmap: np.ndarray, fmt: str, quality: int) -> bytes:
+    """Encode one Grad-CAM result in the requested format."""
+    if fmt == 'heatmap':
+        return np.ascontiguousarray(heatmap, dtype='<f2').tobytes()
+    image = Image.fromarray(overlay.astype('uint8'))
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buf, format='WEBP', quality=quality, method=4)
+    elif fmt == 'jpeg':
+        image.save(buf, format='JPEG', quality=quality)
+    else:
+        image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _timed_encode(overlay, heatmap, fmt: str, quality: int) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    data = encode_output(overlay, heatmap, fmt, quality)
+    elapsed = time.perf_counter() - started
+    GRADCAM_ENCODE_SECONDS.observe(elapsed, format=fmt)
+    GRADCAM_PAYLOAD_BYTES.observe(len(data), format=fmt)
+    return data, elapsed
+
+
+def _multipart(meta: Dict, parts: Dict[str, Tuple[bytes, str]]) -> Response:
+    """multipart/mixed body: a JSON metadata part followed by raw binary parts."""
+    boundary = uuid.uuid4().hex
+    chunks = [
+        f'--{boundary}\r\nContent-Type: application/json\r\nContent-Disposition: inline; name="meta"\r\n\r\n'.encode(),
+        json.dumps(meta).encode(),
+        b'\r\n',
+    ]
+    for name, (data, media_type) in parts.items():
+        chunks.append(
+            f'--{boundary}\r\nContent-Type: {media_type}\r\n'
+            f'Content-Disposition: attachment; name="{name}"\r\nContent-Length: {len(data)}\r\n\r\n'.encode()
+        )
+        chunks.extend([data, b'\r\n'])
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return Response(b''.join(chunks), media_type=f'multipart/mixed; boundary={boundary}')
+
+
 @router.post("/gradcam")
-async def gradcam(before: UploadFile = File(...), after: UploadFile = File(...)) -> Dict:
+async def gradcam(request: Request,
+                  output_format: str = Query('png', alias='format', description="png, webp, jpeg, or heatmap (raw 7x7 float16)"),
+                  quality: int = Query(80, ge=1, le=100, description="webp/jpeg quality"),
+                  max_side: Optional[int] = Query(None, ge=16, le=8192, description="Downscale overlays to this long side"),
+                  transport: str = Query('json', description="json (base64 fields) or multipart (raw binary parts)")):
+    """Multipart form: before, after (JPEG/PNG/TIFF files).
+
+    Streamed and validated like /upload, and routed to the same model version
+    as /upload for the same pair.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if transport not in ('json', 'multipart'):
+        raise HTTPException(status_code=422, detail="transport must be 'json' or 'multipart'")
+
+    files, _ = await parse_image_upload(request, ("before", "after"))
+    before, after = files["before"], files["after"]
     svc = get_service()
-    before_bytes = await before.read()
-    after_bytes = await after.read()
+    pair_hash = pair_digest(before, after)
+    with svc.model_lease(pair_hash) as model_version:
+        def _run():
+            batch, (bi, ai) = svc.preprocess_batch([before.data, after.data])
+            bt, at = batch[0:1], batch[1:2]
+            outputs = {}
+            for name, tensor, image in (('before', bt, bi), ('after', at, ai)):
+                heatmap = svc.gradcam_heatmap(tensor, model_version)
+                overlay = None
+                if output_format != 'heatmap':
+                    overlay = svc.gradcam_overlay(tensor, image, model_version, heatmap=heatmap, max_side=max_side)
+                with stage_timer("serialize"):
+                    data, elapsed = _timed_encode(overlay, heatmap, output_format, quality)
+                shape = heatmap.shape if overlay is None else overlay.shape[:2]
+                outputs[name] = (data, elapsed, shape)
+            return outputs
 
-    bt, bi = svc.preprocess(before_bytes)
-    at, ai = svc.preprocess(after_bytes)
+        outputs = await run_in_threadpool(_run)
+    extension, media_type = OUTPUT_FORMATS[output_format]
 
-    before_overlay = svc.gradcam_overlay(bt, bi)
-    after_overlay = svc.gradcam_overlay(at, ai)
+    # Stored as files under the pair digest shared with /upload; Grad-CAM is not an analysis row
+    analysis_writer.save_gradcam(
+        pair_hash, {f'{model_version}_{name}.{extension}': data for name, (data, _, _) in outputs.items()},
+    )
 
-    # Encode to base64 PNG
-    def to_b64(img_arr):
-        image = Image.fromarray(img_arr.astype('uint8'))
-        buf = io.BytesIO()
-        image.save(buf, format='PNG')
-        return base64.b64encode(buf.getvalue()).decode('utf-8')
+    meta = {
+        'status': 'success',
+        'model_version': model_version,
+        'format': output_format,
+        'media_type': media_type,
+        'encoding': {
+            name: {'bytes': len(data), 'encode_ms': round(elapsed * 1000, 2), 'shape': list(shape)}
+            for name, (data, elapsed, shape) in outputs.items()
+        },
+    }
+    if output_format == 'heatmap':
+        meta['dtype'] = 'float16'
 
+    if transport == 'multipart':
+        return _multipart(meta, {name: (data, media_type) for name, (data, _, _) in outputs.items()})
+
+    if output_format == 'png':
+        # Original field names, kept for existing clients
+        return {
+            **meta,
+            'before_overlay_png_b64': base64.b64encode(outputs['before'][0]).decode('utf-8'),
+            'after_overlay_png_b64': base64.b64encode(outputs['after'][0]).decode('utf-8'),
+        }
     return {
-        'status': 'success',
-        'before_overlay_png_b64': to_b64(before_overlay),
-        'after_overlay_png_b64': to_b64(after_overlay),
+        **meta,
+        **{f'{name}_b64': base64.b64encode(data).decode('utf-8') for name, (data, _, _) in outputs.items()},
     }
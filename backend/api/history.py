@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Optional
+
+# Handle both relative and absolute imports
+try:
+    from ..database import get_db
+    from .. import history
+except ImportError:
+    from database import get_db
+    import history
+
+router = APIRouter()
+
+
+async def _paged(query, *args, **kwargs) -> Dict[str, Any]:
+    try:
+        page = await query(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", **page}
+
+
+@router.get("/history/recent")
+async def recent(limit: int = Query(20, ge=1, le=history.MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                 db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return await _paged(history.recent_analyses, db, limit=limit, cursor=cursor)
+
+
+@router.get("/history/session/{session_id}")
+async def by_session(session_id: str, limit: int = Query(20, ge=1, le=history.MAX_PAGE_SIZE),
+                     cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return await _paged(history.analyses_by_session, db, session_id, limit=limit, cursor=cursor)
+
+
+@router.get("/history/years")
+async def by_years(start_year: Optional[int] = None, end_year: Optional[int] = None,
+                   limit: int = Query(20, ge=1, le=history.MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                   db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return await _paged(history.analyses_by_years, db, start_year, end_year, limit=limit, cursor=cursor)
+
+
+@router.get("/history/transitions")
+async def by_transition(before_class: Optional[str] = None, after_class: Optional[str] = None,
+                        impact_type: Optional[str] = None,
+                        limit: int = Query(20, ge=1, le=history.MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                        db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return await _paged(history.analyses_by_transition, db, before_class, after_class, impact_type,
+                        limit=limit, cursor=cursor)
+
+
+@router.get("/history/{record_id}")
+async def record_detail(record_id: int, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    record = await history.get_analysis(db, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Analysis record not found")
+    return {"status": "success", "record": record}
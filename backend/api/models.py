@@ -0,0 +1,86 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Dict, Any, Optional
+import pathlib
+
+# Handle both relative and absolute imports
+try:
+    from ..services.model_service import ROOT, get_service
+    from ..config import settings
+except ImportError:
+    from services.model_service import ROOT, get_service
+    from config import settings
+
+router = APIRouter()
+
+
+class LoadModelRequest(BaseModel):
+    version: str
+    path: str = Field(..., description="Checkpoint file, relative to MODELS_DIR")
+    activate: bool = False  # promote to serving model once loaded
+
+
+class CandidateRequest(BaseModel):
+    version: Optional[str] = None
+    share: float = Field(0.0, ge=0.0, le=1.0, description="Fraction of traffic routed to the candidate")
+
+
+def _checkpoint_path(path: str) -> str:
+    """Resolve ``path`` inside ``MODELS_DIR``; anything outside it is rejected."""
+    models_dir = pathlib.Path(settings.MODELS_DIR)
+    if not models_dir.is_absolute():
+        models_dir = ROOT / models_dir
+    models_dir = models_dir.resolve()
+    checkpoint = (models_dir / path).resolve()
+    if not checkpoint.is_relative_to(models_dir):
+        raise HTTPException(status_code=422, detail="path must be inside the models directory")
+    if not checkpoint.is_file():
+        raise HTTPException(status_code=404, detail=f"No checkpoint at {path}")
+    return str(checkpoint)
+
+
+@router.get("/models")
+def list_models() -> Dict[str, Any]:
+    svc = get_service()
+    return {"status": "success", **svc.registry.status()}
+
+
+@router.post("/models/load")
+def load_model(payload: LoadModelRequest) -> Dict[str, Any]:
+    """Start loading a checkpoint in the background; serving continues on the current model."""
+    path = _checkpoint_path(payload.path)
+    svc = get_service()
+    on_loaded = svc.registry.activate if payload.activate else None
+    svc.registry.load_async(payload.version, path, on_loaded=on_loaded)
+    return {"status": "loading", "version": payload.version}
+
+
+@router.post("/models/{version}/activate")
+def activate_model(version: str) -> Dict[str, Any]:
+    svc = get_service()
+    try:
+        svc.registry.activate(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", "active_version": version}
+
+
+@router.post("/models/candidate")
+def set_candidate(payload: CandidateRequest) -> Dict[str, Any]:
+    svc = get_service()
+    try:
+        svc.registry.set_candidate(payload.version, payload.share)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success", **svc.registry.status()}
+
+
+@router.delete("/models/{version}")
+def unload_model(version: str) -> Dict[str, Any]:
+    svc = get_service()
+    try:
+        dropped = svc.registry.unload(version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Versions still leased by in-flight requests are dropped when the last one finishes
+    return {"status": "success", "unloaded": version, "retiring": not dropped}
@@ -1,50 +1,24 @@
 from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import numpy as np
+from typing import Dict, Any
 
 # Handle both relative and absolute imports
 try:
     from ..services.model_service import get_service
+    from ..analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon
 except ImportError:
     from services.model_service import get_service
+    from analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon
 
 router = APIRouter()
 
-class PredictRequest(BaseModel):
-    before_probs: List[float]
-    after_probs: List[float]
-    before_year: int
-    after_year: int
-    future_years: int = 5
+class PredictRequest(AnalysisInput):
+    pass
 
 
 @router.post("/predict")
-def predict(payload: PredictRequest) -> Dict[str, Any]:
+async def predict(payload: PredictRequest) -> Dict[str, Any]:
     svc = get_service()
-    analysis = svc.analyze_pair(
-        np.array(payload.before_probs),
-        np.array(payload.after_probs),
-        payload.before_year,
-        payload.after_year,
-        payload.future_years,
-    )
-    # Ensure serializable
-    def _json_safe(obj):
-        import numpy as np
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        if isinstance(obj, (np.integer,)):
-            return int(obj)
-        if isinstance(obj, (np.floating,)):
-            return float(obj)
-        if isinstance(obj, (np.bool_,)):
-            return bool(obj)
-        if isinstance(obj, dict):
-            return {k: _json_safe(v) for k, v in obj.items()}
-        if isinstance(obj, list):
-            return [_json_safe(v) for v in obj]
-        if isinstance(obj, tuple):
-            return tuple(_json_safe(v) for v in obj)
-        return obj
-    return {"status": "success", "future_trends": _json_safe(analysis['future_trends'])}
+    entry = await resolve_analysis(payload, svc)
+    # Only the projection depends on the horizon; the stored analysis is not recomputed
+    analysis = analysis_for_horizon(entry, payload.future_years, svc)
+    return {"status": "success", "analysis_id": entry["analysis_id"], "future_trends": analysis['future_trends']}
@@ -1,38 +1,29 @@
 from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import numpy as np
+from typing import Dict, Any
 import os
 
 # Handle both relative and absolute imports
 try:
     from ..services.model_service import get_service
+    from ..analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon, cached_reports
 except ImportError:
     from services.model_service import get_service
+    from analysis_store import AnalysisInput, resolve_analysis, analysis_for_horizon, cached_reports
 
 router = APIRouter()
 
-class ReportRequest(BaseModel):
-    before_probs: List[float]
-    after_probs: List[float]
-    before_year: int
-    after_year: int
-    future_years: int = 5
+class ReportRequest(AnalysisInput):
     detail: str = "Both"  # Summary | Detailed | Both
 
 
 @router.post("/report")
-def report(payload: ReportRequest) -> Dict[str, Any]:
+async def report(payload: ReportRequest) -> Dict[str, Any]:
     svc = get_service()
-    analysis = svc.analyze_pair(
-        np.array(payload.before_probs),
-        np.array(payload.after_probs),
-        payload.before_year,
-        payload.after_year,
-        payload.future_years,
-    )
-    reports = svc.generate_reports(analysis, payload.detail, payload.future_years)
-    return {"status": "success", **reports}
+    entry = await resolve_analysis(payload, svc)
+    analysis = analysis_for_horizon(entry, payload.future_years, svc)
+    # LLM reports are expensive: one generation per (analysis, detail, horizon)
+    reports = await cached_reports(entry, analysis, payload.detail, payload.future_years, svc)
+    return {"status": "success", "analysis_id": entry["analysis_id"], **reports}
 
 
 @router.get("/report/status")
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Dict, Optional
+import time
+
+# Handle both relative and absolute imports
+try:
+    from ..services.model_service import get_service
+    from ..services.embedding_index import get_embedding_index, upload_entry_id
+    from ..metrics import stage_timer
+    from ..upload_stream import parse_image_upload
+    from ..config import settings
+except ImportError:
+    from services.model_service import get_service
+    from services.embedding_index import get_embedding_index, upload_entry_id
+    from metrics import stage_timer
+    from upload_stream import parse_image_upload
+    from config import settings
+
+router = APIRouter()
+
+
+@router.post("/similar")
+async def find_similar(request: Request,
+                       k: int = Query(10, ge=1, description="Number of neighbours"),
+                       source: Optional[str] = Query(None, description="Only search entries of this source, e.g. eurosat or upload"),
+                       session_id: Optional[str] = Header(None, alias="X-Session-Id")) -> Dict[str, Any]:
+    """Multipart form: image (JPEG/PNG/TIFF file).
+
+    Embeds the image with the active model (same forward pass as its
+    classification) and returns the most similar tiles in the embedding index
+    by cosine similarity. Only entries embedded by the same model version are
+    compared, and uploads are only visible to the session that made them.
+    """
+    if k > settings.SIMILAR_MAX_K:
+        raise HTTPException(status_code=422, detail=f"k must be at most {settings.SIMILAR_MAX_K}")
+    files, _ = await parse_image_upload(request, ("image",))
+    image = files["image"]
+    svc = get_service()
+    with svc.model_lease() as model_version:
+        index = get_embedding_index()
+        started = time.perf_counter()
+        if not index.count(model_version):
+            raise HTTPException(
+                status_code=503,
+                detail=f"Embedding index has no entries for model {model_version}; run scripts/build_embedding_index.py",
+            )
+
+        def _run() -> Dict[str, Any]:
+            batch, _ = svc.preprocess_batch([image.data])
+            (prediction,), embeddings = svc.classify_and_embed(batch, model_version)
+            # The query itself is in the index if this session uploaded it before
+            exclude = (upload_entry_id(session_id, image.sha256),) if session_id else ()
+            with stage_timer("similarity_search"):
+                results = index.search(embeddings[0], k, model_version=model_version, source=source,
+                                       session=session_id, exclude=exclude)
+            return {'pred_class': prediction[0], 'confidence': prediction[1], 'results': results}
+
+        result = await run_in_threadpool(_run)
+    return {
+        'status': 'success',
+        'model_version': model_version,
+        'index_size': index.count(model_version),
+        'processing_time': round(time.perf_counter() - started, 4),
+        **result,
+    }
@@ -0,0 +1,156 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List
+import hashlib
+import time
+
+# Handle both relative and absolute imports
+try:
+    from ..services.model_service import get_service
+    from ..services import time_series
+    from ..cache import LockTimeout, cache, series_cache_key
+    from ..config import settings
+    from ..upload_stream import StreamedFile, parse_image_stack
+except ImportError:
+    from services.model_service import get_service
+    from services import time_series
+    from cache import LockTimeout, cache, series_cache_key
+    from config import settings
+    from upload_stream import StreamedFile, parse_image_stack
+
+router = APIRouter()
+
+
+def _dates_field(fields: Dict[str, str], count: int) -> List[tuple]:
+    raw = fields.get("dates")
+    if raw is None:
+        raise HTTPException(status_code=422, detail="Missing form field 'dates'")
+    values = [v for v in raw.replace("\n", ",").split(",") if v.strip()]
+    if len(values) != count:
+        raise HTTPException(status_code=422, detail=f"'dates' has {len(values)} entries for {count} images")
+    try:
+        parsed = [time_series.parse_observation_date(v) for v in values]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="'dates' entries must be YYYY or YYYY-MM-DD")
+    if len({label for label, _ in parsed}) != len(parsed):
+        raise HTTPException(status_code=422, detail="'dates' contains duplicates")
+    return parsed
+
+
+async def _classify(files: List[StreamedFile], dates: List[tuple], model_version: str) -> List[Dict[str, Any]]:
+    """Decode and classify every image of the request in one forward pass."""
+    svc = get_service()
+
+    def _run():
+        batch, _ = svc.preprocess_batch([f.data for f in files])
+        predictions = svc.predict_batch(batch, model_version)
+        return [
+            time_series.make_observation(label, t, f.sha256, pred_class, confidence, probs)
+            for f, (label, t), (pred_class, confidence, probs) in zip(files, dates, predictions)
+        ]
+
+    try:
+        svc.registry.acquire(version=model_version)
+    except KeyError:
+        # Steps are only comparable within one model, so the series cannot move to another
+        raise HTTPException(
+            status_code=410,
+            detail=f"Model version '{model_version}' of this series is no longer loaded; create a new series",
+        )
+    try:
+        return await run_in_threadpool(_run)
+    finally:
+        svc.registry.release(model_version)
+
+
+async def _update(state: Dict[str, Any], files: List[StreamedFile], fields: Dict[str, str],
+                  started: float) -> Dict[str, Any]:
+    dates = _dates_field(fields, len(files))
+    if len(state['observations']) + len(files) > settings.TIMESERIES_MAX_OBSERVATIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A series holds at most {settings.TIMESERIES_MAX_OBSERVATIONS} observations",
+        )
+    # Re-sent (date, image) pairs are skipped before inference
+    known = {(obs['date'], obs['digest']) for obs in state['observations']}
+    pending = [(f, d) for f, d in zip(files, dates) if (d[0], f.sha256) not in known]
+    recomputed = 0
+    if pending:
+        observations = await _classify([f for f, _ in pending], [d for _, d in pending], state['model_version'])
+        recomputed = time_series.merge_observations(state, observations, get_service().change_detector)
+        await cache.set(series_cache_key(state['series_id']), state, ttl=settings.TIMESERIES_TTL)
+    return _response(state, classified=len(pending), recomputed_steps=recomputed, started=started)
+
+
+def _response(state: Dict[str, Any], started: float, **counts: int) -> Dict[str, Any]:
+    return {
+        'status': 'success',
+        'series_id': state['series_id'],
+        'model_version': state['model_version'],
+        **counts,
+        'processing_time': round(time.perf_counter() - started, 4),
+        'observations': [
+            {k: obs[k] for k in ('date', 'pred_class', 'confidence', 'probs')} for obs in state['observations']
+        ],
+        'steps': state['steps'],
+        'summary': time_series.summarize(state),
+    }
+
+
+async def _load(series_id: str, local: bool = True) -> Dict[str, Any]:
+    state = await cache.get(series_cache_key(series_id), local=local)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired series '{series_id}'")
+    return state
+
+
+@asynccontextmanager
+async def _series_lock(series_id: str) -> AsyncIterator[None]:
+    """Serialize creates and appends of one series across requests and workers."""
+    try:
+        async with cache.locked(series_cache_key(series_id)):
+            yield
+    except LockTimeout:
+        raise HTTPException(status_code=503, detail=f"Series '{series_id}' is busy; retry later")
+
+
+@router.post("/timeseries")
+async def create_series(request: Request) -> Dict[str, Any]:
+    """Multipart form: ``images`` (repeated, JPEG/PNG/TIFF) and ``dates`` (comma-separated
+    YYYY or YYYY-MM-DD, one per image, any order). Optional ``series_id``.
+    """
+    started = time.perf_counter()
+    files, fields = await parse_image_stack(request, "images", settings.TIMESERIES_MAX_OBSERVATIONS)
+    series_id = fields.get("series_id") or hashlib.sha256(
+        ":".join(f.sha256 for f in files).encode()
+    ).hexdigest()[:32]
+    async with _series_lock(series_id):
+        if await cache.get(series_cache_key(series_id), local=False) is not None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Series '{series_id}' already exists; append to it or choose another series_id",
+            )
+        # The whole series is served by one model so steps stay comparable
+        state = time_series.new_series(series_id, get_service().select_model(series_id))
+        return await _update(state, files, fields, started)
+
+
+@router.post("/timeseries/{series_id}/append")
+async def append_to_series(series_id: str, request: Request) -> Dict[str, Any]:
+    """Add dated images to a series; only the new images are classified and only
+    the steps from the earliest new date onward are recomputed.
+    """
+    started = time.perf_counter()
+    await _load(series_id)
+    files, fields = await parse_image_stack(request, "images", settings.TIMESERIES_MAX_OBSERVATIONS)
+    # Read-modify-write of the stored state: reload it under the lock so concurrent appends all land
+    async with _series_lock(series_id):
+        state = await _load(series_id, local=False)
+        return await _update(state, files, fields, started)
+
+
+@router.get("/timeseries/{series_id}")
+async def get_series(series_id: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    return _response(await _load(series_id), started=started)
@@ -1,12 +1,28 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from typing import Dict
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Optional
+import time
 import numpy as np
 
 # Handle both relative and absolute imports
 try:
     from ..services.model_service import get_service, get_class_names
+    from ..services.embedding_index import get_embedding_index, upload_entry_id
+    from ..persistence import analysis_writer
+    from ..cache import cache, result_cache_key
+    from ..metrics import stage_timer
+    from ..upload_stream import pair_digest, parse_image_upload
+    from ..config import settings
+    from ..analysis_store import DEFAULT_FUTURE_YEARS, make_analysis_id, make_entry, save_analysis
 except ImportError:
     from services.model_service import get_service, get_class_names
+    from services.embedding_index import get_embedding_index, upload_entry_id
+    from persistence import analysis_writer
+    from cache import cache, result_cache_key
+    from metrics import stage_timer
+    from upload_stream import pair_digest, parse_image_upload
+    from config import settings
+    from analysis_store import DEFAULT_FUTURE_YEARS, make_analysis_id, make_entry, save_analysis
 
 
 def _json_safe(obj):
@@ -30,43 +46,144 @@ def _json_safe(obj):
 
 router = APIRouter()
 
+def _year_field(fields: Dict[str, str], name: str) -> int:
+    try:
+        return int(fields[name])
+    except KeyError:
+        raise HTTPException(status_code=422, detail=f"Missing form field '{name}'")
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Form field '{name}' must be an integer")
+
+
+def _index_upload(session_id: str, model_version: str, uploads, embeddings) -> None:
+    """Make a session's uploads searchable by /similar (for that session only).
+
+    Entries are tagged with the model version so searches never mix feature spaces.
+    """
+    get_embedding_index().add(
+        [upload_entry_id(session_id, image.sha256) for image, _, _ in uploads],
+        np.asarray(embeddings, dtype=np.float32),
+        [{'source': 'upload', 'model_version': model_version, 'session': session_id,
+          'filename': image.filename, 'year': year, 'pred_class': pred_class}
+         for image, year, pred_class in uploads],
+    )
+
+
 @router.post("/upload")
-async def upload_images(before: UploadFile = File(...), after: UploadFile = File(...), before_year: int = Form(...), after_year: int = Form(...)) -> Dict:
+async def upload_images(request: Request, background_tasks: BackgroundTasks,
+                        session_id: Optional[str] = Header(None, alias="X-Session-Id")) -> Dict:
+    """Multipart form: before, after (JPEG/PNG/TIFF files), before_year, after_year,
+    optional area_mode (``estimate`` or ``dense`` per-pixel segmentation).
+
+    The body is streamed and validated part by part (size, type, dimensions)
+    rather than buffered by the framework first.
+    """
+    # Validation errors (413/415/422) are rejected before any analysis is recorded
+    files, fields = await parse_image_upload(request, ("before", "after"))
+    before, after = files["before"], files["after"]
+    before_year = _year_field(fields, "before_year")
+    after_year = _year_field(fields, "after_year")
+    area_mode = fields.get("area_mode", settings.AREA_MODE)
+    if area_mode not in ("estimate", "dense"):
+        raise HTTPException(status_code=422, detail="area_mode must be 'estimate' or 'dense'")
+
     svc = get_service()
-    before_bytes = await before.read()
-    after_bytes = await after.read()
+    started = time.perf_counter()
+    model_version = None
+    try:
+        before_bytes = before.data
+        after_bytes = after.data
 
-    before_tensor, before_image = svc.preprocess(before_bytes)
-    after_tensor, after_image = svc.preprocess(after_bytes)
+        # Both images of a pair are served by the same model; routing is sticky per content.
+        # Digests were computed while streaming.
+        pair_hash = pair_digest(before, after)
+        with svc.model_lease(pair_hash) as model_version:
+            def _run() -> Dict:
+                # Both images go through one decode/normalize batch and one forward pass
+                batch, (before_image, after_image) = svc.preprocess_batch([before_bytes, after_bytes])
+                (before_prediction, after_prediction), embeddings = svc.classify_and_embed(batch, model_version)
+                before_class, before_conf, before_probs = before_prediction
+                after_class, after_conf, after_probs = after_prediction
 
-    before_class, before_conf, before_probs = svc.predict(before_tensor)
-    after_class, after_conf, after_probs = svc.predict(after_tensor)
+                analysis = svc.analyze_pair(before_probs, after_probs, before_year, after_year,
+                                            future_years=DEFAULT_FUTURE_YEARS)
+                # Compute comprehensive area changes for all land cover types
+                if area_mode == "dense":
+                    # Measured from per-pixel class maps of the decoded buffers
+                    area_changes = svc.compute_dense_area_changes(before_image, after_image, model_version)
+                else:
+                    # Reuses the decoded buffers and the predictions above (no second decode or forward pass)
+                    area_changes = svc.compute_area_changes(
+                        before_image, after_image, model_version=model_version,
+                        before_prediction=before_prediction, after_prediction=after_prediction,
+                    )
+                with stage_timer("serialize"):
+                    result = _json_safe({
+                        'before': {'pred_class': before_class, 'confidence': before_conf, 'probs': before_probs},
+                        'after': {'pred_class': after_class, 'confidence': after_conf, 'probs': after_probs},
+                        'analysis': analysis,
+                        'area_changes': area_changes,
+                    })
+                if settings.EMBED_UPLOADS:
+                    # Cached with the result: every session uploading this pair indexes its own entries
+                    result['embeddings'] = embeddings.astype(np.float16)
+                return result
 
-    analysis = svc.analyze_pair(before_probs, after_probs, before_year, after_year, future_years=5)
-    # Compute comprehensive area changes for all land cover types
-    area_changes = svc.compute_area_changes(before_image, after_image, before_tensor, after_tensor)
+            # Identical pairs requested concurrently run inference (and the LLM) only once
+            key = result_cache_key('upload', f"{pair_hash}:{before_year}:{after_year}:{area_mode}", model_version)
+            result = await cache.get_or_compute(key, lambda: run_in_threadpool(_run))
+            if settings.EMBED_UPLOADS and session_id and result.get('embeddings') is not None:
+                await run_in_threadpool(
+                    _index_upload, session_id, model_version,
+                    [(before, before_year, result['before']['pred_class']),
+                     (after, after_year, result['after']['pred_class'])],
+                    result['embeddings'],
+                )
+                # The .npz write happens after the response is sent
+                background_tasks.add_task(get_embedding_index().maybe_save)
+    except Exception as e:
+        analysis_writer.record(
+            session_id=session_id, before_year=before_year, after_year=after_year,
+            processing_time=time.perf_counter() - started, model_version=model_version,
+            status='failed', error_message=str(e),
+        )
+        raise
+
+    # Handle for /report, /export, /predict and /recommend, which reuse this analysis
+    analysis_id = make_analysis_id('upload', pair_hash, before_year, after_year, model_version)
+    await save_analysis(make_entry(
+        analysis_id, result['analysis'], before_year, after_year, DEFAULT_FUTURE_YEARS, model_version,
+        result['before']['probs'], result['after']['probs'],
+    ))
 
     resp = {
         'status': 'success',
+        'analysis_id': analysis_id,
+        'model_version': model_version,
     'class_names': get_class_names(),
         'before': {
             'filename': before.filename,
             'year': before_year,
-            'pred_class': before_class,
-            'confidence': before_conf,
-            'probs': before_probs.tolist(),
+            **result['before'],
         },
         'after': {
             'filename': after.filename,
             'year': after_year,
-            'pred_class': after_class,
-            'confidence': after_conf,
-            'probs': after_probs.tolist(),
+            **result['after'],
         },
-    'analysis': analysis,
-        'area_changes': area_changes,
+    'analysis': result['analysis'],
+        'area_changes': result['area_changes'],
     }
-    # Defensive: ensure analysis payload is JSON-serializable
-    if isinstance(resp['analysis'].get('change_info', {}).get('probability_difference'), np.ndarray):
-        resp['analysis']['change_info']['probability_difference'] = resp['analysis']['change_info']['probability_difference'].tolist()
-    return _json_safe(resp)
+
+    # Write-behind: queued in memory, inserted in batches off the request path
+    analysis_writer.record(
+        session_id=session_id, analysis_id=analysis_id, before_year=before_year, after_year=after_year,
+        processing_time=time.perf_counter() - started, model_version=model_version,
+        before_class=resp['before']['pred_class'], after_class=resp['after']['pred_class'],
+        impact_type=resp['analysis']['environmental_impact'].get('impact_type'),
+        before_probs=resp['before']['probs'], after_probs=resp['after']['probs'],
+        analysis_results={'analysis': resp['analysis'], 'area_changes': resp['area_changes'],
+                          'future_years': DEFAULT_FUTURE_YEARS},
+        status='completed',
+    )
+    return resp
@@ -16,6 +16,22 @@ try:
     from .api.recommend import router as recommend_router
     from .api.report import router as report_router
     from .api.export import router as export_router
+    from .api.models import router as models_router
+    from .api.history import router as history_router
+    from .api.metrics import router as metrics_router
+    from .api.debug import router as debug_router
+    from .config import settings
+    from .api.timeseries import router as timeseries_router
+    from .api.change_mask import router as change_mask_router
+    from .api.aoi import router as aoi_router
+    from .services.tile_store import close_tile_store
+    from .api.similar import router as similar_router
+    from .services.embedding_index import close_embedding_index
+    from .database import init_db, close_db, get_pool_stats
+    from .persistence import init_writer, close_writer
+    from .cache import init_cache, close_cache
+    from .metrics import MetricsMiddleware, init_metrics, close_metrics
+    from .tracing import TracingMiddleware, add_trace_context
 except ImportError:  # fallback when executed from backend directory
     from api.upload import router as upload_router
     from api.analyze import router as analyze_router
@@ -24,7 +40,27 @@ except ImportError:  # fallback when executed from backend directory
     from api.recommend import router as recommend_router
     from api.report import router as report_router
     from api.export import router as export_router
+    from api.models import router as models_router
+    from api.history import router as history_router
+    from api.metrics import router as metrics_router
+    from api.debug import router as debug_router
+    from config import settings
+    from api.timeseries import router as timeseries_router
+    from api.change_mask import router as change_mask_router
+    from api.aoi import router as aoi_router
+    from services.tile_store import close_tile_store
+    from api.similar import router as similar_router
+    from services.embedding_index import close_embedding_index
+    from database import init_db, close_db, get_pool_stats
+    from persistence import init_writer, close_writer
+    from cache import init_cache, close_cache
+    from metrics import MetricsMiddleware, init_metrics, close_metrics
+    from tracing import TracingMiddleware, add_trace_context
 from fastapi.middleware.cors import CORSMiddleware
+import structlog
+
+# Carry trace/span ids into every log line emitted while serving a request
+structlog.configure(processors=[add_trace_context, *structlog.get_config()["processors"]])
 
 app = FastAPI()
 
@@ -35,6 +71,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 app.include_router(upload_router)
 app.include_router(analyze_router)
@@ -43,9 +81,46 @@ app.include_router(predict_router)
 app.include_router(recommend_router)
 app.include_router(report_router)
 app.include_router(export_router)
+app.include_router(timeseries_router)
+app.include_router(change_mask_router)
+app.include_router(aoi_router)
+app.include_router(similar_router)
+app.include_router(history_router)
+app.include_router(metrics_router)
+if settings.ENVIRONMENT != "production":
+    # Trace lookup, collapsed stacks and the profiling toggle expose internals;
+    # the model control plane can replace the serving model
+    app.include_router(debug_router)
+    app.include_router(models_router)
+
+@app.on_event("startup")
+async def startup():
+    await init_db()
+    await init_writer()
+    # Degrades to the in-process tier if Redis is unreachable
+    await init_cache()
+    await init_metrics()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_metrics()
+    # Flush buffered analysis records before the engine goes away
+    await close_writer()
+    await close_db()
+    await close_cache()
+    close_tile_store()
+    # Persist embeddings added by uploads since the index was loaded
+    close_embedding_index()
+
 
 @app.get("/")
 def root():
     return {"message": "Satellite Change Detection API is running."}
 
+@app.get("/health/db")
+def database_health():
+    """Connection pool occupancy and checkout wait times."""
+    return {"status": "healthy", "pool": get_pool_stats()}
+
 # If running directly: uvicorn backend.app:app --reload --port 8000
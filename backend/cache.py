@@ -1,113 +1,378 @@
 """
 Redis cache configuration and utilities.
 """
+import asyncio
 import json
+import math
 import pickle
-from typing import Any, Optional, Union
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Union
 import redis.asyncio as redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+try:
+    from redis.exceptions import MaxConnectionsError
+except ImportError:  # older redis-py raises a plain ConnectionError("Too many connections")
+    MaxConnectionsError = None
 import structlog
 
 from .config import settings
+from . import cache_codecs
+from .local_cache import LocalCache
+from .tracing import traced
 
 logger = structlog.get_logger()
 
+# Keys per MGET/pipeline/UNLINK round-trip; keeps individual commands small
+BULK_CHUNK_SIZE = 500
+
+def _chunks(items: List[Any], size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Compare-and-delete so a holder never releases a lock that expired and was re-acquired
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class LockTimeout(TimeoutError):
+    """``CacheManager.locked`` could not take the lock in time."""
+
+
+# Returned by get_or_compute helpers when no value could be obtained from the cache
+_MISSING = object()
+_LOCAL_LOCK = "local"
+
+# Polling interval bounds while waiting for another worker's fill (seconds)
+_WAIT_POLL_MIN = 0.05
+_WAIT_POLL_MAX = 1.0
+
+
+def _pool_exhausted(e: Exception) -> bool:
+    """True for "Too many connections": the server is fine, only this process is busy."""
+    if MaxConnectionsError is not None and isinstance(e, MaxConnectionsError):
+        return True
+    # BlockingConnectionPool reports a wait that exceeded REDIS_POOL_TIMEOUT the same way
+    return isinstance(e, RedisConnectionError) and str(e) in ("Too many connections", "No connection available.")
+
 class CacheManager:
-    """Redis cache manager for the application."""
+    """Two-tier cache: an in-process LRU in front of Redis.
+
+    Reads hit the local tier first and fall back to Redis; writes go to both.
+    When Redis is unreachable the manager keeps serving from the local tier
+    and retries the connection in the background. Writes and deletes are
+    published on ``settings.CACHE_INVALIDATION_CHANNEL`` so other workers drop
+    their local copies.
+    """
     
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
+        self.local = LocalCache(
+            max_entries=settings.LOCAL_CACHE_MAX_ENTRIES,
+            max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+            ttl=settings.LOCAL_CACHE_TTL,
+        )
+        self.instance_id = uuid.uuid4().hex
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+        self._pubsub = None
+        self._listener_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        # Clients and subscribers dropped after a failure, closed before reconnecting
+        self._detached: List[Any] = []
+        # In-process single-flight: one computation per key per worker
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Cross-worker waiters, woken by the shared subscriber on ``cache:ready:<key>``
+        self._fill_waiters: Dict[str, List[asyncio.Future]] = {}
+        # Per-key asyncio locks behind ``locked`` with their user counts
+        self._key_locks: Dict[str, List[Any]] = {}
+        self.stampede_waits = 0
+        self.early_refreshes = 0
     
     async def init(self):
-        """Initialize Redis connection."""
-        try:
-            self.redis_client = redis.from_url(
-                settings.REDIS_URL,
-                encoding="utf-8",
-                decode_responses=False,  # We'll handle encoding ourselves
-                max_connections=20,
-                socket_keepalive=True,
-                socket_keepalive_options={}
-            )
-            # Test connection
-            await self.redis_client.ping()
+        """Initialize Redis connection; on failure keep running on the local tier."""
+        try:
+            await self._connect()
             logger.info("Redis cache initialized successfully")
         except Exception as e:
-            logger.error("Redis cache initialization failed", exc_info=e)
+            logger.warning("Redis unavailable, serving from local cache tier", exc_info=e)
+            self._detach()
+            self._schedule_reconnect()
+    
+    async def _connect(self):
+        # Bursts queue for a free connection instead of failing with "Too many connections"
+        pool = redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=False,  # We'll handle encoding ourselves
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_keepalive=True,
+            socket_keepalive_options={}
+        )
+        client = redis.Redis(connection_pool=pool)
+        client.auto_close_connection_pool = True
+        # Test connection
+        try:
+            await client.ping()
+        except Exception:
+            await client.close()
             raise
+        self.redis_client = client
+        # One subscriber connection per process: invalidations plus every fill notification
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        if settings.CACHE_PUBSUB_INVALIDATION:
+            await self._pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+        await self._pubsub.psubscribe(ready_channel("*"))
+        self._listener_task = asyncio.create_task(self._listen())
+    
+    def _schedule_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+    
+    async def _reconnect_loop(self):
+        while self.redis_client is None:
+            await self._close_detached()
+            await asyncio.sleep(settings.REDIS_RECONNECT_INTERVAL)
+            try:
+                await self._connect()
+                # Entries cached while disconnected may have missed invalidations
+                self.local.clear()
+                logger.info("Redis cache reconnected")
+            except Exception:
+                self._detach()
+    
+    def _redis_failed(self, action: str, e: Exception, **kw):
+        self.redis_errors += 1
+        logger.error(f"Cache {action} error", exc_info=e, **kw)
+        if _pool_exhausted(e):
+            return  # transient local back-pressure, not a dead server
+        if isinstance(e, (ConnectionError, OSError, RedisConnectionError, RedisTimeoutError)):
+            # Drop to local-only mode until the background reconnect succeeds
+            self._detach()
+            self._schedule_reconnect()
+    
+    def _detach(self):
+        """Stop using the current client, subscriber and listener.
+
+        The listener is cancelled now; the client and subscriber are closed by
+        the reconnect loop (or ``close``) before a new connection is made, so
+        reconnects never stack subscribers or duplicate invalidation handling.
+        """
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+        if self.redis_client is not None or self._pubsub is not None:
+            self._detached.append((self._pubsub, self.redis_client))
+        self.redis_client, self._pubsub, self._listener_task = None, None, None
+    
+    async def _close_detached(self):
+        while self._detached:
+            for resource in self._detached.pop():
+                if resource is None:
+                    continue
+                try:
+                    await resource.close()
+                except Exception:
+                    pass
+    
+    async def _listen(self):
+        prefix = f"{self.instance_id}|".encode("utf-8")
+        ready_prefix = ready_channel("")
+        try:
+            while self._pubsub is not None:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if not message:
+                    continue
+                if message.get("type") == "pmessage":
+                    channel = message["channel"]
+                    channel = channel.decode("utf-8") if isinstance(channel, bytes) else channel
+                    self._wake_fill_waiters(channel[len(ready_prefix):])
+                    continue
+                if message.get("type") != "message":
+                    continue
+                data = message["data"]
+                if data.startswith(prefix):
+                    continue  # our own write
+                _, _, key = data.decode("utf-8").partition("|")
+                self.local.delete(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Cache subscriber stopped", exc_info=e)
+    
+    def _wake_fill_waiters(self, key: str):
+        for waiter in self._fill_waiters.pop(key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+    
+    def _invalidation(self, key: str) -> str:
+        return f"{self.instance_id}|{key}"
+    
+    async def _publish_invalidation(self, *keys: str):
+        if not self.redis_client or not settings.CACHE_PUBSUB_INVALIDATION or not keys:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, self._invalidation(key))
+        await pipe.execute()
     
     async def close(self):
         """Close Redis connection."""
+        for task in (self._listener_task, self._reconnect_task):
+            if task:
+                task.cancel()
+        if self._pubsub is not None:
+            pubsub, self._pubsub = self._pubsub, None
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+        await self._close_detached()
         if self.redis_client:
             await self.redis_client.close()
             logger.info("Redis cache connection closed")
     
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters per tier."""
+        return {
+            "redis_available": self.redis_client is not None,
+            "local": self.local.stats(),
+            "redis": {
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "errors": self.redis_errors,
+            },
+            "single_flight": {
+                "waits": self.stampede_waits,
+                "early_refreshes": self.early_refreshes,
+                "inflight": len(self._inflight),
+            },
+        }
+    
+    @staticmethod
+    def _serialize(value: Any, serialize: Optional[str]) -> Union[str, bytes]:
+        """Encode with a tagged codec (see ``cache_codecs``); defaults to ``settings.CACHE_CODEC``."""
+        serialize = serialize or settings.CACHE_CODEC
+        if serialize == "pickle":
+            # Legacy opt-in only; tagged codecs cover numpy values without pickle
+            return pickle.dumps(value)
+        return cache_codecs.encode(
+            value,
+            codec=serialize,
+            compression=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESSION_THRESHOLD,
+            level=settings.CACHE_COMPRESSION_LEVEL,
+        )
+    
+    @staticmethod
+    def _deserialize(value: bytes, serialize: Optional[str]) -> Any:
+        """Decode by the value's own codec tag; untagged legacy values use ``serialize``."""
+        if cache_codecs.is_tagged(value):
+            return cache_codecs.decode(value)
+        if serialize == "pickle":
+            return pickle.loads(value)
+        if serialize in (None, "json", "msgpack"):
+            return json.loads(value)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+    
+    @traced("cache.get")
+    async def get_raw(self, key: str, local: bool = True) -> Optional[bytes]:
+        """Encoded value from the local tier, else Redis (promoting it locally).
+
+        ``local=False`` reads Redis first, e.g. under ``locked`` where another
+        worker's write may not have invalidated the local copy yet.
+        """
+        if local or not self.redis_client:
+            value = self.local.get(key)
+            if value is not None or not self.redis_client:
+                return value
+        
+        try:
+            value = await self.redis_client.get(key)
+        except Exception as e:
+            self._redis_failed("get", e, key=key)
+            return None if local else self.local.get(key)
+        if value is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        self.local.set(key, value)
+        return value
+    
     async def set(
         self, 
         key: str, 
         value: Any, 
         ttl: Optional[int] = None,
-        serialize: str = "json"
+        serialize: Optional[str] = None
     ) -> bool:
         """Set a value in cache."""
-        if not self.redis_client:
+        try:
+            data = self._serialize(value, serialize)
+        except Exception as e:
+            logger.error("Cache encode error", key=key, exc_info=e)
             return False
+        return await self.set_raw(key, data, ttl)
+    
+    @traced("cache.set")
+    async def set_raw(self, key: str, data: bytes, ttl: Optional[int] = None) -> bool:
+        """Store an already-encoded value in both tiers."""
+        expiry = ttl or settings.CACHE_TTL
+        self.local.set(key, data, expiry)
+        if not self.redis_client:
+            return True
         
         try:
-            if serialize == "json":
-                serialized_value = json.dumps(value, default=str)
-            elif serialize == "pickle":
-                serialized_value = pickle.dumps(value)
-            else:
-                serialized_value = str(value)
-            
-            await self.redis_client.set(
-                key, 
-                serialized_value, 
-                ex=ttl or settings.CACHE_TTL
-            )
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(key, data, ex=expiry)
+            if settings.CACHE_PUBSUB_INVALIDATION:
+                pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, self._invalidation(key))
+            await pipe.execute()
             return True
         except Exception as e:
-            logger.error("Cache set error", key=key, exc_info=e)
-            return False
+            self._redis_failed("set", e, key=key)
+            return True  # still cached locally
     
     async def get(
         self, 
         key: str, 
-        serialize: str = "json"
+        serialize: Optional[str] = None,
+        local: bool = True,
     ) -> Optional[Any]:
-        """Get a value from cache."""
-        if not self.redis_client:
+        """Get a value from cache (see ``get_raw`` for ``local``)."""
+        value = await self.get_raw(key, local)
+        if value is None:
             return None
-        
         try:
-            value = await self.redis_client.get(key)
-            if value is None:
-                return None
-            
-            if serialize == "json":
-                return json.loads(value)
-            elif serialize == "pickle":
-                return pickle.loads(value)
-            else:
-                return value.decode('utf-8') if isinstance(value, bytes) else value
+            return self._deserialize(value, serialize)
         except Exception as e:
-            logger.error("Cache get error", key=key, exc_info=e)
+            logger.error("Cache decode error", key=key, exc_info=e)
             return None
     
     async def delete(self, key: str) -> bool:
         """Delete a key from cache."""
+        removed = self.local.delete(key)
         if not self.redis_client:
-            return False
+            return removed
         
         try:
             result = await self.redis_client.delete(key)
-            return result > 0
+            await self._publish_invalidation(key)
+            return result > 0 or removed
         except Exception as e:
-            logger.error("Cache delete error", key=key, exc_info=e)
-            return False
+            self._redis_failed("delete", e, key=key)
+            return removed
     
     async def exists(self, key: str) -> bool:
         """Check if a key exists in cache."""
+        if self.local.get(key) is not None:
+            return True
         if not self.redis_client:
             return False
         
@@ -115,18 +380,18 @@ class CacheManager:
             result = await self.redis_client.exists(key)
             return result > 0
         except Exception as e:
-            logger.error("Cache exists error", key=key, exc_info=e)
+            self._redis_failed("exists", e, key=key)
             return False
     
     async def increment(self, key: str, amount: int = 1) -> Optional[int]:
-        """Increment a numeric value in cache."""
+        """Increment a numeric value in cache (Redis only; counters are never cached locally)."""
         if not self.redis_client:
             return None
         
         try:
             return await self.redis_client.incrby(key, amount)
         except Exception as e:
-            logger.error("Cache increment error", key=key, exc_info=e)
+            self._redis_failed("increment", e, key=key)
             return None
     
     async def expire(self, key: str, ttl: int) -> bool:
@@ -137,20 +402,355 @@ class CacheManager:
         try:
             return await self.redis_client.expire(key, ttl)
         except Exception as e:
-            logger.error("Cache expire error", key=key, exc_info=e)
+            self._redis_failed("expire", e, key=key)
+            return False
+    
+    async def scan_iter(self, pattern: str = "*", count: int = 1000) -> AsyncIterator[str]:
+        """Iterate keys matching a pattern with incremental SCAN.
+
+        Unlike KEYS, each SCAN call only walks ``count`` slots, so the server
+        is never blocked for the whole keyspace. Keys may be yielded more than
+        once if the keyspace is resized mid-iteration. Without Redis, the
+        local tier's keys are yielded instead.
+        """
+        if not self.redis_client:
+            for key in self.local.keys(pattern):
+                yield key
+            return
+        
+        try:
+            async for key in self.redis_client.scan_iter(match=pattern, count=count):
+                yield key.decode('utf-8') if isinstance(key, bytes) else key
+        except Exception as e:
+            self._redis_failed("scan", e, pattern=pattern)
+    
+    async def get_keys(self, pattern: str = "*", limit: Optional[int] = None) -> list:
+        """Get keys matching a pattern (SCAN-based, optionally capped at ``limit``)."""
+        keys = []
+        async for key in self.scan_iter(pattern):
+            keys.append(key)
+            if limit is not None and len(keys) >= limit:
+                break
+        return keys
+    
+    @traced("cache.mget")
+    async def mget(self, keys: Iterable[str], serialize: Optional[str] = None) -> List[Optional[Any]]:
+        """Get many values; local hits are served in-process, the rest with one MGET per chunk.
+
+        Missing keys map to None.
+        """
+        keys = list(keys)
+        raw: List[Optional[bytes]] = [self.local.get(key) for key in keys]
+        missing = [i for i, value in enumerate(raw) if value is None]
+        
+        if missing and self.redis_client:
+            try:
+                for chunk in _chunks(missing):
+                    values = await self.redis_client.mget([keys[i] for i in chunk])
+                    for i, value in zip(chunk, values):
+                        if value is None:
+                            self.redis_misses += 1
+                            continue
+                        self.redis_hits += 1
+                        raw[i] = value
+                        self.local.set(keys[i], value)
+            except Exception as e:
+                self._redis_failed("mget", e, count=len(missing))
+        
+        results: List[Optional[Any]] = []
+        for key, value in zip(keys, raw):
+            if value is None:
+                results.append(None)
+                continue
+            try:
+                results.append(self._deserialize(value, serialize))
+            except Exception as e:
+                logger.error("Cache decode error", key=key, exc_info=e)
+                results.append(None)
+        return results
+    
+    @traced("cache.mset")
+    async def mset(
+        self,
+        mapping: Dict[str, Any],
+        ttl: Optional[int] = None,
+        serialize: Optional[str] = None
+    ) -> bool:
+        """Set many values with a TTL using pipelined SET EX (no MULTI), one round-trip per chunk."""
+        if not mapping:
             return False
+        
+        expiry = ttl or settings.CACHE_TTL
+        encoded = []
+        for key, value in mapping.items():
+            data = self._serialize(value, serialize)
+            self.local.set(key, data, expiry)
+            encoded.append((key, data))
+        if not self.redis_client:
+            return True
+        
+        try:
+            for chunk in _chunks(encoded):
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, data in chunk:
+                    pipe.set(key, data, ex=expiry)
+                    if settings.CACHE_PUBSUB_INVALIDATION:
+                        pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, self._invalidation(key))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            self._redis_failed("mset", e, count=len(mapping))
+            return True  # still cached locally
+    
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete many keys with non-blocking UNLINK; returns the number removed."""
+        keys = list(keys)
+        removed_locally = sum(self.local.delete(key) for key in keys)
+        if not self.redis_client or not keys:
+            return removed_locally
+        
+        try:
+            removed = 0
+            for chunk in _chunks(keys):
+                removed += await self.redis_client.unlink(*chunk)
+                await self._publish_invalidation(*chunk)
+            return removed
+        except Exception as e:
+            self._redis_failed("delete_many", e, count=len(keys))
+            return removed_locally
     
-    async def get_keys(self, pattern: str = "*") -> list:
-        """Get keys matching a pattern."""
+    async def delete_pattern(self, pattern: str) -> int:
+        """Delete every key matching a pattern, scanning and unlinking in chunks."""
+        removed_locally = self.local.delete_pattern(pattern)
         if not self.redis_client:
-            return []
+            return removed_locally
+        
+        removed = 0
+        batch: List[str] = []
+        async for key in self.scan_iter(pattern):
+            batch.append(key)
+            if len(batch) >= BULK_CHUNK_SIZE:
+                removed += await self.delete_many(batch)
+                batch = []
+        if batch:
+            removed += await self.delete_many(batch)
+        return removed
+    
+    @traced("cache.get_or_compute")
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        beta: Optional[float] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Return the cached value for ``key`` or compute it exactly once.
+
+        Concurrent misses are collapsed: within a worker, callers share one
+        in-flight future; across workers, a Redis lock (lease) elects a single
+        computer while the others wait for its ``cache:ready`` notification.
+        Hits may trigger a probabilistic early refresh (XFetch), weighted by
+        how long the value took to compute, so hot keys are recomputed by one
+        caller shortly before expiry instead of all expiring at once.
+
+        Values are stored in an envelope; read them back through this method.
+        Results rejected by ``cacheable`` (e.g. a degraded fallback) are
+        returned to the callers sharing this computation but never stored;
+        an early refresh that is rejected keeps serving the current value.
+        """
+        expiry = ttl or settings.CACHE_TTL
+        beta = settings.CACHE_EARLY_REFRESH_BETA if beta is None else beta
+        
+        entry = await self.get(key)
+        if self._is_envelope(entry):
+            if not self._should_refresh_early(entry, beta):
+                return entry["v"]
+            # One caller refreshes early; everyone else keeps serving the current value
+            if key in self._inflight:
+                return entry["v"]
+            token = await self._acquire_lock(key)
+            if token is None:
+                return entry["v"]
+            self.early_refreshes += 1
+            value = await self._single_flight(
+                key, lambda: self._compute_and_store(key, compute, expiry, token, cacheable)
+            )
+            return value if cacheable is None or cacheable(value) else entry["v"]
         
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stampede_waits += 1
+            return await asyncio.shield(inflight)
+        return await self._single_flight(key, lambda: self._fill(key, compute, expiry, cacheable))
+    
+    async def _single_flight(self, key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await run()
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; avoid "never retrieved" warnings
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    @staticmethod
+    def _is_envelope(entry: Any) -> bool:
+        return isinstance(entry, dict) and "v" in entry and "e" in entry and "d" in entry
+    
+    @staticmethod
+    def _should_refresh_early(entry: Dict[str, Any], beta: float) -> bool:
+        # XFetch: -log(u) is exponential, so refresh probability rises sharply near expiry
+        if beta <= 0:
+            return False
+        jitter = -entry["d"] * beta * math.log(1.0 - random.random())
+        return time.time() + jitter >= entry["e"]
+    
+    async def _fill(self, key: str, compute: Callable[[], Awaitable[Any]], expiry: int,
+                    cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        token = await self._acquire_lock(key)
+        if token is None:
+            self.stampede_waits += 1
+            value = await self._wait_for_fill(key)
+            if value is not _MISSING:
+                return value
+            # Holder died or timed out; take over (or compute unlocked as a last resort)
+            token = await self._acquire_lock(key)
+        return await self._compute_and_store(key, compute, expiry, token, cacheable)
+    
+    async def _compute_and_store(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        expiry: int,
+        token: Optional[str],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        started = time.monotonic()
+        try:
+            value = await compute()
+            if cacheable is not None and not cacheable(value):
+                # Not stored: waiting workers see the lease released and compute it themselves
+                return value
+            envelope = {"v": value, "d": time.monotonic() - started, "e": time.time() + expiry}
+            await self.set(key, envelope, ttl=expiry)
+            if self.redis_client:
+                try:
+                    await self.redis_client.publish(ready_channel(key), b"1")
+                except Exception as e:
+                    self._redis_failed("publish", e, key=key)
+            return value
+        finally:
+            await self._release_lock(key, token)
+    
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        """Take the compute lease for ``key``; None if another worker holds it."""
+        if not self.redis_client:
+            return _LOCAL_LOCK  # local single-flight is all we can do
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis_client.set(
+                lock_key(key), token, nx=True, px=int(settings.CACHE_LOCK_TIMEOUT * 1000)
+            )
+        except Exception as e:
+            self._redis_failed("lock", e, key=key)
+            return _LOCAL_LOCK
+        return token if acquired else None
+    
+    async def _release_lock(self, key: str, token: Optional[str]):
+        if not token or token == _LOCAL_LOCK or not self.redis_client:
+            return
         try:
-            keys = await self.redis_client.keys(pattern)
-            return [key.decode('utf-8') if isinstance(key, bytes) else key for key in keys]
+            await self.redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key(key), token)
         except Exception as e:
-            logger.error("Cache get_keys error", pattern=pattern, exc_info=e)
-            return []
+            self._redis_failed("unlock", e, key=key)
+    
+    @asynccontextmanager
+    async def locked(self, key: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Exclusive section on ``key`` across tasks and workers, for read-modify-write updates.
+
+        Takes an in-process lock, then the ``lock:<key>`` lease (held for at
+        most ``CACHE_LOCK_TIMEOUT``), polling with backoff while another worker
+        holds it. Raises LockTimeout if not acquired within ``timeout``
+        (default ``CACHE_LOCK_WAIT_TIMEOUT``). Without Redis only the
+        in-process lock applies.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (settings.CACHE_LOCK_WAIT_TIMEOUT if timeout is None else timeout)
+        entry = self._key_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        token = None
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise LockTimeout(f"Timed out waiting for lock on {key}") from None
+            try:
+                interval = _WAIT_POLL_MIN
+                token = await self._acquire_lock(key)
+                while token is None:
+                    if loop.time() + interval > deadline:
+                        raise LockTimeout(f"Timed out waiting for lock on {key}")
+                    await asyncio.sleep(interval)
+                    interval = min(interval * 2, _WAIT_POLL_MAX)
+                    token = await self._acquire_lock(key)
+                yield
+            finally:
+                await self._release_lock(key, token)
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._key_locks.pop(key, None)
+    
+    @traced("cache.wait_for_fill")
+    async def _wait_for_fill(self, key: str) -> Any:
+        """Wait for the lock holder to publish ``key``; _MISSING on timeout or lost lease.
+
+        Waiters share the process-wide subscriber (no connection per waiter).
+        Between notifications the lease is polled with backoff, which also
+        covers a subscriber that is down.
+        """
+        if not self.redis_client:
+            return _MISSING
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.CACHE_LOCK_WAIT_TIMEOUT
+        waiter = loop.create_future()
+        self._fill_waiters.setdefault(key, []).append(waiter)
+        interval = _WAIT_POLL_MIN
+        try:
+            # The holder may have finished before we registered
+            entry = await self.get(key)
+            while not self._is_envelope(entry):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return _MISSING
+                done, _ = await asyncio.wait({waiter}, timeout=min(interval, remaining))
+                interval = min(interval * 2, _WAIT_POLL_MAX)
+                if not done and self.redis_client and await self.redis_client.exists(lock_key(key)):
+                    continue
+                # Notified, or the lease is gone (holder crashed): look once more
+                entry = await self.get(key)
+                if not self._is_envelope(entry):
+                    return _MISSING
+            return entry["v"]
+        except Exception as e:
+            self._redis_failed("wait", e, key=key)
+            return _MISSING
+        finally:
+            waiters = self._fill_waiters.get(key)
+            if waiters is not None and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._fill_waiters[key]
+            waiter.cancel()
 
 # Global cache manager instance
 cache = CacheManager()
@@ -164,9 +764,20 @@ async def close_cache():
     await cache.close()
 
 # Cache key generators
-def analysis_cache_key(session_id: str, file_hash: str) -> str:
-    """Generate cache key for analysis results."""
-    return f"analysis:{session_id}:{file_hash}"
+def analysis_cache_key(session_id: str, file_hash: str, model_version: str = "") -> str:
+    """Generate cache key for analysis results.
+
+    Results depend on the model that produced them, so the version is part of the key.
+    """
+    return f"analysis:{session_id}:{model_version}:{file_hash}"
+
+def analysis_handle_key(analysis_id: str) -> str:
+    """Generate cache key for a stored analysis handle (see ``analysis_store``)."""
+    return f"analysis:handle:{analysis_id}"
+
+def series_cache_key(series_id: str) -> str:
+    """Generate cache key for the state of a multi-date time series."""
+    return f"series:{series_id}"
 
 def model_cache_key(model_name: str, version: str) -> str:
     """Generate cache key for model artifacts."""
@@ -176,6 +787,18 @@ def session_cache_key(session_id: str) -> str:
     """Generate cache key for session data."""
     return f"session:{session_id}"
 
+def result_cache_key(kind: str, digest: str, model_version: str = "") -> str:
+    """Generate a content-addressed cache key for computed results (e.g. upload, report)."""
+    return f"result:{kind}:{model_version}:{digest}"
+
+def lock_key(key: str) -> str:
+    """Generate the single-flight lock key guarding ``key``."""
+    return f"lock:{key}"
+
+def ready_channel(key: str) -> str:
+    """Pub/sub channel announcing that ``key`` has been (re)computed."""
+    return f"cache:ready:{key}"
+
 def rate_limit_key(client_ip: str) -> str:
     """Generate cache key for rate limiting."""
     return f"rate_limit:{client_ip}"
@@ -0,0 +1,170 @@
+"""
+Binary codecs for cache values.
+
+Every encoded value starts with a small header naming its codec and
+compression, so a reader decodes each key correctly whatever the writer's
+settings were. Untagged values written before the header existed are still
+readable through the legacy path in ``CacheManager``.
+
+Layout: ``MAGIC (3 bytes) | codec (1 byte) | compression (1 byte) | payload``
+"""
+import json
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional: falls back to the JSON codec
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # optional
+    lz4_frame = None
+
+# JSON, pickle and plain text never start with a NUL byte
+MAGIC = b"\x00mc"
+HEADER_SIZE = len(MAGIC) + 2
+
+CODEC_JSON = 1
+CODEC_MSGPACK = 2
+CODEC_STR = 3
+CODECS = {"json": CODEC_JSON, "msgpack": CODEC_MSGPACK, "str": CODEC_STR}
+
+COMPRESS_NONE = 0
+COMPRESS_ZSTD = 1
+COMPRESS_LZ4 = 2
+COMPRESSIONS = {"none": COMPRESS_NONE, "zstd": COMPRESS_ZSTD, "lz4": COMPRESS_LZ4}
+
+# msgpack extension type carrying a raw ndarray buffer
+_EXT_NDARRAY = 1
+
+_zstd_compressors = {}
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        if arr.dtype.hasobject:
+            return arr.tolist()
+        header = msgpack.packb([arr.dtype.str, list(arr.shape)])
+        # Length-prefixed header followed by the raw buffer, no per-element encoding
+        return msgpack.ExtType(_EXT_NDARRAY, len(header).to_bytes(4, "little") + header + arr.tobytes())
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_NDARRAY:
+        header_len = int.from_bytes(data[:4], "little")
+        dtype, shape = msgpack.unpackb(data[4:4 + header_len])
+        # Read-only view over the payload; copy before mutating
+        return np.frombuffer(data, dtype=np.dtype(dtype), offset=4 + header_len).reshape(shape)
+    return msgpack.ExtType(code, data)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def available_compression(name: Optional[str]) -> str:
+    """Resolve a compression name to one whose library is installed."""
+    if name == "zstd" and zstandard is not None:
+        return "zstd"
+    if name == "lz4" and lz4_frame is not None:
+        return "lz4"
+    return "none"
+
+
+def _compress(payload: bytes, compression: str, level: int) -> Tuple[int, bytes]:
+    if compression == "zstd":
+        compressor = _zstd_compressors.get(level)
+        if compressor is None:
+            compressor = _zstd_compressors[level] = zstandard.ZstdCompressor(level=level)
+        return COMPRESS_ZSTD, compressor.compress(payload)
+    if compression == "lz4":
+        return COMPRESS_LZ4, lz4_frame.compress(payload, compression_level=level)
+    return COMPRESS_NONE, payload
+
+
+def _decompress(payload: bytes, compression: int) -> bytes:
+    if compression == COMPRESS_NONE:
+        return payload
+    if compression == COMPRESS_ZSTD:
+        if _zstd_decompressor is None:
+            raise RuntimeError("Value is zstd-compressed but zstandard is not installed")
+        return _zstd_decompressor.decompress(payload)
+    if compression == COMPRESS_LZ4:
+        if lz4_frame is None:
+            raise RuntimeError("Value is lz4-compressed but lz4 is not installed")
+        return lz4_frame.decompress(payload)
+    raise ValueError(f"Unknown cache compression id {compression}")
+
+
+def encode(
+    value: Any,
+    codec: str = "msgpack",
+    compression: str = "none",
+    threshold: int = 1024,
+    level: int = 3,
+) -> bytes:
+    """Encode ``value`` with a codec header.
+
+    Args:
+        value: Object to encode; numpy arrays are stored as raw buffers under msgpack
+        codec: "msgpack", "json" or "str" (msgpack falls back to json if not installed)
+        compression: "zstd", "lz4" or "none"; skipped when the library is missing
+        threshold: Only payloads at least this many bytes are compressed
+        level: Compression level
+    """
+    if codec == "msgpack" and msgpack is None:
+        codec = "json"
+    if codec == "msgpack":
+        payload = msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+    elif codec == "json":
+        payload = json.dumps(value, default=_json_default, separators=(",", ":")).encode("utf-8")
+    elif codec == "str":
+        payload = str(value).encode("utf-8")
+    else:
+        raise ValueError(f"Unknown cache codec '{codec}'")
+
+    compression_id = COMPRESS_NONE
+    if len(payload) >= threshold:
+        compression_id, payload = _compress(payload, available_compression(compression), level)
+    return MAGIC + bytes((CODECS[codec], compression_id)) + payload
+
+
+def is_tagged(data: bytes) -> bool:
+    """Whether ``data`` was produced by ``encode``."""
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def decode(data: bytes) -> Any:
+    """Decode a value produced by ``encode``, whatever codec it was written with."""
+    if not is_tagged(data):
+        raise ValueError("Value has no cache codec header")
+    codec_id = data[len(MAGIC)]
+    payload = _decompress(bytes(data[HEADER_SIZE:]), data[len(MAGIC) + 1])
+    if codec_id == CODEC_MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("Value is msgpack-encoded but msgpack is not installed")
+        return msgpack.unpackb(payload, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+    if codec_id == CODEC_JSON:
+        return json.loads(payload)
+    if codec_id == CODEC_STR:
+        return payload.decode("utf-8")
+    raise ValueError(f"Unknown cache codec id {codec_id}")
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -17,24 +17,98 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./app.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 3600  # 1 hour
+    DB_POOL_PRE_PING: bool = False  # enable for Postgres behind proxies that drop idle connections
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    DB_WRITE_BATCH_SIZE: int = 100  # rows per bulk insert
+    DB_WRITE_FLUSH_INTERVAL: float = 1.0  # seconds between background flushes
+    DB_WRITE_QUEUE_SIZE: int = 10000  # buffered records before new ones are dropped
     
     # Redis Cache
     REDIS_URL: str = "redis://localhost:6379/0"
     CACHE_TTL: int = 3600  # 1 hour
+    ANALYSIS_HANDLE_TTL: int = 24 * 3600  # analysis_id entries; older ids are reloaded from the DB
+    CACHE_CODEC: str = "msgpack"  # msgpack | json | str
+    CACHE_COMPRESSION: str = "zstd"  # zstd | lz4 | none (ignored if the library is missing)
+    CACHE_COMPRESSION_THRESHOLD: int = 1024  # bytes; smaller values are stored uncompressed
+    CACHE_COMPRESSION_LEVEL: int = 3
+    LOCAL_CACHE_MAX_ENTRIES: int = 10000
+    LOCAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64MB per worker
+    LOCAL_CACHE_TTL: int = 60  # seconds; bounds staleness of the in-process tier
+    CACHE_PUBSUB_INVALIDATION: bool = True
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
+    REDIS_RECONNECT_INTERVAL: float = 30.0  # seconds between reconnect attempts while degraded
+    REDIS_MAX_CONNECTIONS: int = 20  # connections per worker; callers queue when all are busy
+    REDIS_POOL_TIMEOUT: float = 5.0  # seconds to wait for a free connection before failing the call
+    CACHE_LOCK_TIMEOUT: float = 120.0  # seconds a single-flight compute lease is held at most
+    CACHE_LOCK_WAIT_TIMEOUT: float = 120.0  # seconds waiters wait for the lease holder
+    CACHE_EARLY_REFRESH_BETA: float = 1.0  # XFetch beta; 0 disables early refresh
     
     # File Storage
     UPLOAD_DIR: str = "./uploads"
+    GRADCAM_DIR: str = "./uploads/gradcam"
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
     ALLOWED_FILE_TYPES: List[str] = [".jpg", ".jpeg", ".png", ".tiff", ".tif"]
+    MAX_IMAGE_PIXELS: int = 64_000_000  # checked from the image header while uploading
     
     # ML Model
     MODEL_PATH: str = "../models/model_epoch_30.pth"
+    MODELS_DIR: str = "models"  # POST /models/load only reads checkpoints under this directory (relative to the repo root)
     DEVICE: str = "cpu"  # or "cuda" if available
     BATCH_SIZE: int = 4
+    AREA_MODE: str = "estimate"  # /upload area changes: estimate (classifier confidence) | dense (segmentation)
+    ANALYZE_BATCH_MAX_PAIRS: int = 10000  # probability pairs accepted by one /analyze/batch call
+    MAX_FUTURE_YEARS: int = 100  # longest future_years horizon accepted by analysis endpoints
+    TIMESERIES_MAX_OBSERVATIONS: int = 32  # dated images per series (and per request)
+    TIMESERIES_TTL: int = 7 * 24 * 3600  # series state kept in the cache for appends
+    TILE_STORE_PATH: str = "./tiles.db"  # SQLite file of per-tile class probabilities (/aoi)
+    TILE_SOURCE_URL: str = ""  # XYZ imagery template with {z}, {x}, {y}, {date}; empty = stored tiles only
+    TILE_FETCH_TIMEOUT: float = 10.0  # seconds per tile request
+    TILE_FETCH_CONCURRENCY: int = 8  # parallel tile requests per AOI
+    AOI_MAX_TILES: int = 1024  # tiles covered by one /aoi request
+    AOI_INFERENCE_BATCH: int = 32  # missing tiles per forward pass
+    EMBEDDING_INDEX_PATH: str = "./embeddings.npz"  # float16 image embeddings for /similar
+    EMBEDDING_SEARCH: str = "exact"  # exact (blocked matmul) | hnsw (requires faiss)
+    EMBEDDING_BLOCK_ROWS: int = 16384  # index rows scored per matmul block
+    EMBED_UPLOADS: bool = True  # add /upload images (with an X-Session-Id) to the embedding index
+    EMBEDDING_SAVE_EVERY: int = 64  # unsaved entries that trigger a save of the index
+    EMBEDDING_SAVE_INTERVAL: float = 300.0  # seconds after which any unsaved entries are saved
+    SIMILAR_MAX_K: int = 100  # neighbours returned by one /similar request
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_BURST: int = 10
+    # Tokens consumed per route template, optionally "METHOD /path"; unlisted routes cost 1, 0 = exempt
+    RATE_LIMIT_ROUTE_COSTS: Dict[str, int] = {
+        "/upload": 5,
+        "/report": 5,
+        "/gradcam": 3,
+        "/export": 2,
+        "/export/vector": 5,
+        "/analyze": 1,
+        "/analyze/batch": 5,
+        "POST /timeseries": 5,
+        "POST /timeseries/{series_id}/append": 5,
+        "GET /timeseries/{series_id}": 1,
+        "/change-mask": 5,
+        "/aoi": 5,
+        "/similar": 2,
+        "POST /models/load": 10,
+        "POST /models/{version}/activate": 5,
+        "POST /models/candidate": 5,
+        "DELETE /models/{version}": 5,
+        "/health": 0,
+    }
+    RATE_LIMIT_PATH_PREFIXES: List[str] = ["/api/v1", "/api/admin"]  # router prefixes stripped before matching
+    RATE_LIMIT_LEASE_FRACTION: float = 0.2  # share of the bucket leased locally to clients far under their limit
+    RATE_LIMIT_LEASE_TTL: float = 1.0  # seconds a local lease stays valid
     
     # Background Tasks
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
@@ -43,6 +117,14 @@ class Settings(BaseSettings):
     # Monitoring
     LOG_LEVEL: str = "INFO"
     ENABLE_METRICS: bool = True
+    METRICS_ROLLUP_INTERVAL: float = 60.0  # seconds between SystemMetrics rows; 0 disables the rollup
+    TRACING_ENABLED: bool = True
+    SERVER_TIMING_ENABLED: bool = True  # per-span durations in the Server-Timing response header
+    TRACE_SLOW_THRESHOLD_MS: float = 2000.0  # slower requests are logged and kept for /debug/traces
+    TRACE_BUFFER_SIZE: int = 100
+    PROFILING_HEADER_ENABLED: bool = False  # honour "X-Profile: 1" from clients
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILE_BUFFER_SIZE: int = 20
     
     # API Keys (for external services)
     GOOGLE_API_KEY: str = ""
@@ -2,26 +2,119 @@
 Database configuration and connection management.
 """
 import asyncio
-from typing import AsyncGenerator
+import time
+from typing import Any, AsyncGenerator, Dict, Optional, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, JSON, LargeBinary, Index, event, inspect, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from datetime import datetime
+import json
+import numpy as np
 import structlog
 
 from .config import settings
 
 logger = structlog.get_logger()
 
+class PoolStats:
+    """Connection checkout wait-time counters for sizing the pool."""
+
+    SLOW_CHECKOUT_SECONDS = 0.1
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_checkouts = 0  # waits above SLOW_CHECKOUT_SECONDS
+
+    def observe(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > self.SLOW_CHECKOUT_SECONDS:
+            self.slow_checkouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "total_wait_seconds": self.total_wait,
+            "avg_wait_seconds": self.total_wait / self.checkouts if self.checkouts else 0.0,
+            "max_wait_seconds": self.max_wait,
+            "slow_checkouts": self.slow_checkouts,
+        }
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe(time.perf_counter() - started)
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """Pool and driver options for the configured backend."""
+    options: Dict[str, Any] = {
+        "echo": settings.DEBUG,
+        "future": True,
+        # Compiled-statement cache shared by all connections
+        "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        # A single shared connection; pooling would give each checkout a new empty DB
+        options["poolclass"] = StaticPool
+        return options
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    elif "+asyncpg" in url:
+        options["connect_args"] = {
+            # Server-side prepared statements cached per connection
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
 # Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True,
-    pool_pre_ping=True,
-    pool_recycle=3600,  # 1 hour
-)
+engine = create_async_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
+
+if settings.DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers proceed while a writer commits; NORMAL sync is safe under WAL."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Current pool occupancy plus checkout wait statistics."""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__, **pool_stats.snapshot()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return stats
 
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
@@ -31,12 +124,36 @@ AsyncSessionLocal = sessionmaker(
 # Base class for models
 Base = declarative_base()
 
+def pack_probs(probs: Optional[Sequence[float]]) -> Optional[bytes]:
+    """Encode a probability vector as a compact little-endian float32 blob."""
+    if probs is None:
+        return None
+    return np.asarray(probs, dtype='<f4').tobytes()
+
+def unpack_probs(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    """Decode a blob written by ``pack_probs``."""
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype='<f4')
+
 class AnalysisRecord(Base):
     """Database model for analysis records."""
     __tablename__ = "analysis_records"
+    # Composite indexes back the keyset-paginated history queries (newest first)
+    __table_args__ = (
+        Index("ix_analysis_created_id", "created_at", "id"),
+        Index("ix_analysis_session_created", "session_id", "created_at", "id"),
+        # Year bounds are ranges, so they cannot lead an index that also serves the
+        # ordering; they ride along and are filtered while scanning newest-first
+        Index("ix_analysis_created_years", "created_at", "id", "before_year", "after_year"),
+        Index("ix_analysis_transition_created", "before_class", "after_class", "created_at", "id"),
+        Index("ix_analysis_impact_created", "impact_type", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, index=True)
+    # Content-derived handle returned to clients (see analysis_store); not unique across reruns
+    analysis_id = Column(String(32), index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -46,11 +163,17 @@ class AnalysisRecord(Base):
     processing_time = Column(Float)
     model_version = Column(String)
     
-    # Results (stored as JSON)
-    before_probs = Column(JSON)
-    after_probs = Column(JSON)
+    # Denormalized from analysis_results so list queries never parse JSON
+    before_class = Column(String)
+    after_class = Column(String)
+    impact_type = Column(String)
+    
+    # Probability vectors as packed float32 (see pack_probs/unpack_probs)
+    before_probs = Column(LargeBinary)
+    after_probs = Column(LargeBinary)
     analysis_results = Column(JSON)
-    gradcam_data = Column(JSON)
+    # Grad-CAM overlays live on disk under settings.GRADCAM_DIR
+    gradcam_path = Column(String, nullable=True)
     
     # Status
     status = Column(String, default="pending")  # pending, processing, completed, failed
@@ -103,11 +226,99 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+# Rows converted per UPDATE batch while migrating packed probability columns
+_MIGRATION_BATCH = 500
+# Indexes of earlier schemas that no longer match any query
+_DROPPED_INDEXES = ("ix_analysis_years_created",)
+
+def _json_value(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, (str, bytes)) else value
+
+def _migrate_analysis_records(conn) -> None:
+    """Bring an analysis_records table created by an older schema up to date.
+
+    Idempotent: every step checks the live schema first, so it is a no-op on
+    current databases. ``create_all`` only creates missing tables, never
+    columns or indexes of existing ones.
+
+    - adds analysis_id, before_class, after_class, impact_type and gradcam_path
+    - JSON before_probs/after_probs become packed float32 blobs; the old
+      columns are kept as ``*_json`` (not every backend can drop columns)
+    - backfills the denormalized class/impact columns from analysis_results
+    - creates the history query indexes and drops superseded ones
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table(AnalysisRecord.__tablename__):
+        return
+    table = AnalysisRecord.__table__
+    preparer = conn.dialect.identifier_preparer
+    name = preparer.quote(table.name)
+    existing = {col["name"]: col for col in inspector.get_columns(table.name)}
+
+    def add_column(column_name: str):
+        column_type = table.c[column_name].type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {name} ADD COLUMN {preparer.quote(column_name)} {column_type}"))
+        logger.info("Migrated analysis_records: added column", column=column_name)
+
+    for column_name in ("analysis_id", "before_class", "after_class", "impact_type", "gradcam_path"):
+        if column_name not in existing:
+            add_column(column_name)
+
+    legacy_probs = [c for c in ("before_probs", "after_probs")
+                    if c in existing and not isinstance(existing[c]["type"], LargeBinary)]
+    for column_name in legacy_probs:
+        legacy = f"{column_name}_json"
+        conn.execute(text(
+            f"ALTER TABLE {name} RENAME COLUMN {preparer.quote(column_name)} TO {preparer.quote(legacy)}"
+        ))
+        add_column(column_name)
+        rows = conn.execute(text(
+            f"SELECT id, {preparer.quote(legacy)} FROM {name} WHERE {preparer.quote(legacy)} IS NOT NULL"
+        )).fetchall()
+        update = text(f"UPDATE {name} SET {preparer.quote(column_name)} = :packed WHERE id = :id")
+        for start in range(0, len(rows), _MIGRATION_BATCH):
+            batch = [{"id": row_id, "packed": pack_probs(_json_value(value))}
+                     for row_id, value in rows[start:start + _MIGRATION_BATCH]]
+            conn.execute(update, batch)
+        logger.info("Migrated analysis_records: packed probabilities", column=column_name, rows=len(rows))
+
+    rows = conn.execute(text(
+        f"SELECT id, analysis_results FROM {name} WHERE before_class IS NULL AND analysis_results IS NOT NULL"
+    )).fetchall()
+    backfill = []
+    for row_id, results in rows:
+        results = _json_value(results) or {}
+        analysis = results.get("analysis", results) if isinstance(results, dict) else {}
+        change_info = analysis.get("change_info") or {}
+        if change_info.get("before_class") is None:
+            continue
+        backfill.append({
+            "id": row_id,
+            "before_class": change_info.get("before_class"),
+            "after_class": change_info.get("after_class"),
+            "impact_type": (analysis.get("environmental_impact") or {}).get("impact_type"),
+        })
+    if backfill:
+        update = text(f"UPDATE {name} SET before_class = :before_class, after_class = :after_class, "
+                      f"impact_type = :impact_type WHERE id = :id")
+        for start in range(0, len(backfill), _MIGRATION_BATCH):
+            conn.execute(update, backfill[start:start + _MIGRATION_BATCH])
+        logger.info("Migrated analysis_records: backfilled classes", rows=len(backfill))
+
+    existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for index_name in _DROPPED_INDEXES:
+        if index_name in existing_indexes:
+            conn.execute(text(f"DROP INDEX {preparer.quote(index_name)}"))
+            logger.info("Migrated analysis_records: dropped index", index=index_name)
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
 async def init_db():
-    """Initialize database tables."""
+    """Initialize database tables, migrating older analysis_records schemas in place."""
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_migrate_analysis_records)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error("Database initialization failed", exc_info=e)
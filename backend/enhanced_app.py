@@ -8,20 +8,30 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocke
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 import structlog
 
 from .config import settings
-from .database import init_db, close_db
+from .database import init_db, close_db, get_pool_stats
 from .cache import init_cache, close_cache
+from .persistence import init_writer, close_writer
 from .websocket_manager import WebSocketManager
+from .rate_limit import RateLimitMiddleware
+from .metrics import MetricsMiddleware, init_metrics, close_metrics
+from .api.metrics import router as metrics_router
+from .api.debug import router as debug_router
+from .api.models import router as models_router
+from .api.timeseries import router as timeseries_router
+from .api.change_mask import router as change_mask_router
+from .api.aoi import router as aoi_router
+from .services.tile_store import close_tile_store
+from .api.similar import router as similar_router
+from .services.embedding_index import close_embedding_index
+from .tracing import TracingMiddleware, add_trace_context
 
 # Configure structured logging
 structlog.configure(
     processors=[
+        add_trace_context,
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.add_log_level,
         structlog.processors.JSONRenderer()
@@ -33,9 +43,6 @@ structlog.configure(
 
 logger = structlog.get_logger()
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
-
 # WebSocket manager
 websocket_manager = WebSocketManager()
 
@@ -45,15 +52,21 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting application...")
     await init_db()
+    await init_writer()
     await init_cache()
+    await init_metrics()
     logger.info("Application started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    await close_metrics()
+    await close_writer()
     await close_db()
     await close_cache()
+    close_tile_store()
+    close_embedding_index()
     logger.info("Application shutdown complete")
 
 def create_app() -> FastAPI:
@@ -70,7 +83,12 @@ def create_app() -> FastAPI:
 
     # Add middleware
     app.add_middleware(GZipMiddleware, minimum_size=1000)
-    app.add_middleware(SlowAPIMiddleware)
+    # Redis-backed token bucket shared by all workers (costs per route in settings)
+    app.add_middleware(RateLimitMiddleware)
+    # Wraps the rate limiter, so rejected requests are timed too
+    app.add_middleware(MetricsMiddleware)
+    # Opens the request trace; everything inside it is attributed to the request
+    app.add_middleware(TracingMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=settings.ALLOWED_ORIGINS,
@@ -79,10 +97,6 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Add rate limiting
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
     # Error handlers
     @app.exception_handler(Exception)
     async def global_exception_handler(request, exc):
@@ -94,11 +108,15 @@ def create_app() -> FastAPI:
 
     # Health check endpoint
     @app.get("/health")
-    @limiter.limit("10/minute")
-    async def health_check(request):
+    async def health_check():
         """Health check endpoint for load balancers."""
         return {"status": "healthy", "version": "2.0.0"}
 
+    @app.get("/health/db")
+    async def database_health():
+        """Connection pool occupancy and checkout wait times."""
+        return {"status": "healthy", "pool": get_pool_stats()}
+
     # WebSocket endpoint for real-time updates
     @app.websocket("/ws/{client_id}")
     async def websocket_endpoint(websocket: WebSocket, client_id: str):
@@ -131,10 +149,19 @@ def create_app() -> FastAPI:
     app.include_router(recommend_router, prefix="/api/v1", tags=["recommendations"])
     app.include_router(report_router, prefix="/api/v1", tags=["reports"])
     app.include_router(export_router, prefix="/api/v1", tags=["export"])
+    app.include_router(timeseries_router, prefix="/api/v1", tags=["analysis"])
+    app.include_router(change_mask_router, prefix="/api/v1", tags=["analysis"])
+    app.include_router(aoi_router, prefix="/api/v1", tags=["analysis"])
+    app.include_router(similar_router, prefix="/api/v1", tags=["analysis"])
     app.include_router(websocket_router, prefix="/api/v1", tags=["websocket"])
+    app.include_router(metrics_router, tags=["monitoring"])
     
     if settings.ENVIRONMENT != "production":
         app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
+        # Trace lookup, collapsed stacks and the profiling toggle expose internals; never mounted in production
+        app.include_router(debug_router, prefix="/api/admin", tags=["admin"])
+        # Loading, activating and unloading models replaces what is served
+        app.include_router(models_router, prefix="/api/admin", tags=["admin"])
 
     return app
 
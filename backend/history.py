@@ -0,0 +1,156 @@
+"""
+Query API over stored analysis records.
+
+List queries select only the denormalized summary columns (never the JSON or
+probability blobs) and paginate newest-first with keyset cursors on
+``(created_at, id)``, which the composite indexes on ``AnalysisRecord`` serve
+without scanning or OFFSET.
+"""
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AnalysisRecord, unpack_probs
+from .tracing import traced
+
+MAX_PAGE_SIZE = 200
+
+SUMMARY_COLUMNS = (
+    AnalysisRecord.id,
+    AnalysisRecord.session_id,
+    AnalysisRecord.created_at,
+    AnalysisRecord.before_year,
+    AnalysisRecord.after_year,
+    AnalysisRecord.before_class,
+    AnalysisRecord.after_class,
+    AnalysisRecord.impact_type,
+    AnalysisRecord.processing_time,
+    AnalysisRecord.model_version,
+    AnalysisRecord.status,
+)
+
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    """Opaque cursor pointing just past ``(created_at, record_id)``."""
+    raw = f"{created_at.isoformat()}|{record_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of ``encode_cursor``; raises ValueError on malformed input."""
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(record_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+@traced("db.history_page")
+async def _page(db: AsyncSession, filters: List[Any], limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt = select(*SUMMARY_COLUMNS).where(*filters)
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            AnalysisRecord.created_at < created_at,
+            and_(AnalysisRecord.created_at == created_at, AnalysisRecord.id < record_id),
+        ))
+    # Fetch one extra row to know whether another page exists
+    stmt = stmt.order_by(AnalysisRecord.created_at.desc(), AnalysisRecord.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).mappings().all()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    for item in items:
+        item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def recent_analyses(db: AsyncSession, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Most recent analyses across all sessions."""
+    return await _page(db, [], limit, cursor)
+
+
+async def analyses_by_session(db: AsyncSession, session_id: str, limit: int = 20,
+                              cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Analyses recorded for one session."""
+    return await _page(db, [AnalysisRecord.session_id == session_id], limit, cursor)
+
+
+async def analyses_by_years(db: AsyncSession, start_year: Optional[int] = None, end_year: Optional[int] = None,
+                            limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Analyses whose before/after years fall within ``[start_year, end_year]``."""
+    filters = []
+    if start_year is not None:
+        filters.append(AnalysisRecord.before_year >= start_year)
+    if end_year is not None:
+        filters.append(AnalysisRecord.after_year <= end_year)
+    return await _page(db, filters, limit, cursor)
+
+
+async def analyses_by_transition(db: AsyncSession, before_class: Optional[str] = None,
+                                 after_class: Optional[str] = None, impact_type: Optional[str] = None,
+                                 limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Analyses matching a land-use transition and/or impact type."""
+    filters = []
+    if before_class:
+        filters.append(AnalysisRecord.before_class == before_class)
+    if after_class:
+        filters.append(AnalysisRecord.after_class == after_class)
+    if impact_type:
+        filters.append(AnalysisRecord.impact_type == impact_type)
+    return await _page(db, filters, limit, cursor)
+
+
+@traced("db.get_analysis")
+async def get_analysis(db: AsyncSession, record_id: int) -> Optional[Dict[str, Any]]:
+    """Full record, including decoded probabilities and analysis results."""
+    record = await db.get(AnalysisRecord, record_id)
+    if record is None:
+        return None
+    return _record_detail(record)
+
+
+@traced("db.get_analysis_by_handle")
+async def get_analysis_by_handle(db: AsyncSession, analysis_id: str) -> Optional[Dict[str, Any]]:
+    """Newest completed record for an ``analysis_id``, in the ``get_analysis`` format."""
+    stmt = (
+        select(AnalysisRecord)
+        .where(AnalysisRecord.analysis_id == analysis_id, AnalysisRecord.status == "completed")
+        .order_by(AnalysisRecord.created_at.desc(), AnalysisRecord.id.desc())
+        .limit(1)
+    )
+    record = (await db.execute(stmt)).scalars().first()
+    if record is None:
+        return None
+    return _record_detail(record)
+
+
+def _record_detail(record: AnalysisRecord) -> Dict[str, Any]:
+    before_probs = unpack_probs(record.before_probs)
+    after_probs = unpack_probs(record.after_probs)
+    return {
+        "id": record.id,
+        "session_id": record.session_id,
+        "analysis_id": record.analysis_id,
+        "created_at": record.created_at.isoformat() if record.created_at else None,
+        "before_year": record.before_year,
+        "after_year": record.after_year,
+        "before_class": record.before_class,
+        "after_class": record.after_class,
+        "impact_type": record.impact_type,
+        "processing_time": record.processing_time,
+        "model_version": record.model_version,
+        "status": record.status,
+        "error_message": record.error_message,
+        "before_probs": before_probs.tolist() if before_probs is not None else None,
+        "after_probs": after_probs.tolist() if after_probs is not None else None,
+        "analysis_results": record.analysis_results,
+        "gradcam_path": record.gradcam_path,
+    }
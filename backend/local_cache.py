@@ -0,0 +1,105 @@
+"""
+In-process LRU/TTL cache tier that sits in front of Redis.
+"""
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class LocalCache:
+    """Size-bounded LRU cache of encoded values with per-entry expiry.
+
+    Values are stored encoded (bytes) so entry sizes are exact and callers
+    can never mutate a cached object in place.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, ttl: int = 60):
+        """
+        Args:
+            max_entries: Maximum number of entries before LRU eviction
+            max_bytes: Maximum total size of stored values before LRU eviction
+            ttl: Default lifetime in seconds; bounds staleness against Redis
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> bool:
+        """Store ``value``; values larger than a quarter of the budget are not cached locally."""
+        size = len(value)
+        if size > self.max_bytes // 4:
+            self.delete(key)
+            return False
+        lifetime = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + lifetime, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._remove(key)
+            return True
+
+    def delete_pattern(self, pattern: str) -> int:
+        with self._lock:
+            matched = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+            for key in matched:
+                self._remove(key)
+            return len(matched)
+
+    def keys(self, pattern: str = "*") -> List[str]:
+        with self._lock:
+            return [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, value = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,457 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in a small registry (no client
+library required) and rendered by ``/metrics``. Hot paths time themselves
+with ``stage_timer``; subsystems that already keep their own counters (cache,
+analysis writer, DB pool, rate limiter) are read by collectors at scrape time
+instead of being instrumented twice.
+
+A background rollup task periodically aggregates recent analyses and host
+usage into ``SystemMetrics`` rows for the admin dashboard.
+"""
+import asyncio
+import bisect
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, select
+import structlog
+
+from .config import settings
+from .database import AsyncSessionLocal, AnalysisRecord, SystemMetrics, get_pool_stats
+from .tracing import span
+
+try:
+    import psutil
+except ImportError:  # optional: host usage falls back to load average / disk only
+    psutil = None
+
+logger = structlog.get_logger()
+
+# Seconds; spans sub-millisecond preprocessing up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    @property
+    def family_name(self) -> str:
+        """Name used in the HELP/TYPE lines."""
+        return self.name
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    @property
+    def family_name(self) -> str:
+        # Text format 0.0.4 has no suffix handling: TYPE must name the _total samples
+        return self.name + "_total"
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.family_name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum, count
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+
+# A collector returns (metric name, help, type, samples) families computed at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders the text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+
+        def _family(name: str, documentation: str, type_name: str, samples: List[Sample]):
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        for metric in self._metrics.values():
+            _family(metric.family_name, metric.documentation, metric.type_name, metric.samples())
+        for collector in self._collectors:
+            try:
+                for family in collector():
+                    _family(*family)
+            except Exception as e:
+                logger.warning("Metrics collector failed", collector=getattr(collector, "__name__", "?"), exc_info=e)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "ml_stage_duration_seconds",
+    "Time spent in each stage of the analysis pipeline",
+    ("stage",),
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+MODEL_ERRORS = registry.counter(
+    "model_errors",
+    "Exceptions raised by model inference",
+    ("stage",),
+)
+LLM_ERRORS = registry.counter(
+    "llm_errors",
+    "Failed LLM report or recommendation calls",
+    ("kind",),
+)
+
+GRADCAM_ENCODE_SECONDS = registry.histogram(
+    "gradcam_encode_duration_seconds",
+    "Time to encode one Grad-CAM output",
+    ("format",),
+)
+GRADCAM_PAYLOAD_BYTES = registry.histogram(
+    "gradcam_payload_bytes",
+    "Encoded size of one Grad-CAM output",
+    ("format",),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record the wall time of a pipeline stage (decode, transform, forward, ...).
+
+    Also opens a tracing span of the same name, so stages show up in the
+    request's ``Server-Timing`` header and trace.
+    """
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route templates keep label cardinality bounded (/history/{record_id}, not ids)
+            route = scope.get("route")
+            endpoint = scope.get("endpoint")
+            route_path = getattr(route, "path", None) or getattr(endpoint, "__name__", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=route_path, status=str(status["code"]),
+            )
+
+
+def _flatten(prefix: str, stats: Dict, samples: Dict[str, float]):
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            _flatten(f"{prefix}_{name}", value, samples)
+        elif isinstance(value, (bool, int, float)):
+            samples[f"{prefix}_{name}"] = float(value)
+
+
+def _subsystem_collector(prefix: str, documentation: str, stats_fn: Callable[[], Dict]) -> Collector:
+    """Expose every numeric field of a subsystem ``stats()`` dict as a gauge."""
+
+    def collect():
+        flat: Dict[str, float] = {}
+        _flatten(prefix, stats_fn(), flat)
+        return [(name, documentation, "gauge", [(name, {}, value)]) for name, value in flat.items()]
+
+    collect.__name__ = f"{prefix}_collector"
+    return collect
+
+
+def _cache_hit_ratio():
+    from .cache import cache
+
+    stats = cache.stats()
+    samples = []
+    for tier in ("local", "redis"):
+        hits, misses = stats[tier]["hits"], stats[tier]["misses"]
+        samples.append(("cache_hit_ratio", {"tier": tier}, hits / (hits + misses) if hits + misses else 0.0))
+    return [("cache_hit_ratio", "Cache hit ratio per tier since start", "gauge", samples)]
+
+
+def register_default_collectors():
+    """Attach the cache, writer, DB pool and rate limiter counters to the registry."""
+    from .cache import cache
+    from .persistence import analysis_writer
+    from .rate_limit import rate_limiter
+
+    registry.add_collector(_subsystem_collector("cache", "Cache tier counters", cache.stats))
+    registry.add_collector(_cache_hit_ratio)
+    registry.add_collector(_subsystem_collector("analysis_writer", "Write-behind queue counters", analysis_writer.stats))
+    registry.add_collector(_subsystem_collector("db_pool", "Connection pool occupancy and waits", get_pool_stats))
+    registry.add_collector(_subsystem_collector("rate_limit", "Rate limiter counters", rate_limiter.stats))
+
+
+def _host_usage() -> Dict[str, Optional[float]]:
+    usage: Dict[str, Optional[float]] = {"cpu": None, "memory": None, "disk": None}
+    if psutil is not None:
+        usage["cpu"] = psutil.cpu_percent(interval=None)
+        usage["memory"] = psutil.virtual_memory().percent
+    elif hasattr(os, "getloadavg"):
+        usage["cpu"] = 100.0 * os.getloadavg()[0] / (os.cpu_count() or 1)
+    try:
+        disk = shutil.disk_usage(settings.UPLOAD_DIR if os.path.exists(settings.UPLOAD_DIR) else ".")
+        usage["disk"] = 100.0 * disk.used / disk.total
+    except OSError:
+        pass
+    return usage
+
+
+class MetricsRollup:
+    """Periodically writes an aggregate ``SystemMetrics`` row.
+
+    Analysis aggregates come from the last hour of ``AnalysisRecord`` rows so
+    every worker computes the same numbers; when Redis is available a short
+    lease ensures only one worker writes per interval.
+    """
+
+    LEASE_KEY = "metrics:rollup"
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self._acquire_lease():
+                    await self.rollup()
+            except Exception as e:
+                logger.error("Metrics rollup failed", exc_info=e)
+
+    async def _acquire_lease(self) -> bool:
+        from .cache import cache
+
+        if cache.redis_client is None:
+            return True
+        try:
+            lease_ms = max(1, int(self.interval * 1000) - 500)
+            return bool(await cache.redis_client.set(self.LEASE_KEY, os.getpid(), nx=True, px=lease_ms))
+        except Exception:
+            return True
+
+    async def rollup(self):
+        """Aggregate the last hour and insert one ``SystemMetrics`` row."""
+        since = datetime.utcnow() - timedelta(hours=1)
+        stmt = select(
+            func.count(AnalysisRecord.id),
+            func.count(func.distinct(AnalysisRecord.session_id)),
+            func.avg(AnalysisRecord.processing_time),
+            func.sum(case((AnalysisRecord.status == "failed", 1), else_=0)),
+        ).where(AnalysisRecord.created_at >= since)
+
+        usage = await asyncio.to_thread(_host_usage)
+        async with AsyncSessionLocal() as session:
+            total, sessions, avg_time, errors = (await session.execute(stmt)).one()
+            total, errors = total or 0, errors or 0
+            session.add(SystemMetrics(
+                cpu_usage=usage["cpu"],
+                memory_usage=usage["memory"],
+                disk_usage=usage["disk"],
+                active_sessions=sessions or 0,
+                analyses_per_hour=total,
+                average_processing_time=float(avg_time) if avg_time is not None else None,
+                error_count=errors,
+                error_rate=errors / total if total else 0.0,
+            ))
+            await session.commit()
+        logger.debug("Metrics rollup written", analyses=total, errors=errors)
+
+
+metrics_rollup = MetricsRollup(interval=settings.METRICS_ROLLUP_INTERVAL)
+
+async def init_metrics():
+    """Register collectors and start the rollup task (no-op when metrics are disabled)."""
+    if not settings.ENABLE_METRICS:
+        return
+    if not registry._collectors:
+        register_default_collectors()
+    await metrics_rollup.start()
+
+async def close_metrics():
+    """Stop the rollup task."""
+    await metrics_rollup.close()
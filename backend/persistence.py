@@ -0,0 +1,205 @@
+"""
+Write-behind persistence of analysis records.
+
+Request handlers hand finished analyses to ``analysis_writer.record`` which only
+appends to an in-memory buffer. A background task drains the buffer and
+bulk-inserts rows in batches, so no database round-trip sits on the request path.
+Grad-CAM overlays (``save_gradcam``) go through the same buffer but only
+become files under ``gradcam_dir``, never analysis rows.
+"""
+import asyncio
+import collections
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+import structlog
+
+from .config import settings
+from .database import AsyncSessionLocal, AnalysisRecord, pack_probs
+
+logger = structlog.get_logger()
+
+# Every row carries the same keys so the batch compiles to a single executemany
+_RECORD_FIELDS = (
+    "session_id", "analysis_id", "before_year", "after_year", "processing_time", "model_version",
+    "before_class", "after_class", "impact_type",
+    "before_probs", "after_probs", "analysis_results", "gradcam_path",
+    "status", "error_message",
+)
+
+
+def gradcam_dir(digest: str) -> str:
+    """Directory holding the Grad-CAM overlays for a content digest."""
+    return os.path.join(settings.GRADCAM_DIR, digest[:2], digest)
+
+
+def _write_gradcam_files(directory: str, images: Dict[str, bytes]):
+    os.makedirs(directory, exist_ok=True)
+    for name, data in images.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):  # content-addressed: same digest, same bytes
+            with open(path, "wb") as f:
+                f.write(data)
+
+
+class AnalysisWriter:
+    """Buffers analysis records and flushes them to the database in batches."""
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._buffer: collections.deque = collections.deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        """Start the background flush task on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Analysis writer started", batch_size=self.batch_size)
+
+    async def close(self):
+        """Stop the flush task and write whatever is still buffered."""
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info("Analysis writer stopped", written=self.written, dropped=self.dropped)
+
+    def record(self, gradcam_images: Optional[Dict[str, bytes]] = None,
+               gradcam_digest: Optional[str] = None, **fields: Any) -> bool:
+        """Queue one analysis record. Never blocks; safe to call from worker threads.
+
+        Probability vectors are packed to float32 blobs here. Grad-CAM images
+        (file name -> encoded bytes) are written to ``gradcam_dir(gradcam_digest)``
+        by the flush task and only the directory path is stored in the row.
+
+        Returns False if the buffer is full and the record was dropped.
+        """
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            logger.warning("Analysis writer buffer full, dropping record", max_queue=self.max_queue)
+            return False
+
+        row = {name: fields.get(name) for name in _RECORD_FIELDS}
+        row["before_probs"] = pack_probs(row["before_probs"])
+        row["after_probs"] = pack_probs(row["after_probs"])
+        row["status"] = row["status"] or "completed"
+        row["created_at"] = row["updated_at"] = datetime.utcnow()
+        files = None
+        if gradcam_images and gradcam_digest:
+            row["gradcam_path"] = gradcam_dir(gradcam_digest)
+            files = gradcam_images
+        return self._enqueue(row, row["gradcam_path"], files)
+
+    def save_gradcam(self, digest: str, images: Dict[str, bytes]) -> bool:
+        """Queue Grad-CAM images for ``gradcam_dir(digest)`` without recording an analysis.
+
+        Returns False if the buffer is full and the images were dropped.
+        """
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            logger.warning("Analysis writer buffer full, dropping Grad-CAM images", max_queue=self.max_queue)
+            return False
+        return self._enqueue(None, gradcam_dir(digest), images)
+
+    def _enqueue(self, row: Optional[Dict[str, Any]], directory: Optional[str],
+                 files: Optional[Dict[str, bytes]]) -> bool:
+        self._buffer.append((row, directory, files))
+        if len(self._buffer) >= self.batch_size:
+            self._signal()
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._buffer)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def _signal(self):
+        """Wake the flush task early, from the loop thread or a worker thread."""
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        return batch
+
+    async def flush(self):
+        """Write all buffered records, one bulk INSERT per batch."""
+        while self._buffer:
+            entries = self._take_batch()
+            batch = [row for row, _, _ in entries if row is not None]
+            try:
+                for _, directory, files in entries:
+                    if files:
+                        await asyncio.to_thread(_write_gradcam_files, directory, files)
+                if batch:
+                    async with AsyncSessionLocal() as session:
+                        await session.execute(insert(AnalysisRecord), batch)
+                        await session.commit()
+                self.written += len(batch)
+            except Exception as e:
+                # Drop the batch rather than retrying forever; history is best-effort
+                self.failed += len(batch)
+                logger.error("Analysis batch insert failed", rows=len(batch), exc_info=e)
+
+
+# Global writer instance
+analysis_writer = AnalysisWriter(
+    batch_size=settings.DB_WRITE_BATCH_SIZE,
+    flush_interval=settings.DB_WRITE_FLUSH_INTERVAL,
+    max_queue=settings.DB_WRITE_QUEUE_SIZE,
+)
+
+async def init_writer():
+    """Start the analysis writer."""
+    await analysis_writer.start()
+
+async def close_writer():
+    """Flush and stop the analysis writer."""
+    await analysis_writer.close()
@@ -0,0 +1,270 @@
+"""
+Distributed token-bucket rate limiting backed by Redis.
+
+Each client has one bucket in Redis (``rate_limit_key``) that refills at
+``RATE_LIMIT_PER_MINUTE / 60`` tokens per second up to ``RATE_LIMIT_BURST``.
+Routes consume different numbers of tokens (``RATE_LIMIT_ROUTE_COSTS``),
+matched exactly against route templates such as ``/timeseries/{series_id}``.
+Refill and debit happen atomically in a Lua script using Redis server time,
+so all workers and replicas enforce one shared limit.
+
+Clients far under their limit are given a small lease of tokens that the
+worker spends locally, skipping Redis until the lease runs out or expires.
+"""
+import json
+import math
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+import structlog
+
+from .cache import cache, rate_limit_key
+from .config import settings
+
+logger = structlog.get_logger()
+
+# Leases and fallback buckets tracked per worker before idle ones are pruned
+_MAX_TRACKED_CLIENTS = 10000
+
+# Returns {granted, tokens_left, retry_after_seconds} as strings (Lua numbers truncate to int)
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local min_grant = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local granted = 0
+local retry_after = 0
+if tokens >= min_grant then
+    granted = math.min(tokens, requested)
+    tokens = tokens - granted
+else
+    retry_after = (min_grant - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {tostring(granted), tostring(tokens), tostring(retry_after)}
+"""
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    remaining: float
+    retry_after: float = 0.0
+
+
+@dataclass
+class _Lease:
+    tokens: float
+    expires_at: float
+    remote_remaining: float
+
+
+class _LocalBucket:
+    """Per-worker bucket used only while Redis is unavailable."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.ts = time.monotonic()
+
+    def is_full(self, now: float) -> bool:
+        """True once refilled to capacity, i.e. indistinguishable from a new bucket."""
+        return self.tokens + (now - self.ts) * self.rate >= self.capacity
+
+    def take(self, cost: float) -> RateLimitDecision:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return RateLimitDecision(True, self.tokens)
+        return RateLimitDecision(False, self.tokens, (cost - self.tokens) / self.rate)
+
+
+def _compile_routes(route_costs: Dict[str, int], prefixes: Sequence[str]) -> List[Tuple[Optional[str], Pattern, int]]:
+    """Turn ``"[METHOD ]/path/{param}"`` keys into full-path regexes, method-specific routes first.
+
+    The middleware runs before routing, so ``scope["route"]`` is not available
+    yet; the templates mirror the routers' paths instead.
+    """
+    prefix = "(?:" + "|".join(re.escape(p.rstrip("/")) for p in prefixes) + ")?" if prefixes else ""
+    routes = []
+    for route, cost in route_costs.items():
+        method, _, template = route.rpartition(" ")
+        template = template.rstrip("/") or "/"
+        parts = re.split(r"(\{[^}/]+\})", template)
+        pattern = "".join("[^/]+" if part.startswith("{") else re.escape(part) for part in parts)
+        routes.append((method.upper() or None, re.compile(prefix + pattern), cost))
+    routes.sort(key=lambda r: r[0] is None)
+    return routes
+
+
+class TokenBucketLimiter:
+    """Shared token-bucket limiter with per-route costs and a local lease fast path."""
+
+    def __init__(
+        self,
+        per_minute: int,
+        burst: int,
+        route_costs: Dict[str, int],
+        path_prefixes: Sequence[str] = (),
+        lease_fraction: float = 0.2,
+        lease_ttl: float = 1.0,
+    ):
+        """
+        Args:
+            per_minute: Sustained tokens per minute
+            burst: Bucket capacity
+            route_costs: Tokens consumed per route template (``"/path/{param}"`` or ``"METHOD /path"``); 0 exempts a route
+            path_prefixes: Router prefixes a route may be mounted under, e.g. ``/api/v1``
+            lease_fraction: Share of capacity a worker may lease while the client is far under its limit
+            lease_ttl: Seconds a lease may be spent locally before returning to Redis
+        """
+        self.capacity = float(burst)
+        self.rate = per_minute / 60.0
+        self.route_costs = route_costs
+        self._routes = _compile_routes(route_costs, path_prefixes)
+        self.lease_fraction = lease_fraction
+        self.lease_ttl = lease_ttl
+        self._leases: Dict[str, _Lease] = {}
+        self._fallback: Dict[str, _LocalBucket] = {}
+        self.redis_calls = 0
+        self.local_grants = 0
+
+    def cost_for(self, path: str, method: Optional[str] = None) -> int:
+        path = path.rstrip("/") or "/"
+        for route_method, pattern, cost in self._routes:
+            if (route_method is None or route_method == method) and pattern.fullmatch(path):
+                return cost
+        return 1
+
+    async def acquire(self, client_id: str, cost: int) -> RateLimitDecision:
+        now = time.monotonic()
+        lease = self._leases.get(client_id)
+        if lease is not None and lease.expires_at > now and lease.tokens >= cost:
+            lease.tokens -= cost
+            self.local_grants += 1
+            return RateLimitDecision(True, lease.remote_remaining + lease.tokens)
+
+        redis_client = cache.redis_client
+        if redis_client is None:
+            bucket = self._fallback.get(client_id)
+            if bucket is None:
+                if len(self._fallback) >= _MAX_TRACKED_CLIENTS:
+                    self._prune_fallback()
+                bucket = self._fallback[client_id] = _LocalBucket(self.capacity, self.rate)
+            return bucket.take(cost)
+
+        # Far under the limit: lease extra tokens so the next requests skip Redis
+        requested = cost
+        if lease is not None and lease.remote_remaining >= self.capacity / 2:
+            requested = max(cost, self.capacity * self.lease_fraction)
+
+        try:
+            self.redis_calls += 1
+            granted, remaining, retry_after = await redis_client.eval(
+                _TOKEN_BUCKET_SCRIPT, 1, rate_limit_key(client_id),
+                self.capacity, self.rate, requested, cost,
+            )
+        except Exception as e:
+            logger.warning("Rate limit check failed, allowing request", client=client_id, exc_info=e)
+            return RateLimitDecision(True, self.capacity)
+
+        granted, remaining, retry_after = float(granted), float(remaining), float(retry_after)
+        if granted < cost:
+            self._leases.pop(client_id, None)
+            return RateLimitDecision(False, remaining, retry_after)
+        self._leases[client_id] = _Lease(granted - cost, now + self.lease_ttl, remaining)
+        if len(self._leases) > _MAX_TRACKED_CLIENTS:
+            self._prune(now)
+        return RateLimitDecision(True, remaining + granted - cost)
+
+    def _prune(self, now: float):
+        for client_id in [c for c, l in self._leases.items() if l.expires_at <= now]:
+            del self._leases[client_id]
+
+    def _prune_fallback(self):
+        """Drop refilled fallback buckets; if none are, the longest idle ones."""
+        now = time.monotonic()
+        for client_id in [c for c, b in self._fallback.items() if b.is_full(now)]:
+            del self._fallback[client_id]
+        excess = len(self._fallback) - _MAX_TRACKED_CLIENTS // 2
+        if excess > 0:
+            idle = sorted(self._fallback, key=lambda c: self._fallback[c].ts)[:excess]
+            for client_id in idle:
+                del self._fallback[client_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"redis_calls": self.redis_calls, "local_grants": self.local_grants}
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying ``TokenBucketLimiter`` to every HTTP request."""
+
+    def __init__(self, app, limiter: Optional["TokenBucketLimiter"] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cost = self.limiter.cost_for(scope["path"], scope.get("method"))
+        if cost <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_id = client[0] if client else "unknown"
+        decision = await self.limiter.acquire(client_id, cost)
+        limit_headers = [
+            (b"x-ratelimit-limit", str(int(self.limiter.capacity)).encode()),
+            (b"x-ratelimit-remaining", str(max(0, int(decision.remaining))).encode()),
+        ]
+
+        if not decision.allowed:
+            body = json.dumps({"detail": "Rate limit exceeded", "retry_after": round(decision.retry_after, 2)}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(decision.retry_after))).encode()),
+                    *limit_headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *limit_headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# Global limiter instance
+rate_limiter = TokenBucketLimiter(
+    per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    burst=settings.RATE_LIMIT_BURST,
+    route_costs=settings.RATE_LIMIT_ROUTE_COSTS,
+    path_prefixes=settings.RATE_LIMIT_PATH_PREFIXES,
+    lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+    lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+)
@@ -0,0 +1,355 @@
+"""
+Nearest-neighbour index over image embeddings (``/similar``).
+
+Embeddings are the 512-d pooled ResNet features that feed the classifier
+head, taken from the same forward pass as the class probabilities. They are
+L2-normalised and stored as float16 (1 KiB per tile), so the 27k EuroSAT
+images plus uploads fit in a few tens of MB.
+
+Search is exact cosine similarity: the matrix is scanned in blocks of
+``EMBEDDING_BLOCK_ROWS`` rows, each block is upcast to float32 and multiplied
+with the query, and the per-block top-k (``argpartition``) are merged. Peak
+memory is one block, whatever the index size. With ``EMBEDDING_SEARCH=hnsw``
+and ``faiss`` installed, unfiltered queries go to a per-version HNSW graph of
+the public entries, rebuilt lazily after public entries of that version change.
+
+Every entry records the ``model_version`` that embedded it and searches only
+compare vectors of one version, so a model swap never mixes feature spaces
+(re-run the build script for the new version). Uploads carry the uploader's
+``session``: they are only returned to that session, and the session is never
+part of a result.
+
+The index lives in one ``.npz`` file (vectors, ids, JSON metadata). It is
+written with a temporary file and a rename, and entries added on disk by
+another process since it was loaded (e.g. ``scripts/build_embedding_index.py``)
+are merged in rather than overwritten. ``maybe_save`` persists new entries
+every ``EMBEDDING_SAVE_EVERY`` entries or ``EMBEDDING_SAVE_INTERVAL`` seconds.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import structlog
+
+try:
+    import faiss
+except ImportError:  # optional: approximate search falls back to exact
+    faiss = None
+
+try:
+    from ..config import settings
+except ImportError:
+    from config import settings
+
+logger = structlog.get_logger()
+
+EMBEDDING_DIM = 512
+_MIN_CAPACITY = 1024
+_HNSW_NEIGHBORS = 32
+_HNSW_EF_SEARCH = 128  # candidate list size per query (faiss defaults to 16)
+
+# Metadata fields kept as per-row codes for filtering; code 0 is "not set"
+FILTER_FIELDS = ("source", "model_version", "session")
+# Metadata fields never returned in search results
+PRIVATE_FIELDS = ("session",)
+
+
+def upload_entry_id(session_id: str, sha256: str) -> str:
+    """Index id of an uploaded image; per session, so two uploaders never share (or take over) an entry."""
+    owner = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:16]
+    return f"upload:{owner}:{sha256}"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit L2 norm (float32); zero rows stay zero."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """Unit-norm float16 embeddings with string ids and per-entry metadata."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, path: Optional[str] = None):
+        self.dim = dim
+        self.path = path
+        self._vectors = np.zeros((0, dim), dtype=np.float16)
+        self._codes = {name: np.zeros(0, dtype=np.int32) for name in FILTER_FIELDS}
+        self._vocab: Dict[str, Dict[Any, int]] = {name: {None: 0} for name in FILTER_FIELDS}
+        self._size = 0
+        self._ids: List[str] = []
+        self._metas: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._ann: Dict[int, Any] = {}  # model_version code -> (HNSW graph, row ids)
+        self._loaded_mtime: Optional[float] = None
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._positions
+
+    @property
+    def dirty(self) -> bool:
+        return self._unsaved > 0
+
+    def count(self, model_version: Optional[str] = None) -> int:
+        """Entries embedded by ``model_version`` (all entries if None)."""
+        if model_version is None:
+            return self._size
+        code = self._vocab["model_version"].get(model_version)
+        return 0 if code is None else int(np.count_nonzero(self._codes["model_version"][:self._size] == code))
+
+    def _reserve(self, size: int):
+        if size <= len(self._vectors):
+            return
+        capacity = max(_MIN_CAPACITY, len(self._vectors))
+        while capacity < size:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float16)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        for name, codes in self._codes.items():
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[:self._size] = codes[:self._size]
+            self._codes[name] = grown
+
+    def _set_codes(self, row: int, meta: Dict[str, Any]):
+        for name in FILTER_FIELDS:
+            vocab = self._vocab[name]
+            self._codes[name][row] = vocab.setdefault(meta.get(name), len(vocab))
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray,
+            metas: Optional[Sequence[Dict[str, Any]]] = None, replace: bool = True) -> int:
+        """Insert embeddings; existing ids are overwritten (or skipped with ``replace=False``).
+
+        Returns the number of entries written.
+        """
+        vectors = normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected ({len(ids)}, {self.dim}) embeddings, got {vectors.shape}")
+        metas = metas if metas is not None else [{}] * len(ids)
+        written = 0
+        # HNSW graphs only hold public entries; session uploads leave them valid
+        stale_graphs = set()
+        with self._lock:
+            self._reserve(self._size + len(ids))
+            for entry_id, vector, meta in zip(ids, vectors, metas):
+                row = self._positions.get(entry_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._positions[entry_id] = row
+                    self._ids.append(entry_id)
+                    self._metas.append(meta)
+                elif not replace:
+                    continue
+                else:
+                    self._metas[row] = meta
+                    if self._codes["session"][row] == 0:
+                        stale_graphs.add(int(self._codes["model_version"][row]))
+                self._vectors[row] = vector
+                self._set_codes(row, meta)
+                if self._codes["session"][row] == 0:
+                    stale_graphs.add(int(self._codes["model_version"][row]))
+                written += 1
+            if stale_graphs:
+                # -1 is the graph over all versions
+                for key in (*stale_graphs, -1):
+                    self._ann.pop(key, None)
+            self._unsaved += written
+        return written
+
+    def search(self, query: np.ndarray, k: int = 10, model_version: Optional[str] = None,
+               source: Optional[str] = None, session: Optional[str] = None,
+               exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """The ``k`` most cosine-similar entries as ``{id, score, **meta}``, best first.
+
+        Args:
+            model_version: Only compare with entries embedded by this model version
+            source: Only consider entries whose metadata ``source`` matches
+            session: Caller's session; entries owned by other sessions are never returned
+            exclude: Ids to leave out (e.g. the query image itself)
+        """
+        query = normalize(query)[0]
+        exclude = set(exclude)
+        with self._lock:
+            model_code = None if model_version is None else self._vocab["model_version"].get(model_version, -1)
+            source_code = None if source is None else self._vocab["source"].get(source, -1)
+            if model_code == -1 or source_code == -1:
+                return []
+            # Session 0 marks public entries; an unknown session only sees those
+            session_code = self._vocab["session"].get(session, -1) if session is not None else -1
+            wanted = k + len(exclude)
+            use_hnsw = (source is None and settings.EMBEDDING_SEARCH == "hnsw" and faiss is not None)
+            if use_hnsw:
+                rows, scores = self._search_hnsw(query, wanted, model_code, session_code)
+            else:
+                rows, scores = self._search_exact(query, wanted, model_code, source_code, session_code)
+            results = []
+            for row, score in zip(rows, scores):
+                entry_id = self._ids[row]
+                if entry_id in exclude:
+                    continue
+                meta = {key: value for key, value in self._metas[row].items() if key not in PRIVATE_FIELDS}
+                results.append({'id': entry_id, 'score': float(score), **meta})
+                if len(results) == k:
+                    break
+        return results
+
+    def _visible(self, start: int, stop: int, model_code: Optional[int], source_code: Optional[int],
+                 session_code: int) -> np.ndarray:
+        sessions = self._codes["session"][start:stop]
+        visible = (sessions == 0) | (sessions == session_code)
+        if model_code is not None:
+            visible &= self._codes["model_version"][start:stop] == model_code
+        if source_code is not None:
+            visible &= self._codes["source"][start:stop] == source_code
+        return visible
+
+    def _search_exact(self, query: np.ndarray, k: int, model_code: Optional[int],
+                      source_code: Optional[int], session_code: int):
+        block_rows = max(1, settings.EMBEDDING_BLOCK_ROWS)
+        candidate_rows, candidate_scores = [], []
+        for start in range(0, self._size, block_rows):
+            stop = min(start + block_rows, self._size)
+            scores = self._vectors[start:stop].astype(np.float32) @ query
+            scores[~self._visible(start, stop, model_code, source_code, session_code)] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            candidate_rows.append(top + start)
+            candidate_scores.append(scores[top])
+        if not candidate_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, scores = np.concatenate(candidate_rows), np.concatenate(candidate_scores)
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def _search_hnsw(self, query: np.ndarray, k: int, model_code: Optional[int], session_code: int):
+        """HNSW over one model version's public entries plus an exact pass over the caller's own uploads."""
+        key = -1 if model_code is None else model_code
+        if key not in self._ann:
+            members = np.flatnonzero(self._visible(0, self._size, model_code, None, 0)
+                                     & (self._codes["session"][:self._size] == 0))
+            # Inner product on unit vectors is cosine similarity
+            ann = faiss.IndexHNSWFlat(self.dim, _HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+            ann.add(self._vectors[members].astype(np.float32))
+            self._ann[key] = (ann, members)
+        ann, members = self._ann[key]
+        rows, scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if len(members):
+            ann.hnsw.efSearch = max(_HNSW_EF_SEARCH, k)
+            found_scores, found = ann.search(query[None, :], min(k, len(members)))
+            keep = found[0] >= 0
+            rows, scores = members[found[0][keep]], found_scores[0][keep]
+        own = np.flatnonzero(self._codes["session"][:self._size] == session_code) if session_code > 0 else ()
+        if len(own):
+            own = own[self._visible(0, self._size, model_code, None, session_code)[own]]
+            rows = np.concatenate([rows, own])
+            scores = np.concatenate([scores, self._vectors[own].astype(np.float32) @ query])
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {
+                name: np.bincount(self._codes[name][:self._size], minlength=len(self._vocab[name]))
+                for name in ("source", "model_version")
+            }
+            return {
+                'entries': self._size,
+                'bytes': int(self._size * self.dim * 2),
+                'sources': {value: int(counts["source"][code])
+                            for value, code in self._vocab["source"].items() if counts["source"][code]},
+                'model_versions': {value: int(counts["model_version"][code])
+                                   for value, code in self._vocab["model_version"].items()
+                                   if counts["model_version"][code]},
+            }
+
+    def maybe_save(self) -> bool:
+        """Save if ``EMBEDDING_SAVE_EVERY`` entries or ``EMBEDDING_SAVE_INTERVAL`` seconds are unsaved."""
+        with self._lock:
+            due = self._unsaved >= settings.EMBEDDING_SAVE_EVERY or (
+                self._unsaved and time.monotonic() - self._last_save >= settings.EMBEDDING_SAVE_INTERVAL
+            )
+            if due and self.path:
+                self.save()
+            return bool(due)
+
+    def save(self, path: Optional[str] = None):
+        """Write the index atomically, first merging entries added to the file by others."""
+        path = path or self.path
+        with self._lock:
+            if os.path.exists(path) and os.path.getmtime(path) != self._loaded_mtime:
+                on_disk = EmbeddingIndex.load(path, self.dim)
+                self.add(on_disk._ids, on_disk._vectors[:on_disk._size].astype(np.float32),
+                         on_disk._metas, replace=False)
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    vectors=self._vectors[:self._size],
+                    ids=np.array(self._ids, dtype=str),
+                    meta=np.array(json.dumps(self._metas)),
+                )
+            os.replace(tmp, path)
+            self._loaded_mtime = os.path.getmtime(path)
+            self._unsaved = 0
+            self._last_save = time.monotonic()
+        logger.info("embedding_index_saved", path=path, entries=self._size)
+
+    @classmethod
+    def load(cls, path: str, dim: int = EMBEDDING_DIM) -> "EmbeddingIndex":
+        index = cls(dim, path)
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            ids = data["ids"].tolist()
+            metas = json.loads(str(data["meta"]))
+        if vectors.shape[1:] != (dim,):
+            raise ValueError(f"{path}: expected {dim}-d embeddings, got {vectors.shape}")
+        index._reserve(len(ids))
+        index._vectors[:len(ids)] = vectors
+        index._size = len(ids)
+        index._ids, index._metas = ids, metas
+        index._positions = {entry_id: row for row, entry_id in enumerate(ids)}
+        for row, meta in enumerate(metas):
+            index._set_codes(row, meta)
+        index._loaded_mtime = os.path.getmtime(path)
+        return index
+
+
+_index: Optional[EmbeddingIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index() -> EmbeddingIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = settings.EMBEDDING_INDEX_PATH
+                if os.path.exists(path):
+                    _index = EmbeddingIndex.load(path)
+                    logger.info("embedding_index_loaded", path=path, entries=len(_index))
+                else:
+                    _index = EmbeddingIndex(path=path)
+    return _index
+
+
+def close_embedding_index():
+    global _index
+    if _index is not None:
+        if _index.dirty:
+            _index.save()
+        _index = None
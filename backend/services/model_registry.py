@@ -0,0 +1,213 @@
+"""
+Registry of model checkpoints keyed by version, with background loading,
+atomic promotion and weighted A/B routing to a candidate model.
+"""
+import hashlib
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import torch.nn as nn
+
+
+class ModelRegistry:
+    """Holds loaded models by version and decides which one serves a request.
+
+    Requests take a lease on one version (``acquire``/``release``) for their
+    whole lifetime. Swapping the active version never interrupts in-flight
+    work, and ``unload`` of a version that still has leases only retires it:
+    no new request can acquire it, and the model is dropped when the last
+    lease is released.
+    """
+
+    def __init__(self, builder: Callable[[str], nn.Module]):
+        """
+        Args:
+            builder: Callable that loads a checkpoint path into an eval-mode model
+        """
+        self._builder = builder
+        self._models: Dict[str, nn.Module] = {}
+        self._paths: Dict[str, str] = {}
+        self._pending: Dict[str, Future] = {}
+        self._errors: Dict[str, str] = {}
+        self._active: Optional[str] = None
+        self._candidate: Optional[str] = None
+        self._candidate_share = 0.0
+        self._leases: Dict[str, int] = {}
+        self._retiring: set = set()
+        self._drop_listeners: list = []
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    def load(self, version: str, path: str) -> nn.Module:
+        """Load a checkpoint synchronously and register it under ``version``."""
+        model = self._builder(path)
+        with self._lock:
+            self._models[version] = model
+            self._paths[version] = path
+            self._errors.pop(version, None)
+            self._retiring.discard(version)
+        return model
+
+    def load_async(self, version: str, path: str,
+                   on_loaded: Optional[Callable[[str], None]] = None) -> Future:
+        """Load a checkpoint on the background loader thread.
+
+        The serving model is untouched until the caller promotes the new
+        version with ``activate`` or ``set_candidate`` (or via ``on_loaded``).
+        """
+        def _task():
+            try:
+                self.load(version, path)
+            except Exception as e:
+                with self._lock:
+                    self._errors[version] = str(e)
+                raise
+            finally:
+                with self._lock:
+                    self._pending.pop(version, None)
+            if on_loaded:
+                on_loaded(version)
+            return version
+
+        with self._lock:
+            if version in self._pending:
+                return self._pending[version]
+            future = self._executor.submit(_task)
+            self._pending[version] = future
+        return future
+
+    def activate(self, version: str) -> None:
+        """Atomically make ``version`` the serving model."""
+        with self._lock:
+            if version not in self._models:
+                raise KeyError(f"Model version '{version}' is not loaded")
+            self._retiring.discard(version)
+            self._active = version
+            if self._candidate == version:
+                self._candidate = None
+                self._candidate_share = 0.0
+
+    def set_candidate(self, version: Optional[str], share: float = 0.0) -> None:
+        """Route ``share`` (0-1) of traffic to ``version``; ``None`` disables A/B routing."""
+        if not 0.0 <= share <= 1.0:
+            raise ValueError("Candidate traffic share must be between 0 and 1")
+        with self._lock:
+            if version is not None and version not in self._models:
+                raise KeyError(f"Model version '{version}' is not loaded")
+            self._retiring.discard(version)
+            self._candidate = version
+            self._candidate_share = share if version is not None else 0.0
+
+    def unload(self, version: str) -> bool:
+        """Drop a loaded version; the active and candidate versions cannot be unloaded.
+
+        Returns False when requests still hold leases on it: the version is
+        retired (no new leases) and dropped when the last one is released.
+        """
+        with self._lock:
+            if version in (self._active, self._candidate):
+                raise ValueError(f"Model version '{version}' is currently serving traffic")
+            if self._leases.get(version):
+                self._retiring.add(version)
+                return False
+            self._drop(version)
+            return True
+
+    def add_drop_listener(self, listener: Callable[[str], None]) -> None:
+        """Call ``listener(version)`` whenever a version is dropped, to free per-version state."""
+        self._drop_listeners.append(listener)
+
+    def _drop(self, version: str) -> None:
+        self._models.pop(version, None)
+        self._paths.pop(version, None)
+        self._retiring.discard(version)
+        for listener in self._drop_listeners:
+            listener(version)
+
+    def acquire(self, routing_key: Optional[str] = None, version: Optional[str] = None) -> str:
+        """Lease a version for one request; pair with ``release``.
+
+        ``version`` pins a specific version (KeyError if it is not loaded or
+        is being retired); otherwise the version is routed by ``routing_key``
+        (the active version when no key is given).
+        """
+        with self._lock:
+            if version is not None:
+                if version not in self._models or version in self._retiring:
+                    raise KeyError(f"Model version '{version}' is not loaded")
+            elif routing_key is not None:
+                version, _ = self.route(routing_key)
+            elif self._active is None:
+                raise RuntimeError("No active model version")
+            else:
+                version = self._active
+            self._leases[version] = self._leases.get(version, 0) + 1
+            return version
+
+    def release(self, version: str) -> None:
+        with self._lock:
+            remaining = self._leases.get(version, 0) - 1
+            if remaining > 0:
+                self._leases[version] = remaining
+                return
+            self._leases.pop(version, None)
+            if version in self._retiring:
+                self._drop(version)
+
+    @contextmanager
+    def lease(self, routing_key: Optional[str] = None, version: Optional[str] = None) -> Iterator[str]:
+        """``acquire``/``release`` around a block; yields the leased version."""
+        version = self.acquire(routing_key, version)
+        try:
+            yield version
+        finally:
+            self.release(version)
+
+    @property
+    def active_version(self) -> Optional[str]:
+        return self._active
+
+    def get(self, version: Optional[str] = None) -> nn.Module:
+        """Return the model for ``version`` (the active model when omitted)."""
+        with self._lock:
+            key = version or self._active
+            if key not in self._models:
+                raise KeyError(f"Model version '{key}' is not loaded")
+            return self._models[key]
+
+    def route(self, routing_key: Optional[str] = None) -> Tuple[str, nn.Module]:
+        """Pick the version that should serve a request.
+
+        With a ``routing_key`` (e.g. a content hash) the choice is sticky, so
+        the same input always lands on the same model and stays cacheable.
+        """
+        with self._lock:
+            version = self._active
+            if self._candidate and self._candidate_share > 0:
+                if routing_key is not None:
+                    digest = hashlib.sha1(routing_key.encode("utf-8")).digest()
+                    bucket = int.from_bytes(digest[:4], "big") / 2 ** 32
+                else:
+                    bucket = random.random()
+                if bucket < self._candidate_share:
+                    version = self._candidate
+            if version is None:
+                raise RuntimeError("No active model version")
+            return version, self._models[version]
+
+    def status(self) -> Dict[str, Any]:
+        """Describe loaded, loading and failed versions plus routing weights."""
+        with self._lock:
+            return {
+                'active_version': self._active,
+                'candidate_version': self._candidate,
+                'candidate_share': self._candidate_share,
+                'loaded': {v: self._paths.get(v) for v in self._models},
+                'leases': dict(self._leases),
+                'retiring': sorted(self._retiring),
+                'loading': sorted(self._pending),
+                'errors': dict(self._errors),
+            }
@@ -5,8 +5,7 @@ from typing import Tuple, Dict, Any, List
 
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
-from PIL import Image
+from torchvision import models
 import numpy as np
 from dotenv import load_dotenv
 
@@ -19,34 +18,74 @@ if str(ROOT) not in sys.path:
 if str(ALT_ROOT) not in sys.path:
     sys.path.insert(0, str(ALT_ROOT))
 
-from src.ml_modules.advanced_change_detection import AdvancedChangeDetector, TimeSeriesAnalyzer
-from src.utils.gradcam_utils import GradCAM
+from src.ml_modules.advanced_change_detection import (
+    AdvancedChangeDetector, TimeSeriesAnalyzer, IMPACT_TYPES, describe_impact
+)
 from src.ml_modules.environmental_report_wrapper import create_report_generator
 from src.ml_modules.enhanced_area_detection import AreaCalculator
+from src.ml_modules.dense_segmentation import STRIDE, DenseSegmenter, SegmentationResult, dense_area_changes
+from src.ml_modules.change_mask import change_mask, diff_class_maps, region_summary
+from src.ml_modules.vector_export import ChangeLayer, grid_transform
+from src.ml_modules.georeference import read_georeference
+
+from .model_registry import ModelRegistry
+from .preprocessing import DecodedImage, to_input_tensor
+
+try:
+    from ..metrics import stage_timer, MODEL_ERRORS, LLM_ERRORS
+    from ..tracing import traced
+except ImportError:
+    from metrics import stage_timer, MODEL_ERRORS, LLM_ERRORS
+    from tracing import traced
+
+# Footprint assumed for images without a georeference (a typical satellite patch)
+DEFAULT_IMAGE_AREA_KM2 = 100.0
 
-IMG_SIZE = 224
 CLASS_NAMES = [
     'AnnualCrop', 'Forest', 'HerbaceousVegetation', 'Highway', 'Industrial',
     'Pasture', 'PermanentCrop', 'Residential', 'River', 'SeaLake'
 ]
 
 
+def _stem_to_layer3(model: nn.Module, batch: torch.Tensor) -> torch.Tensor:
+    """torchvision ResNet forward up to the input of layer4."""
+    x = model.maxpool(model.relu(model.bn1(model.conv1(batch))))
+    return model.layer3(model.layer2(model.layer1(x)))
+
+
+def build_model(model_path: str) -> nn.Module:
+    """Load a ResNet18 land-use checkpoint in eval mode."""
+    model = models.resnet18(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, len(CLASS_NAMES))
+    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu'), weights_only=True))
+    model.eval()
+    return model
+
+
 class ModelService:
     def __init__(self):
         # Load env from repo root
         load_dotenv(dotenv_path=os.path.join(str(ROOT), '.env'))
 
         model_path = os.getenv("MODEL_PATH", os.path.join(str(ROOT), "models/model_epoch_30.pth"))
-        self.model = models.resnet18(weights=None)
-        self.model.fc = nn.Linear(self.model.fc.in_features, len(CLASS_NAMES))
-        self.model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
-        self.model.eval()
+        model_version = os.getenv("MODEL_VERSION", pathlib.Path(model_path).stem)
+        self.registry = ModelRegistry(build_model)
+        self.registry.load(model_version, model_path)
+        self.registry.activate(model_version)
+
+        # Optional A/B candidate, loaded in the background so startup is not delayed
+        candidate_path = os.getenv("CANDIDATE_MODEL_PATH")
+        if candidate_path:
+            candidate_version = os.getenv("CANDIDATE_MODEL_VERSION", pathlib.Path(candidate_path).stem)
+            share = float(os.getenv("CANDIDATE_TRAFFIC_SHARE", "0.1"))
+            self.registry.load_async(
+                candidate_version, candidate_path,
+                on_loaded=lambda v: self.registry.set_candidate(v, share),
+            )
 
-        self.transform = transforms.Compose([
-            transforms.Resize((IMG_SIZE, IMG_SIZE)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        # Decoded images are reduced to this long side (JPEG via DCT draft mode); the
+        # model input is always IMG_SIZE, the rest only feeds area and Grad-CAM
+        self.decode_max_side = int(os.getenv("DECODE_MAX_SIDE", "1024"))
 
         self.change_detector = AdvancedChangeDetector(CLASS_NAMES)
         self.time_analyzer = TimeSeriesAnalyzer()
@@ -56,55 +95,349 @@ class ModelService:
             self.report_generator = None
         # Area calculator for water body area metrics
         self.area_calc = AreaCalculator(pixel_size_m=10.0)
+        # Fully convolutional segmenters, one per model version (built on first use)
+        self.dense_window = int(os.getenv("DENSE_WINDOW", "1024"))
+        self._segmenters: Dict[str, DenseSegmenter] = {}
+        # Unloading a version must also release the model its segmenter holds
+        self.registry.add_drop_listener(lambda version: self._segmenters.pop(version, None))
+
+    @property
+    def model(self) -> nn.Module:
+        """Currently active model."""
+        return self.registry.get()
+
+    @property
+    def model_version(self) -> str:
+        return self.registry.active_version
+
+    def select_model(self, routing_key: str = None) -> str:
+        """Resolve the model version that serves a request (sticky per routing key)."""
+        version, _ = self.registry.route(routing_key)
+        return version
+
+    def model_lease(self, routing_key: str = None, version: str = None):
+        """Context manager holding a version for a request, so it cannot be unloaded mid-request.
+
+        Yields the routed version (sticky per ``routing_key``), ``version`` if
+        given, or the active version.
+        """
+        return self.registry.lease(routing_key, version)
+
+    @traced()
+    def preprocess(self, img_bytes: bytes) -> Tuple[torch.Tensor, DecodedImage]:
+        tensor, images = self.preprocess_batch([img_bytes])
+        return tensor, images[0]
+
+    @traced()
+    def preprocess_batch(self, blobs: List[bytes]) -> Tuple[torch.Tensor, List[DecodedImage]]:
+        """Decode several images into one (N, 3, IMG_SIZE, IMG_SIZE) input batch.
 
-    def preprocess(self, img_bytes: bytes) -> Tuple[torch.Tensor, Image.Image]:
-        import io
-        image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        return self.transform(image).unsqueeze(0), image
-
-    def predict(self, image_tensor: torch.Tensor) -> Tuple[str, float, np.ndarray]:
-        with torch.no_grad():
-            outputs = self.model(image_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            predicted_class_idx = torch.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_class_idx].item()
-            predicted_class = CLASS_NAMES[predicted_class_idx]
-        return predicted_class, confidence, probabilities[0].numpy()
-
-    def gradcam_overlay(self, image_tensor: torch.Tensor, orig_image: Image.Image) -> np.ndarray:
-        # Find last conv layer
-        last_conv_layer = None
-        for _, module in self.model.named_modules():
-            if isinstance(module, nn.Conv2d):
-                last_conv_layer = module
-        cam = GradCAM(self.model, last_conv_layer)
-        heatmap = cam.generate(image_tensor)
-        cam.remove_hooks()
+        The returned ``DecodedImage`` objects are read-only and meant to be
+        passed on to ``compute_area_changes`` and ``gradcam_overlay`` as is.
+        """
+        with stage_timer("decode"):
+            # GeoTIFFs keep their transform and CRS so areas come from the raster itself
+            images = [DecodedImage.from_bytes(blob, self.decode_max_side, read_georeference(blob)) for blob in blobs]
+        with stage_timer("transform"):
+            tensor = to_input_tensor(images)
+        return tensor, images
+
+    @traced()
+    def predict(self, image_tensor: torch.Tensor, model_version: str = None) -> Tuple[str, float, np.ndarray]:
+        return self.predict_batch(image_tensor, model_version)[0]
+
+    @traced()
+    def predict_batch(self, batch: torch.Tensor, model_version: str = None) -> List[Tuple[str, float, np.ndarray]]:
+        """One forward pass over a batch; (class, confidence, probabilities) per image."""
+        return self._forward(batch, model_version, with_embeddings=False)[0]
+
+    @traced()
+    def classify_and_embed(self, batch: torch.Tensor,
+                           model_version: str = None) -> Tuple[List[Tuple[str, float, np.ndarray]], np.ndarray]:
+        """``predict_batch`` results plus (N, 512) float32 pooled features from the same forward pass."""
+        return self._forward(batch, model_version, with_embeddings=True)
+
+    def _forward(self, batch: torch.Tensor, model_version: str, with_embeddings: bool):
+        model = self.registry.get(model_version)
+        with torch.no_grad(), stage_timer("forward"):
+            try:
+                if with_embeddings:
+                    # torchvision ResNet forward, keeping the pooled features fed to fc
+                    x = model.layer4(_stem_to_layer3(model, batch))
+                    features = torch.flatten(model.avgpool(x), 1)
+                    outputs = model.fc(features)
+                else:
+                    features, outputs = None, model(batch)
+            except Exception:
+                MODEL_ERRORS.inc(stage="forward")
+                raise
+            probabilities = torch.softmax(outputs, dim=1).numpy()
+        indices = probabilities.argmax(axis=1)
+        predictions = [
+            (CLASS_NAMES[idx], float(probs[idx]), probs)
+            for idx, probs in zip(indices, probabilities)
+        ]
+        return predictions, None if features is None else features.numpy()
+
+    @traced()
+    def gradcam_heatmap(self, image_tensor: torch.Tensor, model_version: str = None) -> np.ndarray:
+        """Raw Grad-CAM activation map in [0, 1] at feature resolution (7x7 for ResNet18).
+
+        Hook-free: the gradient is taken on this call's own layer4 output with
+        ``torch.autograd.grad``, so concurrent forward passes on the shared model
+        (other requests, other Grad-CAMs) cannot mix into it, and no ``.grad`` is
+        accumulated on the model parameters.
+        """
+        model = self.registry.get(model_version)
+        try:
+            with stage_timer("gradcam"):
+                with torch.no_grad():
+                    x = _stem_to_layer3(model, image_tensor)
+                with torch.enable_grad():
+                    activations = model.layer4(x.requires_grad_())
+                    logits = model.fc(torch.flatten(model.avgpool(activations), 1))
+                    target = int(logits[0].argmax())
+                    (gradients,) = torch.autograd.grad(logits[0, target], activations)
+                weights = gradients[0].mean(dim=(1, 2))
+                heatmap = (activations[0].detach() * weights[:, None, None]).mean(dim=0).numpy()
+                heatmap = np.maximum(heatmap, 0)
+                heatmap /= max(float(heatmap.max()), 1e-12)
+        except Exception:
+            MODEL_ERRORS.inc(stage="gradcam")
+            raise
+        return heatmap
+
+    @traced()
+    def gradcam_overlay(self, image_tensor: torch.Tensor, orig_image: DecodedImage,
+                        model_version: str = None, heatmap: np.ndarray = None,
+                        max_side: int = None) -> np.ndarray:
+        """Colorized Grad-CAM blended over the image.
+
+        Args:
+            heatmap: Precomputed ``gradcam_heatmap`` result (computed if omitted)
+            max_side: Downscale the overlay so its long side is at most this many pixels
+        """
+        if heatmap is None:
+            heatmap = self.gradcam_heatmap(image_tensor, model_version)
 
         import cv2
-        heatmap = cv2.resize(heatmap, (orig_image.width, orig_image.height))
+        pixels = np.asarray(orig_image)  # shared decode buffer, read only
+        if max_side and max(pixels.shape[:2]) > max_side:
+            ratio = max_side / max(pixels.shape[:2])
+            size = (max(1, round(pixels.shape[1] * ratio)), max(1, round(pixels.shape[0] * ratio)))
+            pixels = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+        heatmap = cv2.resize(heatmap, (pixels.shape[1], pixels.shape[0]))
         heatmap = np.uint8(255 * heatmap)
         heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-        overlay = cv2.addWeighted(np.array(orig_image), 0.6, heatmap, 0.4, 0)
+        overlay = cv2.addWeighted(pixels, 0.6, heatmap, 0.4, 0)
         return overlay
 
-    def compute_area_changes(self, before_img: Image.Image, after_img: Image.Image, 
-                           before_tensor: torch.Tensor, after_tensor: torch.Tensor) -> Dict[str, Any]:
-        """Compute meaningful area changes based on actual class transitions."""
-        # Get model predictions and probabilities
-        before_class, before_conf, before_probs = self.predict(before_tensor)
-        after_class, after_conf, after_probs = self.predict(after_tensor)
+    def _segmenter(self, model_version: str = None) -> DenseSegmenter:
+        version = model_version or self.model_version
+        segmenter = self._segmenters.get(version)
+        if segmenter is None or segmenter.model is not self.registry.get(version):
+            segmenter = self._segmenters[version] = DenseSegmenter(self.registry.get(version), window=self.dense_window)
+        return segmenter
+
+    @traced()
+    def segment(self, image: DecodedImage, model_version: str = None) -> SegmentationResult:
+        """Per-cell class map of the decoded image (see ``dense_segmentation``)."""
+        with stage_timer("segment"):
+            try:
+                return self._segmenter(model_version).segment(image)
+            except Exception:
+                MODEL_ERRORS.inc(stage="segment")
+                raise
+
+    @traced()
+    def compute_dense_area_changes(self, before_img: DecodedImage, after_img: DecodedImage,
+                                   model_version: str = None, min_change_pct: float = 1.0) -> Dict[str, Any]:
+        """Per-class area changes from dense segmentation pixel counts.
+
+        Same ``changes``/``summary`` layout as ``compute_area_changes``, with
+        areas measured from the maps instead of confidence times a fixed
+        image area. Classes whose share of the image moves by less than
+        ``min_change_pct`` percentage points are left out of ``changes``.
+        """
+        before_seg = self.segment(before_img, model_version)
+        after_seg = self.segment(after_img, model_version)
+        with stage_timer("area"):
+            areas = dense_area_changes(before_seg, after_seg, CLASS_NAMES, self.area_calc,
+                                       before_img.scale, after_img.scale,
+                                       self._cell_areas_m2(before_img), self._cell_areas_m2(after_img))
+
+        results = {'method': 'dense_segmentation', 'area_source': self._area_source(before_img, after_img),
+                   'class_areas': areas, 'changes': {}, 'summary': []}
+        for class_name, area in areas.items():
+            share_change = area['after_percentage'] - area['before_percentage']
+            if abs(share_change) < min_change_pct:
+                continue
+            before_area, after_area, change = area['before_area_km2'], area['after_area_km2'], area['change_km2']
+            percentage_change = change / (before_area + 1e-8) * 100
+            change_type = 'increased' if change > 0 else 'decreased'
+            description = (f"{class_name} area {change_type} by {abs(percentage_change):.1f}% "
+                           f"(from {before_area:.2f} km² → {after_area:.2f} km², {change:+.2f} km²)")
+            results['changes'][class_name] = {
+                'before_area_km2': before_area,
+                'after_area_km2': after_area,
+                'change_km2': change,
+                'percentage_change': float(percentage_change),
+                'change_type': change_type,
+                'significance': 'significant' if abs(share_change) >= 5.0 else 'moderate',
+                'description': description,
+            }
+            results['summary'].append({
+                'class': class_name,
+                'change_km2': change,
+                'percentage_change': float(percentage_change),
+                'description': description,
+            })
+        results['summary'] = sorted(results['summary'], key=lambda x: abs(x['change_km2']), reverse=True)[:3]
+        return results
+
+    def _segment_pair(self, before_img: DecodedImage, after_img: DecodedImage, model_version: str = None):
+        """Segmentations of an aligned pair, their per-cell change detection and cell areas in m²."""
+        if np.asarray(before_img).shape != np.asarray(after_img).shape or before_img.scale != after_img.scale:
+            raise ValueError("Before and after images must have the same dimensions")
+        before_seg = self.segment(before_img, model_version)
+        after_seg = self.segment(after_img, model_version)
+        changes = self.change_detector.detect_changes_batch(before_seg.probs, after_seg.probs,
+                                                            include_difference=False)
+        cell_areas = self._cell_areas_m2(before_img)
+        if cell_areas is None:
+            cell_areas = before_seg.cell_pixels * before_img.scale ** 2 * self.area_calc.pixel_area_m2
+        return before_seg, after_seg, changes, cell_areas
+
+    @traced()
+    def compute_change_map(self, before_img: DecodedImage, after_img: DecodedImage, model_version: str = None,
+                           min_region_cells: int = 1, max_regions: int = 50) -> Dict[str, Any]:
+        """Spatial diff of two aligned images from their dense segmentation grids.
+
+        A cell counts as changed when its argmax class differs and both cells
+        are confident (``detect_changes_batch``). Returns the class transition
+        matrix in km², the change mask at grid resolution (``mask_stride``
+        source pixels per cell) and the largest connected change regions.
+        Raises ValueError when the images are not aligned.
+        """
+        before_seg, after_seg, changes, cell_areas = self._segment_pair(before_img, after_img, model_version)
+        with stage_timer("change_map"):
+            result = diff_class_maps(
+                before_seg.class_grid, after_seg.class_grid, len(CLASS_NAMES),
+                weights=cell_areas,
+                significant=changes['is_significant_change'],
+                min_region_elements=min_region_cells, max_regions=max_regions,
+            )
+            # Weights are cell areas in m²
+            km2_per_m2 = 1e-6
+            transitions_km2 = result.transitions * km2_per_m2
+            rows, cols = np.nonzero(~np.eye(len(CLASS_NAMES), dtype=bool) & (result.transitions > 0))
+            order = np.argsort(transitions_km2[rows, cols])[::-1]
+            regions = []
+            for region in result.regions:
+                summary = region_summary(region, CLASS_NAMES, STRIDE, before_img.scale, km2_per_m2)
+                summary['area_km2'] = summary.pop('area')
+                summary['critical'] = bool(self.change_detector.critical_matrix[region.from_class, region.to_class])
+                regions.append(summary)
+            return {
+                'method': 'dense_segmentation',
+                'area_source': self._area_source(before_img, after_img),
+                'class_names': CLASS_NAMES,
+                'transition_matrix_km2': transitions_km2.tolist(),
+                'top_transitions': [
+                    {'from_class': CLASS_NAMES[i], 'to_class': CLASS_NAMES[j], 'area_km2': float(transitions_km2[i, j])}
+                    for i, j in zip(rows[order][:10], cols[order][:10])
+                ],
+                'total_area_km2': float(transitions_km2.sum()),
+                'changed_area_km2': result.changed_weight * km2_per_m2,
+                'changed_fraction': result.changed_fraction,
+                'significant_area_km2': float((result.mask * cell_areas).sum() * km2_per_m2),
+                'regions': regions,
+                'mask': result.mask,
+                'mask_stride': STRIDE * before_img.scale,
+            }
+
+    @traced()
+    def change_layer(self, before_img: DecodedImage, after_img: DecodedImage,
+                     model_version: str = None) -> ChangeLayer:
+        """Per-cell change grids with impact and coordinates, for ``vector_export``.
+
+        Coordinates are in the GeoTIFF's CRS when the before image is
+        georeferenced, else in source image pixels.
+        """
+        before_seg, after_seg, changes, cell_areas = self._segment_pair(before_img, after_img, model_version)
+        with stage_timer("change_map"):
+            impact = self.change_detector.analyze_impact_batch(changes)
+            height, width = before_seg.shape
+            return ChangeLayer(
+                before_map=before_seg.class_grid,
+                after_map=after_seg.class_grid,
+                mask=change_mask(before_seg.class_grid, after_seg.class_grid,
+                                 significant=changes['is_significant_change']),
+                class_names=CLASS_NAMES,
+                transform=grid_transform(before_img.geo, before_seg.shape, STRIDE, before_img.scale),
+                cell_areas_m2=cell_areas,
+                extent=(width / STRIDE, height / STRIDE),
+                crs=None if before_img.geo is None else before_img.geo.crs,
+                impact_type=impact['impact_type'],
+                impact_score=impact['impact_score'],
+                impact_labels=IMPACT_TYPES,
+                critical=self.change_detector.critical_matrix,
+            )
+
+    @staticmethod
+    def _area_source(*images: DecodedImage) -> str:
+        return 'georeferenced' if all(image.geo is not None for image in images) else 'nominal'
+
+    @staticmethod
+    def _cell_areas_m2(image: DecodedImage):
+        """Ground area of each segmentation cell from the image's georeference, else None."""
+        return None if image.geo is None else image.geo.cell_areas_m2(image.pixels.shape[:2], STRIDE)
+
+    @staticmethod
+    def _image_area_km2(image: DecodedImage) -> float:
+        return DEFAULT_IMAGE_AREA_KM2 if image.geo is None else image.geo.total_area_m2 / 1_000_000
+
+    def _water_area(self, image: DecodedImage) -> Dict[str, Any]:
+        """Water area read straight from the decode buffer, scaled to source resolution."""
+        pixel_areas = image.pixel_areas_m2()
+        area = self.area_calc.calculate_water_area(np.asarray(image), pixel_areas)
+        scale = getattr(image, "scale", 1.0) ** 2
+        if scale != 1.0:
+            # Georeferenced areas already cover the source footprint; only counts are rescaled
+            area = {**area, 'area_km2': area['area_km2'] * (scale if pixel_areas is None else 1.0),
+                    'pixel_count': int(area['pixel_count'] * scale), 'total_pixels': int(area['total_pixels'] * scale)}
+        return area
+
+    @traced()
+    def compute_area_changes(self, before_img: DecodedImage, after_img: DecodedImage,
+                           before_tensor: torch.Tensor = None, after_tensor: torch.Tensor = None,
+                           model_version: str = None,
+                           before_prediction: Tuple[str, float, np.ndarray] = None,
+                           after_prediction: Tuple[str, float, np.ndarray] = None) -> Dict[str, Any]:
+        """Compute meaningful area changes based on actual class transitions.
+
+        Pass the ``predict``/``predict_batch`` results the caller already has as
+        ``before_prediction``/``after_prediction`` to skip a second forward pass.
+        """
+        if before_prediction is None or after_prediction is None:
+            if before_tensor is None or after_tensor is None:
+                batch = to_input_tensor([before_img, after_img])
+            else:
+                batch = torch.cat([before_tensor, after_tensor])
+            before_prediction, after_prediction = self.predict_batch(batch, model_version)
+        before_class, before_conf, before_probs = before_prediction
+        after_class, after_conf, after_probs = after_prediction
         
         # Calculate water area using NDWI (more accurate for water detection)
-        b_np = np.array(before_img.convert('RGB'))
-        a_np = np.array(after_img.convert('RGB'))
-        water_before = self.area_calc.calculate_water_area(b_np)
-        water_after = self.area_calc.calculate_water_area(a_np)
+        with stage_timer("area"):
+            water_before = self._water_area(before_img)
+            water_after = self._water_area(after_img)
         
-        results = {'changes': {}, 'summary': []}
+        results = {'area_source': self._area_source(before_img, after_img), 'changes': {}, 'summary': []}
         
-        # Estimate total image area (typical satellite image patch)
-        image_area_km2 = 100.0
+        # Image footprint from the georeference, else a typical satellite patch
+        before_area_km2 = self._image_area_km2(before_img)
+        after_area_km2 = self._image_area_km2(after_img)
         
         # Primary transition: before_class → after_class
         if before_class != after_class:
@@ -112,12 +445,12 @@ class ModelService:
             if before_class in ['River', 'SeaLake']:
                 before_main_area = water_before['area_km2']
             else:
-                before_main_area = before_conf * image_area_km2
+                before_main_area = before_conf * before_area_km2
                 
             if after_class in ['River', 'SeaLake']:
                 after_main_area = water_after['area_km2']
             else:
-                after_main_area = after_conf * image_area_km2
+                after_main_area = after_conf * after_area_km2
             
             # Calculate decrease in before_class
             before_decrease = before_main_area * 0.7  # Assume 70% of area transitioned
@@ -203,13 +536,13 @@ class ModelService:
             # Sort by absolute change and take top 2
             prob_changes.sort(key=lambda x: abs(x[1]), reverse=True)
             for class_name, prob_diff, idx in prob_changes[:2]:
-                estimated_change = prob_diff * image_area_km2
+                before_area = float(before_probs[idx]) * before_area_km2
+                after_area = float(after_probs[idx]) * after_area_km2
+                estimated_change = after_area - before_area
                 percentage_change = prob_diff * 100 / (float(before_probs[idx]) + 1e-8)
                 
                 if abs(percentage_change) > 10:  # Only show significant changes
                     change_type = 'increased' if prob_diff > 0 else 'decreased'
-                    before_area = float(before_probs[idx]) * image_area_km2
-                    after_area = float(after_probs[idx]) * image_area_km2
                     
                     results['changes'][class_name] = {
                         'before_area_km2': before_area,
@@ -233,8 +566,14 @@ class ModelService:
         
         return results
 
+    @traced()
     def analyze_pair(self, before_probs: np.ndarray, after_probs: np.ndarray,
                      before_year: int, after_year: int, future_years: int) -> Dict[str, Any]:
+        with stage_timer("analyze"):
+            return self._analyze_pair(before_probs, after_probs, before_year, after_year, future_years)
+
+    def _analyze_pair(self, before_probs: np.ndarray, after_probs: np.ndarray,
+                      before_year: int, after_year: int, future_years: int) -> Dict[str, Any]:
         def _to_py(obj: Any):
             """Recursively convert numpy types/arrays to native Python types for JSON safety."""
             if isinstance(obj, np.ndarray):
@@ -255,9 +594,7 @@ class ModelService:
                 return tuple(_to_py(v) for v in obj)
             return obj
 
-        before_probs_tensor = torch.tensor(before_probs)
-        after_probs_tensor = torch.tensor(after_probs)
-        change_info = self.change_detector.detect_pixel_changes(before_probs_tensor, after_probs_tensor)
+        change_info = self.change_detector.detect_pixel_changes(before_probs, after_probs)
         # Ensure JSON-serializable
         if isinstance(change_info.get('probability_difference'), np.ndarray):
             change_info['probability_difference'] = change_info['probability_difference'].tolist()
@@ -290,7 +627,8 @@ class ModelService:
             (impact_type != 'neutral' or 
              before_class != after_class or 
              impact_type == 'noteworthy_change')):
-            recommendations = self.change_detector.generate_recommendations(environmental_impact, future_trends)
+            with stage_timer("llm"):
+                recommendations = self.change_detector.generate_recommendations(environmental_impact, future_trends)
 
         result = {
             'change_info': change_info,
@@ -304,6 +642,102 @@ class ModelService:
         # Ensure entire payload is JSON-serializable (no numpy scalar/arrays)
         return _to_py(result)
 
+    @traced()
+    def analyze_batch(self, before_probs: np.ndarray, after_probs: np.ndarray,
+                      before_year: int, after_year: int, future_years: int,
+                      layout: str = 'records') -> Dict[str, Any]:
+        """Change/impact/trend analysis for N probability pairs in one pass.
+
+        Args:
+            before_probs, after_probs: (N, C) class probability matrices
+            layout: ``records`` (one dict per pair, shaped like ``analyze_pair``)
+                or ``columnar`` (one list per field)
+
+        LLM recommendations and the stateful time-series history are per-request
+        features of ``analyze_pair`` and are not produced here; velocity is the
+        change magnitude per year.
+        """
+        with stage_timer("analyze"):
+            detector = self.change_detector
+            changes = detector.detect_changes_batch(before_probs, after_probs)
+            impact = detector.analyze_impact_batch(changes)
+            years_passed = max(0, after_year - before_year)
+            trends = detector.predict_future_trends_batch(changes, years_passed, future_years)
+            velocity = changes['change_magnitude'] / years_passed if years_passed > 0 else np.zeros(len(before_probs))
+
+            names = np.array(detector.class_names, dtype=object)
+            columns = {
+                'before_class': names[changes['before_idx']].tolist(),
+                'after_class': names[changes['after_idx']].tolist(),
+                'before_confidence': changes['before_confidence'].tolist(),
+                'after_confidence': changes['after_confidence'].tolist(),
+                'is_significant_change': changes['is_significant_change'].tolist(),
+                'change_magnitude': changes['change_magnitude'].tolist(),
+                'impact_type': [IMPACT_TYPES[i] for i in impact['impact_type']],
+                'impact_score': impact['impact_score'].tolist(),
+                'before_env_score': impact['before_env_score'].tolist(),
+                'after_env_score': impact['after_env_score'].tolist(),
+                'future_confidence': trends['confidence'].tolist(),
+                'velocity': velocity.tolist(),
+            }
+            if layout == 'columnar':
+                columns['future_probs'] = trends['future_probs'].tolist()
+                columns['probability_difference'] = changes['probability_difference'].tolist()
+                return {'count': len(before_probs), 'years_passed': years_passed,
+                        'class_names': list(detector.class_names), 'columns': columns}
+
+            records = []
+            for i in range(len(before_probs)):
+                before_class, after_class = columns['before_class'][i], columns['after_class'][i]
+                significant = columns['is_significant_change'][i]
+                impact_type = columns['impact_type'][i]
+                if significant:
+                    environmental_impact = {
+                        'impact_score': columns['impact_score'][i],
+                        'impact_type': impact_type,
+                        'description': describe_impact(impact_type, before_class, after_class,
+                                                       bool(impact['degradation'][i])),
+                        'before_env_score': columns['before_env_score'][i],
+                        'after_env_score': columns['after_env_score'][i],
+                        'before_class': before_class,
+                        'after_class': after_class,
+                    }
+                else:
+                    environmental_impact = {'impact_score': 0, 'impact_type': 'neutral',
+                                            'description': 'No significant change detected'}
+                future_trends = {'predictions': [], 'confidence': 0}
+                if trends['has_prediction'][i]:
+                    probs = trends['future_probs'][i]
+                    top = [j for j in np.argsort(-probs, kind='stable') if probs[j] > 0.1][:5]
+                    future_trends = {
+                        'predictions': [
+                            {
+                                'land_type': detector.class_names[j],
+                                'probability': float(probs[j]),
+                                'environmental_impact': detector.future_impact_labels[changes['after_idx'][i], j],
+                            }
+                            for j in top
+                        ],
+                        'confidence': columns['future_confidence'][i],
+                        'methodology': 'Markov Chain with exponential decay',
+                    }
+                records.append({
+                    'change_info': {
+                        'before_class': before_class,
+                        'after_class': after_class,
+                        'before_confidence': columns['before_confidence'][i],
+                        'after_confidence': columns['after_confidence'][i],
+                        'probability_difference': changes['probability_difference'][i].tolist(),
+                        'is_significant_change': significant,
+                        'change_magnitude': columns['change_magnitude'][i],
+                    },
+                    'environmental_impact': environmental_impact,
+                    'future_trends': future_trends,
+                    'temporal_analysis': {'velocity': columns['velocity'][i], 'acceleration': 0, 'trend': 'stable'},
+                })
+            return {'count': len(records), 'years_passed': years_passed, 'results': records}
+
+    @traced()
     def generate_reports(self, analysis: Dict[str, Any], detail: str, future_years: int) -> Dict[str, Any]:
         if not self.report_generator:
             return {'ai_report_generated': False, 'error': 'report_generator_unavailable'}
@@ -322,7 +756,8 @@ class ModelService:
                     'future_predictions': base_data['future_trends'],
                     'recommendations': base_data['recommendations']
                 }
-                full_report = self.report_generator.generate_report(analysis_data, future_years)
+                with stage_timer("llm"):
+                    full_report = self.report_generator.generate_report(analysis_data, future_years)
             if detail in ("Summary", "Both"):
                 summary_data = {
                     'before_class': base_data['change_info']['before_class'],
@@ -330,13 +765,15 @@ class ModelService:
                     'impact_type': base_data['environmental_impact']['impact_type'],
                     'change_magnitude': base_data['change_info']['change_magnitude']
                 }
-                summary = self.report_generator.generate_summary_report(summary_data)
+                with stage_timer("llm"):
+                    summary = self.report_generator.generate_summary_report(summary_data)
             return {
                 'ai_report_generated': True,
                 'full_report': full_report,
                 'summary_report': summary
             }
         except Exception as e:
+            LLM_ERRORS.inc(kind="report")
             return {'ai_report_generated': False, 'error': str(e)}
 
 
@@ -0,0 +1,146 @@
+"""
+Fast image decode and model-input preparation.
+
+Replaces the torchvision ``Resize -> ToTensor -> Normalize`` chain, which
+allocates a float image at every step, with:
+
+- JPEG draft mode: libjpeg scales by 1/2, 1/4 or 1/8 in the DCT domain while
+  decoding, so large photos are never materialised at full resolution;
+- one antialiased PIL bilinear resize straight to 224x224 uint8 (the same
+  filter torchvision's ``Resize`` applies to PIL images);
+- normalisation fused into ``x * 1/(255*std) - mean/std``, written in place
+  into a preallocated NCHW batch tensor.
+
+``DecodedImage`` holds the result of one decode: a single read-only,
+C-contiguous uint8 buffer that the preprocess, area and Grad-CAM stages all
+read through ``np.asarray`` without converting or copying it again.
+"""
+import io
+from typing import Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+IMG_SIZE = 224
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# (x / 255 - mean) / std == x * _SCALE - _SHIFT, per channel
+_SCALE = (1.0 / (255.0 * STD)).reshape(3, 1, 1)
+_SHIFT = (MEAN / STD).reshape(3, 1, 1)
+
+# Decoded images keep at most this many pixels on the long side (area, Grad-CAM)
+DEFAULT_MAX_SIDE = 1024
+
+
+def decode_image(data: bytes, max_side: int = DEFAULT_MAX_SIDE) -> Image.Image:
+    """Decode to RGB with the long side reduced to about ``max_side``.
+
+    ``image.info["decode_scale"]`` records original width / decoded width so
+    pixel-count based areas can be scaled back to the source resolution.
+    """
+    image = Image.open(io.BytesIO(data))
+    original_width = image.width
+    if image.format == "JPEG" and max(image.size) > max_side:
+        # Picks the largest DCT scale that keeps both sides >= the request
+        image.draft("RGB", (max_side, max_side))
+    image = image.convert("RGB")
+    if max(image.size) > 2 * max_side:
+        # Non-JPEG (or draft-limited) sources: cheap integer box reduction
+        image = image.reduce(max(image.size) // max_side)
+    image.info["decode_scale"] = original_width / image.width
+    return image
+
+
+def resize_to_input(image: Image.Image) -> np.ndarray:
+    """224x224x3 uint8 view of ``image`` resized for the model."""
+    if image.size != (IMG_SIZE, IMG_SIZE):
+        image = image.resize((IMG_SIZE, IMG_SIZE), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array = np.ascontiguousarray(array)
+    array.flags.writeable = False
+    return array
+
+
+class DecodedImage:
+    """Decoded RGB pixels of one upload, shared read-only by every stage.
+
+    ``np.asarray(decoded)`` and ``memoryview(decoded.pixels)`` expose the same
+    (H, W, 3) uint8 buffer; nothing downstream needs a PIL image or a copy.
+    """
+
+    __slots__ = ("pixels", "model_input", "scale", "format", "geo")
+
+    def __init__(self, pixels: np.ndarray, model_input: np.ndarray, scale: float = 1.0,
+                 format: Optional[str] = None, geo=None):
+        """
+        Args:
+            pixels: (H, W, 3) uint8 image at decode resolution
+            model_input: (IMG_SIZE, IMG_SIZE, 3) uint8 resize of ``pixels``
+            scale: Source width / decoded width (for pixel-count areas)
+            format: Source format reported by PIL
+            geo: ``GeoReference`` of the source raster, if it carries one
+        """
+        self.pixels = _read_only(pixels)
+        self.model_input = _read_only(model_input)
+        self.scale = scale
+        self.format = format
+        self.geo = geo
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_side: int = DEFAULT_MAX_SIDE, geo=None) -> "DecodedImage":
+        image = decode_image(data, max_side)
+        # The model-size resize happens while the PIL image is still alive, once
+        return cls(np.asarray(image), resize_to_input(image), image.info["decode_scale"], image.format, geo)
+
+    def pixel_areas_m2(self) -> Optional[np.ndarray]:
+        """(H, 1) ground area per decoded pixel in each row, or None without a georeference."""
+        return None if self.geo is None else self.geo.pixel_areas_m2(self.pixels.shape[:2])
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and np.dtype(dtype) != self.pixels.dtype:
+            return self.pixels.astype(dtype)
+        return self.pixels.copy() if copy else self.pixels
+
+    @property
+    def buffer(self) -> memoryview:
+        return memoryview(self.pixels)
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.pixels.nbytes
+
+    def to_pil(self) -> Image.Image:
+        """PIL copy for encoders that need one."""
+        return Image.fromarray(self.pixels)
+
+
+def to_input_tensor(images: Sequence, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Normalised float32 NCHW batch for ``images``.
+
+    Args:
+        images: ``DecodedImage`` objects (their cached 224x224 resize is used)
+            or RGB PIL images of any size
+        out: Optional preallocated (N, 3, 224, 224) float32 tensor to fill
+    """
+    if out is None:
+        out = torch.empty((len(images), 3, IMG_SIZE, IMG_SIZE), dtype=torch.float32)
+    batch = out.numpy()
+    for i, image in enumerate(images):
+        resized = image.model_input if isinstance(image, DecodedImage) else resize_to_input(image)
+        pixels = resized.transpose(2, 0, 1)  # HWC -> CHW view, no copy
+        np.multiply(pixels, _SCALE, out=batch[i])
+        np.subtract(batch[i], _SHIFT, out=batch[i])
+    return out
@@ -0,0 +1,218 @@
+"""
+On-disk store of per-tile class probabilities for area-of-interest queries.
+
+Tiles are Web Mercator XYZ tiles. Each row holds the softmax vector of one
+(z, x, y) tile for one imagery date and model version. The primary key is
+(model_version, date, quadkey), so every tile under a quadtree node shares a
+key prefix. An AOI rectangle is split into maximal aligned quadtree blocks,
+and each block is read with one index range scan on its quadkey prefix.
+Overlapping AOIs therefore read the tiles they share and only send the
+missing ones to the model.
+
+The store is a single SQLite file (WAL mode), written from the threadpool
+with one connection per thread.
+"""
+import math
+import sqlite3
+import threading
+import time
+import urllib.request
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.ml_modules.georeference import latitude_band_area_m2
+
+try:
+    from ..config import settings
+except ImportError:
+    from config import settings
+
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.05112878
+MAX_ZOOM = 22
+
+Tile = Tuple[int, int, int]  # (z, x, y)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    model_version TEXT NOT NULL,
+    date TEXT NOT NULL,
+    quadkey TEXT NOT NULL,
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    probs BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model_version, date, quadkey)
+) WITHOUT ROWID
+"""
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> Tuple[int, int]:
+    """XYZ tile containing a WGS84 point at zoom ``z``."""
+    n = 1 << z
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_quadkey(z: int, x: int, y: int) -> str:
+    digits = []
+    for level in range(z, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def tile_bounds_mercator(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of a tile in EPSG:3857 metres."""
+    extent = math.pi * 6378137.0
+    size = 2 * extent / (1 << z)
+    west, north = -extent + x * size, extent - y * size
+    return west, north - size, west + size, north
+
+
+def tile_latitudes(z: int, y: int) -> Tuple[float, float]:
+    """(south, north) latitude of tile row ``y``."""
+    n = 1 << z
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, north
+
+
+def tile_area_m2(z: int, y: int) -> float:
+    """Ground area of any tile in row ``y`` (Web Mercator tiles shrink towards the poles)."""
+    south, north = tile_latitudes(z, y)
+    return latitude_band_area_m2(south, north, 360.0 / (1 << z))
+
+
+def tile_range(bbox: Sequence[float], z: int) -> Tuple[int, int, int, int]:
+    """Inclusive (x0, y0, x1, y1) tile range covering a (west, south, east, north) WGS84 box."""
+    west, south, east, north = bbox
+    x0, y0 = lonlat_to_tile(west, north, z)
+    x1, y1 = lonlat_to_tile(east, south, z)
+    return x0, y0, x1, y1
+
+
+def quadkey_blocks(z: int, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[str, int]]:
+    """Maximal aligned quadtree blocks tiling the inclusive range; yields (prefix, level).
+
+    All zoom-``z`` tiles under a prefix lie in the range, so each block is one
+    exact prefix scan.
+    """
+    def visit(level: int, bx: int, by: int) -> Iterator[Tuple[str, int]]:
+        shift = z - level
+        lo_x, lo_y = bx << shift, by << shift
+        hi_x, hi_y = lo_x + (1 << shift) - 1, lo_y + (1 << shift) - 1
+        if hi_x < x0 or lo_x > x1 or hi_y < y0 or lo_y > y1:
+            return
+        if lo_x >= x0 and hi_x <= x1 and lo_y >= y0 and hi_y <= y1:
+            yield tile_quadkey(level, bx, by), level
+            return
+        for dy in (0, 1):
+            for dx in (0, 1):
+                yield from visit(level + 1, 2 * bx + dx, 2 * by + dy)
+
+    yield from visit(0, 0, 0)
+
+
+class TileStore:
+    """Per-tile class probabilities keyed by (z, x, y, date, model_version)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._connect().execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+            conn.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get_range(self, model_version: str, date: str, z: int,
+                  x0: int, y0: int, x1: int, y1: int) -> Dict[Tile, np.ndarray]:
+        """Stored probabilities of every tile in the inclusive range."""
+        conn = self._connect()
+        found: Dict[Tile, np.ndarray] = {}
+        for prefix, level in quadkey_blocks(z, x0, y0, x1, y1):
+            if level == z:
+                rows = conn.execute(
+                    "SELECT z, x, y, probs FROM tiles WHERE model_version = ? AND date = ? AND quadkey = ?",
+                    (model_version, date, prefix),
+                )
+            else:
+                # Descendants of the block at zoom z: keys from prefix+'0...' up to prefix+'3...'
+                rows = conn.execute(
+                    "SELECT z, x, y, probs FROM tiles WHERE model_version = ? AND date = ? "
+                    "AND quadkey >= ? AND quadkey < ? AND z = ?",
+                    (model_version, date, prefix + "0", prefix + "4", z),
+                )
+            for tz, tx, ty, blob in rows:
+                found[(tz, tx, ty)] = np.frombuffer(blob, dtype="<f4")
+        return found
+
+    def put_many(self, model_version: str, date: str, tiles: Iterable[Tuple[Tile, np.ndarray]]) -> int:
+        now = time.time()
+        rows = [
+            (model_version, date, tile_quadkey(z, x, y), z, x, y,
+             np.asarray(probs, dtype="<f4").tobytes(), now)
+            for (z, x, y), probs in tiles
+        ]
+        if rows:
+            conn = self._connect()
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def stats(self) -> Dict[str, int]:
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM tiles").fetchone()
+        return {"tiles": count}
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def fetch_tile(z: int, x: int, y: int, date: str) -> bytes:
+    """Imagery for one tile from ``TILE_SOURCE_URL`` ({z}, {x}, {y} and {date} placeholders)."""
+    url = settings.TILE_SOURCE_URL.format(z=z, x=x, y=y, date=date)
+    with urllib.request.urlopen(url, timeout=settings.TILE_FETCH_TIMEOUT) as response:
+        data = response.read(settings.MAX_FILE_SIZE + 1)
+    if len(data) > settings.MAX_FILE_SIZE:
+        raise ValueError(f"Tile {z}/{x}/{y} exceeds MAX_FILE_SIZE")
+    return data
+
+
+_store: Optional[TileStore] = None
+_store_lock = threading.Lock()
+
+
+def get_tile_store() -> TileStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TileStore(settings.TILE_STORE_PATH)
+    return _store
+
+
+def close_tile_store():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
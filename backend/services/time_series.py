@@ -0,0 +1,154 @@
+"""
+Incremental multi-date analysis of one location.
+
+A series is a date-ordered list of classified observations plus one step
+record per consecutive pair (change detection, impact, velocity and the
+three-point acceleration used by ``TimeSeriesAnalyzer``). The state is a
+plain dict, so it can live in the cache between requests.
+
+Step ``i`` covers observations ``i-1 -> i`` and its acceleration also reads
+observation ``i-2``. Merging new observations therefore only recomputes the
+steps from the first changed index onward. Appending dates after the last
+observation computes just the new steps; a date inserted in the middle
+recomputes the tail from that date.
+"""
+from datetime import date
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from src.ml_modules.advanced_change_detection import (
+    AdvancedChangeDetector, TimeSeriesAnalyzer, IMPACT_TYPES
+)
+
+
+def parse_observation_date(value: str) -> Tuple[str, float]:
+    """``YYYY`` or ISO ``YYYY-MM-DD`` -> (normalised label, fractional year).
+
+    Raises ValueError on anything else.
+    """
+    value = value.strip()
+    if len(value) == 4 and value.isdigit():
+        return value, float(value)
+    day = date.fromisoformat(value)
+    year_start = date(day.year, 1, 1)
+    days_in_year = (date(day.year + 1, 1, 1) - year_start).days
+    return day.isoformat(), day.year + (day - year_start).days / days_in_year
+
+
+def new_series(series_id: str, model_version: str) -> Dict[str, Any]:
+    return {'series_id': series_id, 'model_version': model_version, 'observations': [], 'steps': []}
+
+
+def make_observation(label: str, t: float, digest: str, pred_class: str, confidence: float,
+                     probs: Sequence[float]) -> Dict[str, Any]:
+    return {
+        'date': label,
+        # 'year' is fractional so TimeSeriesAnalyzer.acceleration sees exact spacing
+        'year': t,
+        'digest': digest,
+        'pred_class': pred_class,
+        'confidence': float(confidence),
+        'probs': np.asarray(probs, dtype=float).tolist(),
+    }
+
+
+def merge_observations(state: Dict[str, Any], observations: List[Dict[str, Any]],
+                       detector: AdvancedChangeDetector) -> int:
+    """Insert or replace observations by date and recompute the affected tail of steps.
+
+    An observation whose date and image digest are already present is
+    ignored. Returns the number of steps recomputed.
+    """
+    existing = {obs['date']: i for i, obs in enumerate(state['observations'])}
+    merged = list(state['observations'])
+    first_changed = len(merged)
+    for obs in observations:
+        index = existing.get(obs['date'])
+        if index is not None:
+            if merged[index]['digest'] == obs['digest']:
+                continue
+            merged[index] = obs
+        else:
+            merged.append(obs)
+        first_changed = min(first_changed, _position(merged, obs))
+    merged.sort(key=lambda o: o['year'])
+
+    state['observations'] = merged
+    start = max(1, first_changed)
+    state['steps'] = state['steps'][:start - 1] + _compute_steps(merged, start, detector)
+    return max(0, len(merged) - start)
+
+
+def _position(observations: List[Dict[str, Any]], obs: Dict[str, Any]) -> int:
+    """Index ``obs`` will have once ``observations`` is sorted by time."""
+    return sum(1 for other in observations if other['year'] < obs['year'])
+
+
+def _compute_steps(observations: List[Dict[str, Any]], start: int,
+                   detector: AdvancedChangeDetector) -> List[Dict[str, Any]]:
+    """Step records for observation indices ``start..n-1``, change detection vectorized."""
+    n = len(observations)
+    if start >= n:
+        return []
+    probs = np.array([obs['probs'] for obs in observations[start - 1:]])
+    changes = detector.detect_changes_batch(probs[:-1], probs[1:], include_difference=False)
+    impact = detector.analyze_impact_batch(changes)
+    # Total variation distance between consecutive class distributions
+    shift = 0.5 * np.abs(probs[1:] - probs[:-1]).sum(axis=1)
+
+    steps = []
+    for k, i in enumerate(range(start, n)):
+        before, after = observations[i - 1], observations[i]
+        years = after['year'] - before['year']
+        acceleration = TimeSeriesAnalyzer.acceleration(observations[i - 2:i + 1]) if i >= 2 else 0
+        magnitude = float(changes['change_magnitude'][k])
+        steps.append({
+            'from_date': before['date'],
+            'to_date': after['date'],
+            'years': round(years, 4),
+            'before_class': before['pred_class'],
+            'after_class': after['pred_class'],
+            'is_significant_change': bool(changes['is_significant_change'][k]),
+            'change_magnitude': magnitude,
+            'impact_type': IMPACT_TYPES[impact['impact_type'][k]],
+            'impact_score': float(impact['impact_score'][k]),
+            'velocity': magnitude / years if years > 0 else 0.0,
+            'distribution_shift': float(shift[k]),
+            'acceleration': acceleration,
+            'trend': TimeSeriesAnalyzer.trend_label(acceleration),
+        })
+    return steps
+
+
+def summarize(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Series-level figures derived from the stored observations and steps."""
+    observations, steps = state['observations'], state['steps']
+    classes = [obs['pred_class'] for obs in observations]
+    summary: Dict[str, Any] = {
+        'observations': len(observations),
+        'class_sequence': classes,
+    }
+    if len(observations) < 2:
+        summary['status'] = 'insufficient_data'
+        return summary
+
+    span = observations[-1]['year'] - observations[0]['year']
+    total_change = sum(step['change_magnitude'] for step in steps)
+    values, counts = np.unique(classes, return_counts=True)
+    latest = steps[-1]
+    summary.update({
+        'status': 'success',
+        'date_range_years': round(span, 4),
+        'average_velocity': total_change / span if span > 0 else 0.0,
+        'latest_velocity': latest['velocity'],
+        'latest_acceleration': latest['acceleration'],
+        'trend': latest['trend'],
+        'dominant_land_type': str(values[counts.argmax()]),
+        'significant_transitions': [
+            {k: step[k] for k in ('from_date', 'to_date', 'before_class', 'after_class', 'impact_type')}
+            for step in steps if step['is_significant_change']
+        ],
+        'temporal_stability': 'stable' if len(values) <= 2 else 'dynamic',
+    })
+    return summary
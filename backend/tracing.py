@@ -0,0 +1,371 @@
+"""
+Per-request tracing spans and an opt-in sampling profiler.
+
+``TracingMiddleware`` opens a trace for every HTTP request (reusing an incoming
+``X-Trace-Id``) and returns the id plus a ``Server-Timing`` breakdown on the
+response. Code under the request opens spans with ``span()`` or the ``traced``
+decorator; the current trace lives in contextvars, so it follows the request
+into ``run_in_threadpool``/``asyncio.to_thread`` workers. Slow traces are kept
+in a small ring buffer and logged with their span breakdown.
+
+Profiling is opt-in per request: with ``PROFILING_HEADER_ENABLED`` a client can
+send ``X-Profile: 1``, or an operator can arm the next N requests through
+``/debug/profiling``. A sampler thread then reads ``sys._current_frames()`` for
+the threads currently running that request's spans and aggregates collapsed
+stacks (flamegraph.pl / speedscope input), served at ``/debug/profile/{trace_id}``.
+"""
+import asyncio
+import collections
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+from .config import settings
+
+logger = structlog.get_logger()
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# Server-Timing metric names must be HTTP tokens
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9!#$%&'*+\-.^_`|~]")
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    thread_id: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+
+class Trace:
+    """Spans recorded for one request, plus profiler samples when profiling."""
+
+    def __init__(self, trace_id: str, name: str, profile: bool = False):
+        self.trace_id = trace_id
+        self.name = name
+        self.profile = profile
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.samples: Dict[str, int] = collections.Counter()
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _enter_thread(self, thread_id: int):
+        with self._lock:
+            self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+
+    def _exit_thread(self, thread_id: int):
+        with self._lock:
+            remaining = self._threads.get(thread_id, 0) - 1
+            if remaining > 0:
+                self._threads[thread_id] = remaining
+            else:
+                self._threads.pop(thread_id, None)
+
+    def active_threads(self) -> List[int]:
+        with self._lock:
+            return list(self._threads)
+
+    @property
+    def duration_ms(self) -> float:
+        root = self.spans[0] if self.spans else None
+        return root.duration_ms if root is not None else (time.perf_counter() - self.start) * 1000.0
+
+    def server_timing(self, limit: int = 12) -> str:
+        """``Server-Timing`` header value: total time per span name, slowest first."""
+        totals: Dict[str, float] = collections.defaultdict(float)
+        for s in self.spans[1:]:
+            totals[s.name] += s.duration_ms
+        parts = [f"total;dur={self.duration_ms:.1f}"]
+        for name, duration in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]:
+            parts.append(f"{_TOKEN_UNSAFE.sub('_', name)};dur={duration:.1f}")
+        return ", ".join(parts)
+
+    def collapsed_stacks(self) -> str:
+        """Profiler samples in collapsed-stack format (``frame;frame;frame count``)."""
+        return "\n".join(f"{stack} {count}" for stack, count in
+                         sorted(self.samples.items(), key=lambda item: item[1], reverse=True))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "profiled": self.profile,
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "offset_ms": round((s.start - self.start) * 1000.0, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "thread_id": s.thread_id,
+                    "attributes": s.attributes,
+                    "error": s.error,
+                }
+                for s in self.spans
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Record a span under the current trace; a no-op outside a traced request."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    thread_id = threading.get_ident()
+    s = Span(
+        name=name,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start=time.perf_counter(),
+        thread_id=thread_id,
+        attributes=attributes,
+    )
+    trace.spans.append(s)
+    trace._enter_thread(thread_id)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+        trace._exit_thread(thread_id)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator wrapping a sync or async function in a span named after it."""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def add_trace_context(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """structlog processor adding the current trace and span ids."""
+    trace = _current_trace.get()
+    if trace is not None:
+        event_dict.setdefault("trace_id", trace.trace_id)
+        current = _current_span.get()
+        if current is not None:
+            event_dict.setdefault("span_id", current.span_id)
+    return event_dict
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads working on profiled traces.
+
+    A single daemon thread runs only while at least one profiled request is in
+    flight. The event-loop thread is shared with other requests, so its samples
+    can include their work; thread-pool stages (decode, forward, Grad-CAM,
+    area) run on threads owned by the request and are attributed exactly.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._traces: Dict[str, Trace] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    def start(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, trace: Trace):
+        with self._lock:
+            self._traces.pop(trace.trace_id, None)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _collapse(self, frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                traces = list(self._traces.values())
+                if not traces:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for trace in traces:
+                for thread_id in trace.active_threads():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own_id:
+                        trace.samples[self._collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfilingControl:
+    """Operator toggle: profile the next N requests without a restart."""
+
+    def __init__(self):
+        self._remaining = 0
+        self._lock = threading.Lock()
+
+    def arm(self, requests: int):
+        with self._lock:
+            self._remaining = max(0, requests)
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        if settings.PROFILING_HEADER_ENABLED and headers.get(b"x-profile", b"").lower() in (b"1", b"true", b"yes"):
+            return True
+        if self._remaining <= 0:
+            return False
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+
+class TraceStore:
+    """Ring buffers of recent slow traces and of captured profiles."""
+
+    def __init__(self, max_traces: int = 100, max_profiles: int = 20):
+        self.traces: "collections.OrderedDict[str, Trace]" = collections.OrderedDict()
+        self.profiles: "collections.OrderedDict[str, Trace]" = collections.OrderedDict()
+        self.max_traces = max_traces
+        self.max_profiles = max_profiles
+
+    @staticmethod
+    def _put(buffer: "collections.OrderedDict[str, Trace]", trace: Trace, limit: int):
+        buffer[trace.trace_id] = trace
+        buffer.move_to_end(trace.trace_id)
+        while len(buffer) > limit:
+            buffer.popitem(last=False)
+
+    def add(self, trace: Trace):
+        self._put(self.traces, trace, self.max_traces)
+        if trace.profile:
+            self._put(self.profiles, trace, self.max_profiles)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return self.traces.get(trace_id) or self.profiles.get(trace_id)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a trace per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"x-trace-id", b"").decode("latin-1")
+        trace_id = incoming if re.fullmatch(r"[A-Za-z0-9\-]{8,64}", incoming or "") else uuid.uuid4().hex
+        trace = Trace(trace_id, f"{scope['method']} {scope['path']}", profile=profiling_control.should_profile(headers))
+
+        trace_token = _current_trace.set(trace)
+        if trace.profile:
+            profiler.start(trace)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                extra = [(b"x-trace-id", trace.trace_id.encode())]
+                if settings.SERVER_TIMING_ENABLED:
+                    extra.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            with span("request", method=scope["method"], path=scope["path"]):
+                await self.app(scope, receive, send_with_trace)
+        finally:
+            if trace.profile:
+                profiler.stop(trace)
+            _current_trace.reset(trace_token)
+            self._finish(trace)
+
+    @staticmethod
+    def _finish(trace: Trace):
+        if trace.duration_ms >= settings.TRACE_SLOW_THRESHOLD_MS or trace.profile:
+            trace_store.add(trace)
+        if trace.duration_ms >= settings.TRACE_SLOW_THRESHOLD_MS:
+            logger.warning(
+                "Slow request",
+                trace_id=trace.trace_id,
+                request=trace.name,
+                duration_ms=round(trace.duration_ms, 1),
+                server_timing=trace.server_timing(),
+            )
+
+
+profiler = SamplingProfiler(interval=settings.PROFILER_INTERVAL_MS / 1000.0)
+profiling_control = ProfilingControl()
+trace_store = TraceStore(max_traces=settings.TRACE_BUFFER_SIZE, max_profiles=settings.PROFILE_BUFFER_SIZE)
@@ -0,0 +1,322 @@
+"""
+Streaming multipart parser for image uploads.
+
+The request body is consumed chunk by chunk with python-multipart instead of
+being spooled by Starlette first. Each file part is checked as it arrives:
+
+- the declared ``Content-Length`` is compared against the size budget before
+  any byte is read;
+- the file extension and the magic bytes of the first chunk must name an
+  allowed image type (415 otherwise);
+- the image header is parsed as soon as it is complete, so oversized
+  dimensions are rejected before the pixel data arrives;
+- a part exceeding ``MAX_FILE_SIZE`` aborts the upload with 413.
+
+Content is SHA-256 hashed while streaming, so cache keys are ready the moment
+the body ends. Memory per upload is bounded by the expected files times
+``MAX_FILE_SIZE`` plus a small allowance for text fields.
+"""
+import hashlib
+import io
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from PIL import Image
+from .config import settings
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13 ships the module as "multipart"
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Text form fields (years, options) are tiny; anything larger is not a form we accept
+MAX_FIELD_SIZE = 64 * 1024
+
+# Magic bytes -> (format name, extensions that may carry it)
+_SIGNATURES: Sequence[Tuple[bytes, str, Tuple[str, ...]]] = (
+    (b"\xff\xd8\xff", "JPEG", (".jpg", ".jpeg")),
+    (b"\x89PNG\r\n\x1a\n", "PNG", (".png",)),
+    (b"II*\x00", "TIFF", (".tif", ".tiff")),
+    (b"MM\x00*", "TIFF", (".tif", ".tiff")),
+)
+_MAGIC_BYTES = max(len(sig) for sig, _, _ in _SIGNATURES)
+
+
+def sniff_image_format(head: bytes) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """Identify an image type from its leading bytes."""
+    for signature, fmt, extensions in _SIGNATURES:
+        if head.startswith(signature):
+            return fmt, extensions
+    return None
+
+
+@dataclass
+class StreamedFile:
+    """A file part received in full and validated."""
+
+    field_name: str
+    filename: str
+    content_type: Optional[str]
+    data: bytes
+    sha256: str
+    format: str
+    width: int
+    height: int
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def pair_digest(before: StreamedFile, after: StreamedFile) -> str:
+    """Digest of an image pair; model routing and cache keys of every pair endpoint use it."""
+    return hashlib.sha256(f"{before.sha256}:{after.sha256}".encode()).hexdigest()
+
+
+@dataclass
+class _FilePart:
+    field_name: str
+    filename: str
+    content_type: Optional[str]
+    buffer: bytearray = field(default_factory=bytearray)
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256)
+    format: Optional[str] = None
+    extensions: Tuple[str, ...] = ()
+    size: Optional[Tuple[int, int]] = None
+    next_probe: int = 64
+
+
+class ImageUploadParser:
+    """Callback state for one streamed multipart body.
+
+    ``file_fields`` are sent once each; ``stack_field`` (optional) may repeat
+    up to ``max_stack`` times and is collected in arrival order.
+    """
+
+    def __init__(self, file_fields: Sequence[str], max_file_size: int,
+                 allowed_types: Sequence[str], max_pixels: int,
+                 stack_field: Optional[str] = None, max_stack: int = 0):
+        self.file_fields = set(file_fields)
+        self.max_file_size = max_file_size
+        self.allowed_types = {t.lower() for t in allowed_types}
+        self.max_pixels = max_pixels
+        self.stack_field = stack_field
+        self.max_stack = max_stack
+        self.files: Dict[str, StreamedFile] = {}
+        self.stack: List[StreamedFile] = []
+        self.fields: Dict[str, str] = {}
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._file: Optional[_FilePart] = None
+        self._field_name: Optional[str] = None
+        self._field_value = bytearray()
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._file = None
+        self._field_name = None
+        self._field_value = bytearray()
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if (name in self.file_fields or name == self.stack_field) and filename is not None:
+            filename = os.path.basename(filename.decode("utf-8", "replace"))
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in self.allowed_types:
+                raise HTTPException(status_code=415, detail=f"'{name}': unsupported file type '{extension or filename}'")
+            if name in self.files:
+                raise HTTPException(status_code=400, detail=f"'{name}' was sent more than once")
+            if name == self.stack_field and len(self.stack) >= self.max_stack:
+                raise HTTPException(status_code=413, detail=f"At most {self.max_stack} '{name}' files per request")
+            content_type = self._headers.get(b"content-type")
+            self._file = _FilePart(name, filename, content_type.decode("latin-1") if content_type else None)
+        elif filename is not None:
+            raise HTTPException(status_code=400, detail=f"Unexpected file field '{name}'")
+        else:
+            self._field_name = name
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        part = self._file
+        if part is None:
+            self._field_value.extend(chunk)
+            if len(self._field_value) > MAX_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Form field '{self._field_name}' is too large")
+            return
+
+        if len(part.buffer) + len(chunk) > self.max_file_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"'{part.field_name}' exceeds the {self.max_file_size // (1024 * 1024)}MB limit",
+            )
+        part.buffer.extend(chunk)
+        part.hasher.update(chunk)
+
+        if part.format is None and len(part.buffer) >= _MAGIC_BYTES:
+            self._check_magic(part)
+        if part.format is not None and part.size is None and len(part.buffer) >= part.next_probe:
+            self._probe_header(part)
+
+    def _check_magic(self, part: _FilePart):
+        sniffed = sniff_image_format(bytes(part.buffer[:_MAGIC_BYTES]))
+        if sniffed is None:
+            raise HTTPException(status_code=415, detail=f"'{part.field_name}' is not a JPEG, PNG or TIFF image")
+        fmt, extensions = sniffed
+        if not self.allowed_types.intersection(extensions):
+            raise HTTPException(status_code=415, detail=f"'{part.field_name}': {fmt} uploads are not allowed")
+        part.format, part.extensions = fmt, extensions
+
+    def _probe_header(self, part: _FilePart):
+        """Read the dimensions once the header is complete; retried at doubling sizes."""
+        try:
+            with Image.open(io.BytesIO(part.buffer)) as image:
+                part.size = image.size
+        except Image.DecompressionBombError:
+            raise HTTPException(status_code=413, detail=f"'{part.field_name}' has too many pixels")
+        except Exception:
+            part.next_probe = len(part.buffer) * 2
+            return
+        width, height = part.size
+        if width * height > self.max_pixels:
+            raise HTTPException(
+                status_code=413,
+                detail=f"'{part.field_name}' is {width}x{height}; images are limited to {self.max_pixels} pixels",
+            )
+
+    def _on_part_end(self):
+        part = self._file
+        if part is None:
+            if self._field_name:
+                self.fields[self._field_name] = self._field_value.decode("utf-8", "replace")
+            return
+
+        if not part.buffer:
+            raise HTTPException(status_code=400, detail=f"'{part.field_name}' is empty")
+        if part.format is None:
+            self._check_magic(part)
+        if part.size is None:
+            self._probe_header(part)
+        if part.size is None:
+            raise HTTPException(status_code=415, detail=f"'{part.field_name}' has an unreadable image header")
+        streamed = StreamedFile(
+            field_name=part.field_name,
+            filename=part.filename,
+            content_type=part.content_type,
+            data=bytes(part.buffer),
+            sha256=part.hasher.hexdigest(),
+            format=part.format,
+            width=part.size[0],
+            height=part.size[1],
+        )
+        if part.field_name == self.stack_field:
+            self.stack.append(streamed)
+        else:
+            self.files[part.field_name] = streamed
+        self._file = None
+
+
+async def parse_image_upload(
+    request: Request,
+    file_fields: Sequence[str],
+    max_file_size: Optional[int] = None,
+    allowed_types: Optional[List[str]] = None,
+    max_pixels: Optional[int] = None,
+) -> Tuple[Dict[str, StreamedFile], Dict[str, str]]:
+    """Stream a multipart body, validating image parts as they arrive.
+
+    Args:
+        request: Incoming request whose body has not been read
+        file_fields: Names of the required file parts
+        max_file_size: Per-file byte limit (defaults to ``settings.MAX_FILE_SIZE``)
+        allowed_types: Allowed extensions (defaults to ``settings.ALLOWED_FILE_TYPES``)
+        max_pixels: Per-image pixel limit (defaults to ``settings.MAX_IMAGE_PIXELS``)
+
+    Returns:
+        (files by field name, text fields by name)
+    """
+    max_file_size = max_file_size or settings.MAX_FILE_SIZE
+    state = ImageUploadParser(
+        file_fields,
+        max_file_size,
+        allowed_types or settings.ALLOWED_FILE_TYPES,
+        max_pixels or settings.MAX_IMAGE_PIXELS,
+    )
+    await _stream_body(request, state, max_file_size * len(file_fields) + MAX_FIELD_SIZE)
+
+    missing = [name for name in file_fields if name not in state.files]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing file field(s): {', '.join(missing)}")
+    return state.files, state.fields
+
+
+async def parse_image_stack(
+    request: Request,
+    field_name: str,
+    max_files: int,
+    max_file_size: Optional[int] = None,
+    allowed_types: Optional[List[str]] = None,
+    max_pixels: Optional[int] = None,
+) -> Tuple[List[StreamedFile], Dict[str, str]]:
+    """Stream a multipart body carrying ``field_name`` repeated 1..``max_files`` times.
+
+    Same per-file validation as ``parse_image_upload``.
+
+    Returns:
+        (files in the order sent, text fields by name)
+    """
+    max_file_size = max_file_size or settings.MAX_FILE_SIZE
+    state = ImageUploadParser(
+        (),
+        max_file_size,
+        allowed_types or settings.ALLOWED_FILE_TYPES,
+        max_pixels or settings.MAX_IMAGE_PIXELS,
+        stack_field=field_name,
+        max_stack=max_files,
+    )
+    await _stream_body(request, state, max_file_size * max_files + MAX_FIELD_SIZE)
+
+    if not state.stack:
+        raise HTTPException(status_code=400, detail=f"Missing file field '{field_name}'")
+    return state.stack, state.fields
+
+
+async def _stream_body(request: Request, state: ImageUploadParser, budget: int):
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > budget:
+        raise HTTPException(status_code=413, detail="Upload is larger than the allowed total size")
+
+    parser = MultipartParser(boundary, state.callbacks(), max_size=budget)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > budget:
+            raise HTTPException(status_code=413, detail="Upload is larger than the allowed total size")
+        parser.write(chunk)
+    parser.finalize()
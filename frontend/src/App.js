@@ -509,12 +509,9 @@ const AestheticSatelliteApp = () => {
       }
       
       if (options?.withReport) {
-        const { before, after, analysis } = res;
+        // Reuses the analysis computed by /upload instead of sending the probabilities back
         const reportRes = await requestReport({
-          before_probs: before.probs,
-          after_probs: after.probs,
-          before_year: before.year,
-          after_year: after.year,
+          analysis_id: res.analysis_id,
           future_years: options.futureYears || 5,
           detail: options.reportDetail || 'Both'
         });
@@ -0,0 +1,88 @@
+"""
+Benchmark image decode + model-input preparation.
+
+Compares the previous path (full-resolution PIL decode followed by torchvision
+Resize/ToTensor/Normalize) with backend.services.preprocessing (JPEG draft
+decode, one uint8 resize, fused normalisation into a preallocated batch).
+
+Usage (from the project root):
+    python scripts/benchmark_preprocess.py
+    python scripts/benchmark_preprocess.py --images path/a.jpg path/b.png --repeat 20
+"""
+import argparse
+import io
+import pathlib
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend.services.preprocessing import IMG_SIZE, MEAN, STD, decode_image, to_input_tensor  # noqa: E402
+
+BASELINE = transforms.Compose([
+    transforms.Resize((IMG_SIZE, IMG_SIZE)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=MEAN.tolist(), std=STD.tolist()),
+])
+
+
+def baseline(data: bytes) -> torch.Tensor:
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    return BASELINE(image).unsqueeze(0)
+
+
+def fast(data: bytes, out: torch.Tensor) -> torch.Tensor:
+    return to_input_tensor([decode_image(data)], out=out)
+
+
+def synthetic(size: int, fmt: str) -> bytes:
+    # Smooth gradients plus noise compress like aerial imagery rather than pure noise
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([(x * 255 // size), (y * 255 // size), ((x + y) * 127 // size)], axis=-1)
+    pixels = np.clip(base + rng.integers(-20, 20, base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def timed(fn, repeat: int) -> float:
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", help="Image files to benchmark (default: synthetic JPEG/PNG)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.images:
+        cases = [(path, pathlib.Path(path).read_bytes()) for path in args.images]
+    else:
+        cases = [(f"synthetic {fmt} {size}px", synthetic(size, fmt))
+                 for fmt in ("JPEG", "PNG") for size in (512, 2048, 4096)]
+
+    out = torch.empty((1, 3, IMG_SIZE, IMG_SIZE), dtype=torch.float32)
+    print(f"{'image':<28}{'MP':>7}{'baseline ms':>14}{'fast ms':>10}{'ms/MP before':>15}{'ms/MP after':>14}{'max |diff|':>12}")
+    for name, data in cases:
+        with Image.open(io.BytesIO(data)) as image:
+            megapixels = image.width * image.height / 1e6
+        before = timed(lambda: baseline(data), args.repeat) * 1000
+        after = timed(lambda: fast(data, out), args.repeat) * 1000
+        diff = (baseline(data) - fast(data, out)).abs().max().item()
+        print(f"{name:<28}{megapixels:>7.1f}{before:>14.1f}{after:>10.1f}"
+              f"{before / megapixels:>15.2f}{after / megapixels:>14.2f}{diff:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
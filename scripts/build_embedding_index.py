@@ -0,0 +1,68 @@
+"""
+Build the /similar embedding index over the EuroSAT_RGB corpus.
+
+Each image is classified and embedded in one batched forward pass of the
+active model; the 512-d pooled features are stored as unit-norm float16
+under ids ``eurosat:<model_version>:<class>/<file>``, tagged with the model
+version. Images already embedded by that version are skipped, so an
+interrupted build can be resumed, and entries of other versions (and
+uploads) are kept. Re-run it after activating a new model.
+
+Usage (from the project root):
+    python scripts/build_embedding_index.py
+    python scripts/build_embedding_index.py --data data/EuroSAT_RGB --out backend/embeddings.npz --batch-size 128
+"""
+import argparse
+import os
+import pathlib
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend.config import settings  # noqa: E402
+from backend.services.embedding_index import EmbeddingIndex  # noqa: E402
+from backend.services.model_service import get_service  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=str(ROOT / "data" / "EuroSAT_RGB"), help="One directory per class")
+    parser.add_argument("--out", default=settings.EMBEDDING_INDEX_PATH)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=None, help="Images per class (default: all)")
+    args = parser.parse_args()
+
+    data = pathlib.Path(args.data)
+    svc = get_service()
+    model_version = svc.model_version
+    index = EmbeddingIndex.load(args.out) if os.path.exists(args.out) else EmbeddingIndex(path=args.out)
+    todo = []
+    for class_dir in sorted(p for p in data.iterdir() if p.is_dir()):
+        files = sorted(class_dir.glob("*.jpg"))[:args.limit]
+        todo.extend((f"eurosat:{model_version}:{class_dir.name}/{f.name}", class_dir.name, f) for f in files)
+    todo = [item for item in todo if item[0] not in index]
+    print(f"{len(index)} entries in {args.out}; embedding {len(todo)} images with model {model_version}")
+
+    started = time.perf_counter()
+    for start in range(0, len(todo), args.batch_size):
+        chunk = todo[start:start + args.batch_size]
+        batch, _ = svc.preprocess_batch([path.read_bytes() for _, _, path in chunk])
+        predictions, embeddings = svc.classify_and_embed(batch, model_version)
+        index.add(
+            [entry_id for entry_id, _, _ in chunk], embeddings,
+            [{'source': 'eurosat', 'model_version': model_version, 'label': label,
+              'path': str(path.relative_to(data)), 'pred_class': pred[0]}
+             for (_, label, path), pred in zip(chunk, predictions)],
+        )
+        done = start + len(chunk)
+        print(f"\r{done}/{len(todo)} images, {done / (time.perf_counter() - started):.0f} img/s", end="", flush=True)
+    print()
+
+    index.save(args.out)
+    print(f"Wrote {len(index)} entries ({index.stats()['bytes'] / 2**20:.1f} MiB of embeddings) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
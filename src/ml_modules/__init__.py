@@ -5,6 +5,9 @@ Machine Learning modules for land use classification and analysis.
 
 from .advanced_change_detection import AdvancedChangeDetector, TimeSeriesAnalyzer
 from .enhanced_area_detection import AreaCalculator
+from .dense_segmentation import DenseSegmenter, SegmentationResult
+from .change_mask import ChangeResult, diff_class_maps
+from .georeference import GeoReference, read_georeference
 from .environmental_report_generator import create_report_generator
 from .environmental_report_wrapper import create_report_generator as wrapper_create_report_generator
 
@@ -12,6 +15,12 @@ __all__ = [
     'AdvancedChangeDetector',
     'TimeSeriesAnalyzer', 
     'AreaCalculator',
+    'DenseSegmenter',
+    'SegmentationResult',
+    'ChangeResult',
+    'diff_class_maps',
+    'GeoReference',
+    'read_georeference',
     'create_report_generator',
     'wrapper_create_report_generator'
 ]
@@ -5,6 +5,46 @@ from typing import Dict, List, Tuple, Any
 import pandas as pd
 from datetime import datetime, timedelta
 
+# A change counts only when both argmax confidences exceed this
+CHANGE_THRESHOLD = 0.3
+
+# Distinct horizons whose transition-matrix powers are kept (oldest evicted first)
+TRANSITION_POWER_CACHE_SIZE = 128
+
+# (from classes, to classes) transitions that always count as severe degradation
+CRITICAL_TRANSITIONS = [
+    (['Forest'], ['AnnualCrop', 'Industrial', 'Highway', 'Residential']),
+    (['River', 'SeaLake'], ['AnnualCrop', 'Industrial', 'Highway', 'Residential']),
+    (['HerbaceousVegetation', 'Pasture'], ['Industrial', 'Highway']),
+]
+
+# Impact types in increasing order of severity; batch results index into this tuple
+IMPACT_TYPES = ('neutral', 'noteworthy_change', 'improvement', 'moderate_degradation', 'severe_degradation')
+IMPACT_DESCRIPTIONS = {
+    'neutral': "Minimal environmental impact: {before} → {after}",
+    'noteworthy_change': "Land use transition detected: {before} → {after}",
+    'improvement': "Environmental improvement: {before} → {after}",
+    'moderate_degradation': "Moderate environmental impact: {before} → {after}",
+    'severe_degradation': "Environmental degradation detected: {before} → {after}",
+}
+
+
+def describe_impact(impact_type: str, before_class: str, after_class: str, degradation: bool = False) -> str:
+    """Description used by ``analyze_environmental_impact`` for a significant change.
+
+    ``degradation`` marks the critical/strong-degradation branch, whose moderate
+    cases share the severe wording.
+    """
+    key = 'severe_degradation' if degradation else impact_type
+    return IMPACT_DESCRIPTIONS[key].format(before=before_class, after=after_class)
+
+def _as_numpy(probs) -> np.ndarray:
+    """NumPy view of a probability vector/array (torch tensors are detached to CPU)."""
+    if isinstance(probs, torch.Tensor):
+        probs = probs.detach().cpu().numpy()
+    probs = np.asarray(probs)
+    return probs if probs.dtype.kind == 'f' else probs.astype(np.float64)
+
 class AdvancedChangeDetector:
     """Advanced change detection with temporal modeling and trend analysis"""
     
@@ -28,6 +68,40 @@ class AdvancedChangeDetector:
             'Residential': 0.3,
             'Industrial': 0.1
         }
+        self._build_lookup_tables()
+    
+    def _build_lookup_tables(self):
+        """Per-class arrays shared by the single-pair and batch methods, computed once."""
+        n_classes = len(self.class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self.env_score_vector = np.array(
+            [self.environmental_scores.get(name, 0.5) for name in self.class_names], dtype=np.float64
+        )
+        # critical_matrix[i, j]: transition i -> j always counts as severe degradation
+        self.critical_matrix = np.zeros((n_classes, n_classes), dtype=bool)
+        index = self.class_index
+        for from_types, to_types in CRITICAL_TRANSITIONS:
+            for from_type in from_types:
+                for to_type in to_types:
+                    if from_type in index and to_type in index:
+                        self.critical_matrix[index[from_type], index[to_type]] = True
+        self.future_impact_labels = np.array(
+            [[self._calculate_future_impact(a, b) for b in self.class_names] for a in self.class_names],
+            dtype=object,
+        )
+        self._transition_powers: Dict[int, np.ndarray] = {}
+    
+    def transition_power(self, steps: int) -> np.ndarray:
+        """``transition_matrix ** steps``; row i is the distribution after ``steps`` years from class i."""
+        if steps < 0:
+            raise ValueError(f"steps must be non-negative, got {steps}")
+        power = self._transition_powers.get(steps)
+        if power is None:
+            power = np.linalg.matrix_power(self.transition_matrix, steps)
+            if len(self._transition_powers) >= TRANSITION_POWER_CACHE_SIZE:
+                self._transition_powers.pop(next(iter(self._transition_powers)))
+            self._transition_powers[steps] = power
+        return power
     
     def _initialize_transition_matrix(self) -> np.ndarray:
         """Initialize transition probability matrix between land types"""
@@ -55,30 +129,26 @@ class AdvancedChangeDetector:
     def detect_pixel_changes(self, before_probs: torch.Tensor, after_probs: torch.Tensor) -> Dict[str, Any]:
         """Detect changes at pixel level with confidence scoring"""
         
-        # Calculate probability differences
-        prob_diff = after_probs - before_probs
+        before_probs = _as_numpy(before_probs)
+        after_probs = _as_numpy(after_probs)
         
         # Find most likely transitions
-        before_class = torch.argmax(before_probs).item()
-        after_class = torch.argmax(after_probs).item()
-        
-        before_name = self.class_names[before_class]
-        after_name = self.class_names[after_class]
+        before_class = int(before_probs.argmax())
+        after_class = int(after_probs.argmax())
         
         # Calculate change confidence
-        before_conf = before_probs[before_class].item()
-        after_conf = after_probs[after_class].item()
+        before_conf = float(before_probs[before_class])
+        after_conf = float(after_probs[after_class])
         
         # Determine if significant change occurred
-        change_threshold = 0.3
-        is_significant = (before_class != after_class) and (before_conf > change_threshold) and (after_conf > change_threshold)
+        is_significant = (before_class != after_class) and (before_conf > CHANGE_THRESHOLD) and (after_conf > CHANGE_THRESHOLD)
         
         return {
-            'before_class': before_name,
-            'after_class': after_name,
+            'before_class': self.class_names[before_class],
+            'after_class': self.class_names[after_class],
             'before_confidence': before_conf,
             'after_confidence': after_conf,
-            'probability_difference': prob_diff.numpy(),
+            'probability_difference': after_probs - before_probs,
             'is_significant_change': is_significant,
             'change_magnitude': abs(before_conf - after_conf) if is_significant else 0
         }
@@ -89,34 +159,19 @@ class AdvancedChangeDetector:
         if not change_info['is_significant_change']:
             return {'impact_score': 0, 'impact_type': 'neutral', 'description': 'No significant change detected'}
         
-        before_score = self.environmental_scores.get(change_info['before_class'], 0.5)
-        after_score = self.environmental_scores.get(change_info['after_class'], 0.5)
-        
-        impact_score = after_score - before_score
-        magnitude = change_info['change_magnitude']
-        
-        # For significant land use changes, classify based on environmental scores
-        # rather than just the weighted impact to be more sensitive
-        raw_score_diff = abs(impact_score)
-        
-        # Check for specific high-impact transitions
         before_class = change_info['before_class']
         after_class = change_info['after_class']
+        before_idx = self.class_index.get(before_class)
+        after_idx = self.class_index.get(after_class)
         
-        # High-impact transitions that always require attention
-        critical_transitions = [
-            ('Forest', ['AnnualCrop', 'Industrial', 'Highway', 'Residential']),
-            (['River', 'SeaLake'], ['AnnualCrop', 'Industrial', 'Highway', 'Residential']),
-            (['HerbaceousVegetation', 'Pasture'], ['Industrial', 'Highway']),
-        ]
+        # Precomputed per-class scores and critical-transition table (unknown names score 0.5)
+        before_score = float(self.env_score_vector[before_idx]) if before_idx is not None else 0.5
+        after_score = float(self.env_score_vector[after_idx]) if after_idx is not None else 0.5
+        is_critical = (before_idx is not None and after_idx is not None
+                       and bool(self.critical_matrix[before_idx, after_idx]))
         
-        is_critical = False
-        for from_types, to_types in critical_transitions:
-            if isinstance(from_types, str):
-                from_types = [from_types]
-            if before_class in from_types and after_class in to_types:
-                is_critical = True
-                break
+        impact_score = after_score - before_score
+        magnitude = change_info['change_magnitude']
         
         # Weighted impact score (more sensitive thresholds)
         weighted_impact = impact_score * magnitude
@@ -216,6 +271,148 @@ class AdvancedChangeDetector:
         else:
             return 'stable'
     
+    def detect_changes_batch(self, before_probs: np.ndarray, after_probs: np.ndarray,
+                             include_difference: bool = True) -> Dict[str, np.ndarray]:
+        """Vectorized ``detect_pixel_changes`` for (..., C) probability arrays.
+
+        Accepts (N, C) pair matrices as well as (H, W, C) per-pixel maps from a
+        segmentation or tiling pass; every returned array has the leading shape
+        of the input, with class indices rather than names. Floating inputs
+        keep their dtype, so float32 maps are not doubled in memory. Pass
+        ``include_difference=False`` to skip the full (..., C) difference array.
+        """
+        before_probs = _as_numpy(before_probs)
+        after_probs = _as_numpy(after_probs)
+        if before_probs.shape != after_probs.shape or before_probs.shape[-1:] != (len(self.class_names),):
+            raise ValueError(
+                f"Expected two arrays of shape (..., {len(self.class_names)}), "
+                f"got {before_probs.shape} and {after_probs.shape}"
+            )
+        before_idx = before_probs.argmax(axis=-1)
+        after_idx = after_probs.argmax(axis=-1)
+        before_conf = np.take_along_axis(before_probs, before_idx[..., None], axis=-1)[..., 0]
+        after_conf = np.take_along_axis(after_probs, after_idx[..., None], axis=-1)[..., 0]
+        
+        is_significant = (before_idx != after_idx) & (before_conf > CHANGE_THRESHOLD) & (after_conf > CHANGE_THRESHOLD)
+        changes = {
+            'before_idx': before_idx,
+            'after_idx': after_idx,
+            'before_confidence': before_conf,
+            'after_confidence': after_conf,
+            'is_significant_change': is_significant,
+            'change_magnitude': np.where(is_significant, np.abs(before_conf - after_conf), 0.0),
+        }
+        if include_difference:
+            changes['probability_difference'] = after_probs - before_probs
+        return changes
+    
+    def analyze_impact_batch(self, changes: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Vectorized ``analyze_environmental_impact``.
+
+        ``impact_type`` holds indices into ``IMPACT_TYPES``; rows without a
+        significant change are neutral with a zero score. ``degradation`` marks
+        rows classified by the critical/strong-degradation rule (see
+        ``describe_impact``).
+        """
+        before_idx, after_idx = changes['before_idx'], changes['after_idx']
+        significant = changes['is_significant_change']
+        before_score = self.env_score_vector[before_idx]
+        after_score = self.env_score_vector[after_idx]
+        weighted = np.where(significant, (after_score - before_score) * changes['change_magnitude'], 0.0)
+        is_critical = self.critical_matrix[before_idx, after_idx] & significant
+        
+        degraded = significant & (is_critical | (weighted < -0.05))
+        impact_type = np.select(
+            [
+                ~significant,
+                degraded & (is_critical | (weighted < -0.15)),
+                degraded,
+                weighted < -0.01,
+                weighted > 0.01,
+                before_idx != after_idx,
+            ],
+            [0, 4, 3, 3, 2, 1],
+            default=0,
+        )
+        return {
+            'impact_score': weighted,
+            'impact_type': impact_type,
+            'before_env_score': before_score,
+            'after_env_score': after_score,
+            'is_critical': is_critical,
+            'degradation': degraded,
+        }
+    
+    def predict_future_trends_batch(self, changes: Dict[str, np.ndarray], years_passed: int,
+                                    future_years: int) -> Dict[str, np.ndarray]:
+        """Vectorized ``predict_future_trends``.
+
+        The per-year growth factor of the single-pair loop is a scalar that the
+        row normalisation cancels, so the distribution after ``future_years``
+        steps is simply row ``after_idx`` of ``transition_matrix ** future_years``.
+        Rows without a prediction have all-zero probabilities and zero confidence.
+        """
+        significant = changes['is_significant_change']
+        if years_passed <= 0:
+            significant = np.zeros_like(significant)
+        future_probs = self.transition_power(future_years)[changes['after_idx']]
+        future_probs = np.where(significant[..., None], future_probs, 0.0)
+        annual_change_rate = changes['change_magnitude'] / max(years_passed, 1)
+        confidence = np.where(significant, np.minimum(1.0, annual_change_rate * 2), 0.0)
+        return {
+            'future_probs': future_probs,
+            'confidence': confidence,
+            'has_prediction': significant,
+        }
+    
+    def summarize_transitions(self, changes: Dict[str, np.ndarray], impact: Dict[str, np.ndarray] = None,
+                              weights: np.ndarray = None, top: int = 10) -> Dict[str, Any]:
+        """Aggregate batch results into a before -> after transition table.
+
+        Args:
+            changes: Output of ``detect_changes_batch``
+            impact: Optional output of ``analyze_impact_batch`` for impact-type totals
+            weights: Optional per-element weights with the leading shape of
+                ``changes`` (e.g. pixel areas); counts are used otherwise
+            top: Number of largest significant transitions to list
+        """
+        n_classes = len(self.class_names)
+        significant = changes['is_significant_change'].ravel()
+        codes = changes['before_idx'].ravel() * n_classes + changes['after_idx'].ravel()
+        w = None if weights is None else np.broadcast_to(weights, changes['before_idx'].shape).ravel()
+        
+        # All elements: class composition before/after; significant ones: the transitions
+        matrix = np.bincount(codes[significant], weights=None if w is None else w[significant],
+                             minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+        totals = np.bincount(codes, weights=w, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+        total = float(totals.sum())
+        
+        order = np.argsort(-matrix, axis=None, kind='stable')[:top]
+        transitions = [
+            {
+                'from': self.class_names[i // n_classes],
+                'to': self.class_names[i % n_classes],
+                'amount': float(matrix.flat[i]),
+                'fraction': float(matrix.flat[i] / total) if total else 0.0,
+                'critical': bool(self.critical_matrix.flat[i]),
+                'environmental_impact': self.future_impact_labels.flat[i],
+            }
+            for i in order if matrix.flat[i] > 0
+        ]
+        summary = {
+            'total': total,
+            'changed': float(matrix.sum()),
+            'changed_fraction': float(matrix.sum() / total) if total else 0.0,
+            'before_totals': dict(zip(self.class_names, totals.sum(axis=1).tolist())),
+            'after_totals': dict(zip(self.class_names, totals.sum(axis=0).tolist())),
+            'transition_matrix': matrix,
+            'top_transitions': transitions,
+        }
+        if impact is not None:
+            impact_totals = np.bincount(impact['impact_type'].ravel(), weights=w, minlength=len(IMPACT_TYPES))
+            summary['impact_totals'] = dict(zip(IMPACT_TYPES, impact_totals.tolist()))
+        return summary
+    
     def generate_recommendations(self, environmental_impact: Dict[str, Any], future_trends: Dict[str, Any]) -> List[str]:
         """Generate AI-powered recommendations based on detected changes and predictions"""
         
@@ -357,22 +554,31 @@ class TimeSeriesAnalyzer:
         if len(self.historical_data) >= 3:
             # Calculate from last three observations
             recent_data = sorted(self.historical_data, key=lambda x: x['year'])[-3:]
-            if len(recent_data) == 3:
-                # Simple finite difference approximation
-                dt1 = recent_data[1]['year'] - recent_data[0]['year']
-                dt2 = recent_data[2]['year'] - recent_data[1]['year']
-                
-                if dt1 > 0 and dt2 > 0:
-                    v1 = (recent_data[1]['confidence'] - recent_data[0]['confidence']) / dt1
-                    v2 = (recent_data[2]['confidence'] - recent_data[1]['confidence']) / dt2
-                    acceleration = (v2 - v1) / ((dt1 + dt2) / 2)
+            acceleration = self.acceleration(recent_data)
         
         return {
             'velocity': velocity,
             'acceleration': acceleration,
-            'trend': 'accelerating' if acceleration > 0.01 else 'decelerating' if acceleration < -0.01 else 'stable'
+            'trend': self.trend_label(acceleration)
         }
     
+    @staticmethod
+    def acceleration(observations: List[Dict[str, Any]]) -> float:
+        """Finite-difference acceleration of confidence over three observations ordered by 'year'."""
+        if len(observations) != 3:
+            return 0
+        dt1 = observations[1]['year'] - observations[0]['year']
+        dt2 = observations[2]['year'] - observations[1]['year']
+        if dt1 <= 0 or dt2 <= 0:
+            return 0
+        v1 = (observations[1]['confidence'] - observations[0]['confidence']) / dt1
+        v2 = (observations[2]['confidence'] - observations[1]['confidence']) / dt2
+        return (v2 - v1) / ((dt1 + dt2) / 2)
+    
+    @staticmethod
+    def trend_label(acceleration: float) -> str:
+        return 'accelerating' if acceleration > 0.01 else 'decelerating' if acceleration < -0.01 else 'stable'
+    
     def generate_trend_report(self) -> Dict[str, Any]:
         """Generate comprehensive trend analysis report"""
         
@@ -0,0 +1,200 @@
+"""
+Change Mask Module
+Spatial comparison of two aligned class maps: transition matrix, change mask
+and connected change regions.
+
+Transitions are counted with one ``np.bincount`` over the combined label
+``before * C + after``. Maps are processed in row chunks, so the temporaries
+(codes, masks, weights) stay bounded however large the scene is. The change
+mask itself is one byte per element. Connected regions are labelled on that
+mask with OpenCV, and each region's dominant transition comes from one joint
+bincount over (region, transition).
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+# Rows per chunk; at 10 classes a 1024-row chunk of a 20k-wide scene needs ~80MB of temporaries
+DEFAULT_CHUNK_ROWS = 1024
+
+
+def _row_chunks(height: int, chunk_rows: int) -> Iterator[slice]:
+    for start in range(0, height, chunk_rows):
+        yield slice(start, min(start + chunk_rows, height))
+
+
+def _check_aligned(before_map: np.ndarray, after_map: np.ndarray):
+    if before_map.shape != after_map.shape:
+        raise ValueError(f"Class maps are not aligned: {before_map.shape} vs {after_map.shape}")
+
+
+def transition_matrix(before_map: np.ndarray, after_map: np.ndarray, n_classes: int,
+                      weights: Optional[np.ndarray] = None, mask: Optional[np.ndarray] = None,
+                      chunk_rows: int = DEFAULT_CHUNK_ROWS) -> np.ndarray:
+    """(C, C) matrix of summed weights (pixel counts by default) from class i to class j.
+
+    Args:
+        before_map, after_map: Aligned integer class maps (2-D, or 1-D for flat inputs)
+        n_classes: Number of classes C
+        weights: Optional per-element weights (e.g. pixel areas or cell sizes)
+        mask: Optional boolean mask of elements to count
+        chunk_rows: Rows processed per bincount
+    """
+    _check_aligned(before_map, after_map)
+    before_map, after_map = np.atleast_2d(before_map), np.atleast_2d(after_map)
+    if weights is not None:
+        weights = np.broadcast_to(np.atleast_2d(weights), before_map.shape)
+    if mask is not None:
+        mask = np.atleast_2d(mask)
+
+    n_codes = n_classes * n_classes
+    totals = np.zeros(n_codes, dtype=np.float64 if weights is not None else np.int64)
+    for rows in _row_chunks(before_map.shape[0], chunk_rows):
+        codes = before_map[rows].astype(np.int32, copy=False) * n_classes + after_map[rows]
+        chunk_weights = None if weights is None else weights[rows]
+        if mask is not None:
+            selected = mask[rows]
+            codes = codes[selected]
+            chunk_weights = None if chunk_weights is None else chunk_weights[selected]
+        counts = np.bincount(codes.ravel(), weights=None if chunk_weights is None else chunk_weights.ravel(),
+                             minlength=n_codes)
+        totals += counts.astype(totals.dtype, copy=False)
+    return totals.reshape(n_classes, n_classes)
+
+
+def change_mask(before_map: np.ndarray, after_map: np.ndarray, significant: Optional[np.ndarray] = None,
+                chunk_rows: int = DEFAULT_CHUNK_ROWS) -> np.ndarray:
+    """uint8 mask (1 = changed) where the classes differ, optionally restricted to ``significant``."""
+    _check_aligned(before_map, after_map)
+    out = np.empty(before_map.shape, dtype=np.uint8)
+    flat = out.ndim == 1
+    before_2d, after_2d, out_2d = (np.atleast_2d(a) for a in (before_map, after_map, out))
+    significant_2d = None if significant is None else np.atleast_2d(significant)
+    for rows in _row_chunks(before_2d.shape[0], chunk_rows):
+        changed = before_2d[rows] != after_2d[rows]
+        if significant_2d is not None:
+            changed &= significant_2d[rows]
+        out_2d[rows] = changed
+    return out_2d[0] if flat else out
+
+
+@dataclass
+class ChangeRegion:
+    """One connected group of changed elements."""
+
+    label: int
+    bbox: Tuple[int, int, int, int]  # x, y, width, height in map elements
+    centroid: Tuple[float, float]  # x, y
+    elements: int
+    weight: float  # summed weights (pixels if unweighted)
+    from_class: int  # dominant transition inside the region
+    to_class: int
+    purity: float  # share of the region's weight in the dominant transition
+
+
+@dataclass
+class ChangeResult:
+    transitions: np.ndarray  # (C, C) weights, including the unchanged diagonal
+    mask: np.ndarray  # uint8 change mask
+    regions: List[ChangeRegion] = field(default_factory=list)
+
+    @property
+    def changed_weight(self) -> float:
+        return float(self.transitions.sum() - np.trace(self.transitions))
+
+    @property
+    def changed_fraction(self) -> float:
+        total = self.transitions.sum()
+        return self.changed_weight / total if total else 0.0
+
+
+def change_regions(mask: np.ndarray, before_map: np.ndarray, after_map: np.ndarray, n_classes: int,
+                   weights: Optional[np.ndarray] = None, min_elements: int = 1,
+                   connectivity: int = 8, max_regions: Optional[int] = None) -> List[ChangeRegion]:
+    """Connected regions of ``mask`` (8-connected by default), largest first.
+
+    ``max_regions=None`` reports every region; 0 reports none.
+    """
+    if max_regions == 0:
+        return []
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        np.ascontiguousarray(mask, dtype=np.uint8), connectivity=connectivity, ltype=cv2.CV_32S
+    )
+    if count <= 1:
+        return []
+
+    selected = labels > 0
+    region_ids = labels[selected]
+    codes = before_map[selected].astype(np.int64) * n_classes + after_map[selected]
+    element_weights = None if weights is None else np.broadcast_to(weights, mask.shape)[selected]
+    n_codes = n_classes * n_classes
+    # Row r: weight of each transition inside region r
+    per_region = np.bincount(region_ids * n_codes + codes, weights=element_weights,
+                             minlength=count * n_codes).reshape(count, n_codes)
+    dominant = per_region.argmax(axis=1)
+    region_weight = per_region.sum(axis=1)
+
+    regions = []
+    for label in range(1, count):
+        x, y, w, h, elements = (int(v) for v in stats[label])
+        if elements < min_elements:
+            continue
+        code = int(dominant[label])
+        regions.append(ChangeRegion(
+            label=label,
+            bbox=(x, y, w, h),
+            centroid=(float(centroids[label][0]), float(centroids[label][1])),
+            elements=elements,
+            weight=float(region_weight[label]),
+            from_class=code // n_classes,
+            to_class=code % n_classes,
+            purity=float(per_region[label, code] / region_weight[label]) if region_weight[label] else 0.0,
+        ))
+    regions.sort(key=lambda r: r.weight, reverse=True)
+    return regions if max_regions is None else regions[:max_regions]
+
+
+def diff_class_maps(before_map: np.ndarray, after_map: np.ndarray, n_classes: int,
+                    weights: Optional[np.ndarray] = None, significant: Optional[np.ndarray] = None,
+                    min_region_elements: int = 1, max_regions: Optional[int] = None,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS) -> ChangeResult:
+    """Transition matrix, change mask and change regions for two aligned class maps.
+
+    Args:
+        before_map, after_map: Aligned 2-D integer class maps
+        n_classes: Number of classes
+        weights: Optional per-element weights (pixel areas, cell sizes)
+        significant: Optional boolean map; only these elements can count as changed
+        min_region_elements: Smallest region reported
+        max_regions: Report at most this many regions (largest first); None = all, 0 = none
+    """
+    _check_aligned(before_map, after_map)
+    transitions = transition_matrix(before_map, after_map, n_classes, weights=weights, chunk_rows=chunk_rows)
+    mask = change_mask(before_map, after_map, significant=significant, chunk_rows=chunk_rows)
+    regions = change_regions(mask, before_map, after_map, n_classes, weights=weights,
+                             min_elements=min_region_elements, max_regions=max_regions)
+    return ChangeResult(transitions=transitions, mask=mask, regions=regions)
+
+
+def region_summary(region: ChangeRegion, class_names: List[str], stride: int = 1,
+                   scale: float = 1.0, unit_area: float = 1.0) -> Dict[str, Any]:
+    """JSON-ready description of a region.
+
+    Args:
+        stride: Source pixels per map element along each axis (e.g. 32 for a segmentation grid)
+        scale: Further linear factor to source resolution (e.g. ``DecodedImage.scale``)
+        unit_area: Area per unit of region weight (e.g. km² per pixel)
+    """
+    factor = stride * scale
+    x, y, w, h = region.bbox
+    return {
+        'from_class': class_names[region.from_class],
+        'to_class': class_names[region.to_class],
+        'area': region.weight * unit_area,
+        'purity': region.purity,
+        'bbox': [round(x * factor), round(y * factor), round(w * factor), round(h * factor)],
+        'centroid': [(region.centroid[0] + 0.5) * factor, (region.centroid[1] + 0.5) * factor],
+    }
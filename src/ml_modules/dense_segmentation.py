@@ -0,0 +1,181 @@
+"""
+Dense Segmentation Module
+Per-pixel land-cover maps from the ResNet18 land-use classifier, without retraining.
+
+The classifier head is ``avgpool -> fc``. Both are linear, so applying ``fc`` as
+a 1x1 convolution at every layer4 location gives class logits per 32x32
+cell. The mean of those cell logits equals the image-level logits of the
+classifier. Large rasters are processed in overlapping windows aligned to the
+32-pixel stride; only each window's interior cells are kept, so window
+borders do not show in the map.
+
+Areas come from the cell grid directly: every cell stands for a known number
+of source pixels, so per-class pixel counts are one weighted ``np.bincount``
+over the grid. The full-resolution map is never materialised unless asked for.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Output stride of ResNet layer4
+STRIDE = 32
+
+# ImageNet normalisation, as applied to classifier inputs
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+_SCALE = (1.0 / (255.0 * _STD)).reshape(3, 1, 1)
+_SHIFT = (_MEAN / _STD).reshape(3, 1, 1)
+
+
+@dataclass
+class SegmentationResult:
+    """Class grid at ``STRIDE`` resolution for an (H, W) raster."""
+
+    class_grid: np.ndarray  # (gh, gw) int64 argmax class per cell
+    probs: np.ndarray  # (gh, gw, C) float32 softmax per cell
+    cell_pixels: np.ndarray  # (gh, gw) pixels of the raster each cell covers (edge cells are partial)
+    shape: Tuple[int, int]  # (H, W) of the segmented raster
+
+    def class_map(self) -> np.ndarray:
+        """(H, W) per-pixel class map (nearest upsampling of the grid)."""
+        height, width = self.shape
+        rows = np.repeat(self.class_grid, STRIDE, axis=0)[:height]
+        return np.repeat(rows, STRIDE, axis=1)[:, :width]
+
+    def pixel_counts(self, n_classes: int) -> np.ndarray:
+        """Pixels per class, identical to ``np.bincount(class_map().ravel())``."""
+        return np.bincount(self.class_grid.ravel(), weights=self.cell_pixels.ravel(), minlength=n_classes)
+
+
+class DenseSegmenter:
+    """Runs a torchvision ResNet classifier fully convolutionally over a raster."""
+
+    def __init__(self, model: nn.Module, window: int = 1024, overlap: int = 96, batch_size: int = 4):
+        """
+        Args:
+            model: ResNet classifier (``conv1`` .. ``layer4``, ``fc``) in eval mode
+            window: Interior size of each processing window in pixels (rounded to STRIDE)
+            overlap: Context added around each window in pixels (rounded to STRIDE)
+            batch_size: Windows of equal shape per forward pass
+        """
+        self.model = model
+        self.core_cells = max(1, window // STRIDE)
+        self.margin_cells = max(0, overlap // STRIDE)
+        self.batch_size = batch_size
+        self.backbone = nn.Sequential(
+            model.conv1, model.bn1, model.relu, model.maxpool,
+            model.layer1, model.layer2, model.layer3, model.layer4,
+        )
+        # fc as a 1x1 convolution over layer4 features
+        self.head_weight = model.fc.weight.detach()[:, :, None, None]
+        self.head_bias = model.fc.bias.detach()
+
+    @property
+    def n_classes(self) -> int:
+        return self.head_bias.shape[0]
+
+    def _windows(self, grid_h: int, grid_w: int) -> List[Tuple[slice, slice, slice, slice]]:
+        """(context rows, context cols, interior rows, interior cols) in grid cells."""
+        core, margin = self.core_cells, self.margin_cells
+        windows = []
+        for gy in range(0, grid_h, core):
+            for gx in range(0, grid_w, core):
+                y0, x0 = max(0, gy - margin), max(0, gx - margin)
+                y1, x1 = min(grid_h, gy + core + margin), min(grid_w, gx + core + margin)
+                windows.append((
+                    slice(y0, y1), slice(x0, x1),
+                    slice(gy - y0, min(gy + core, grid_h) - y0), slice(gx - x0, min(gx + core, grid_w) - x0),
+                ))
+        return windows
+
+    @torch.no_grad()
+    def logits(self, pixels: np.ndarray) -> np.ndarray:
+        """(C, gh, gw) float32 class logits per STRIDE cell for an (H, W, 3) uint8 raster."""
+        height, width = pixels.shape[:2]
+        grid_h, grid_w = math.ceil(height / STRIDE), math.ceil(width / STRIDE)
+        pad_h, pad_w = grid_h * STRIDE - height, grid_w * STRIDE - width
+        if pad_h or pad_w:
+            pixels = np.pad(pixels, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge")
+
+        out = np.empty((self.n_classes, grid_h, grid_w), dtype=np.float32)
+        groups: Dict[Tuple[int, int], list] = {}
+        for window in self._windows(grid_h, grid_w):
+            rows, cols = window[0], window[1]
+            groups.setdefault((rows.stop - rows.start, cols.stop - cols.start), []).append(window)
+
+        for (cells_h, cells_w), windows in groups.items():
+            for i in range(0, len(windows), self.batch_size):
+                chunk = windows[i:i + self.batch_size]
+                batch = torch.empty((len(chunk), 3, cells_h * STRIDE, cells_w * STRIDE), dtype=torch.float32)
+                array = batch.numpy()
+                for j, (rows, cols, _, _) in enumerate(chunk):
+                    view = pixels[rows.start * STRIDE:rows.stop * STRIDE, cols.start * STRIDE:cols.stop * STRIDE]
+                    np.multiply(view.transpose(2, 0, 1), _SCALE, out=array[j])
+                    np.subtract(array[j], _SHIFT, out=array[j])
+                cell_logits = F.conv2d(self.backbone(batch), self.head_weight, self.head_bias).numpy()
+                for j, (rows, cols, inner_rows, inner_cols) in enumerate(chunk):
+                    out[:, rows.start + inner_rows.start:rows.start + inner_rows.stop,
+                        cols.start + inner_cols.start:cols.start + inner_cols.stop] = \
+                        cell_logits[j][:, inner_rows, inner_cols]
+        return out
+
+    def segment(self, pixels: np.ndarray) -> SegmentationResult:
+        """Segment an (H, W, 3) uint8 raster (anything ``np.asarray`` accepts, e.g. DecodedImage)."""
+        pixels = np.asarray(pixels)
+        if pixels.ndim != 3 or pixels.shape[2] != 3:
+            raise ValueError("Image array must be RGB format (H, W, 3)")
+        height, width = pixels.shape[:2]
+        logits = self.logits(pixels)
+
+        # Softmax over classes, channels-last for per-cell probability vectors
+        logits -= logits.max(axis=0, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=0, keepdims=True)
+        probs = np.ascontiguousarray(logits.transpose(1, 2, 0))
+
+        grid_h, grid_w = probs.shape[:2]
+        row_pixels = np.minimum(STRIDE, height - np.arange(grid_h) * STRIDE)
+        col_pixels = np.minimum(STRIDE, width - np.arange(grid_w) * STRIDE)
+        return SegmentationResult(
+            class_grid=probs.argmax(axis=-1),
+            probs=probs,
+            cell_pixels=np.outer(row_pixels, col_pixels),
+            shape=(height, width),
+        )
+
+
+def dense_area_changes(before: SegmentationResult, after: SegmentationResult, class_names: List[str],
+                       area_calculator, before_scale: float = 1.0,
+                       after_scale: Optional[float] = None,
+                       before_cell_areas_m2: Optional[np.ndarray] = None,
+                       after_cell_areas_m2: Optional[np.ndarray] = None) -> Dict[str, Dict[str, float]]:
+    """Per-class areas before and after, from pixel counts times ``pixel_area_m2``.
+
+    Args:
+        area_calculator: ``AreaCalculator`` providing the pixel footprint
+        before_scale, after_scale: Linear factor from segmented to source
+            resolution (e.g. ``DecodedImage.scale``); counts scale by its square
+        before_cell_areas_m2, after_cell_areas_m2: Optional ground area of each
+            grid cell (e.g. ``GeoReference.cell_areas_m2``), replacing the fixed pixel size
+    """
+    after_scale = before_scale if after_scale is None else after_scale
+    before_areas = area_calculator.calculate_class_areas(
+        before.class_grid, class_names, before.cell_pixels * before_scale ** 2, before_cell_areas_m2)
+    after_areas = area_calculator.calculate_class_areas(
+        after.class_grid, class_names, after.cell_pixels * after_scale ** 2, after_cell_areas_m2)
+    return {
+        name: {
+            'before_area_km2': before_areas[name]['area_km2'],
+            'after_area_km2': after_areas[name]['area_km2'],
+            'change_km2': after_areas[name]['area_km2'] - before_areas[name]['area_km2'],
+            'before_percentage': before_areas[name]['percentage'],
+            'after_percentage': after_areas[name]['percentage'],
+        }
+        for name in class_names
+    }
@@ -7,6 +7,27 @@ import numpy as np
 from typing import Tuple, Optional
 
 
+def _uint8_threshold(threshold: float) -> int:
+    """Smallest uint8 value v with float32(v) / 255 > threshold.
+
+    Lets uint8 images be masked directly, with exactly the result of the
+    float path, instead of allocating a float32 copy of the whole image.
+    """
+    scaled = np.arange(256, dtype=np.float32) / 255.0
+    above = np.nonzero(scaled > threshold)[0]
+    return int(above[0]) if above.size else 256
+
+
+def _masked_area_m2(mask: np.ndarray, pixel_areas_m2: np.ndarray) -> float:
+    """Summed area of ``mask`` pixels given per-pixel areas broadcastable to it.
+
+    Per-row tables (H, 1) are applied to row counts, not pixel by pixel.
+    """
+    if pixel_areas_m2.ndim == 2 and pixel_areas_m2.shape[1] == 1:
+        return float(np.dot(mask.sum(axis=1), pixel_areas_m2[:, 0]))
+    return float(np.sum(mask * pixel_areas_m2))
+
+
 class AreaCalculator:
     """
     Calculator for estimating areas in satellite images.
@@ -22,12 +43,15 @@ class AreaCalculator:
         self.pixel_size_m = pixel_size_m
         self.pixel_area_m2 = pixel_size_m ** 2
     
-    def calculate_water_area(self, image_array: np.ndarray) -> dict:
+    def calculate_water_area(self, image_array: np.ndarray,
+                             pixel_areas_m2: Optional[np.ndarray] = None) -> dict:
         """
         Calculate water area in an image using simple color-based detection.
         
         Args:
             image_array: RGB image as numpy array (H, W, 3)
+            pixel_areas_m2: Optional per-pixel areas (e.g. a georeferenced
+                per-row table) used instead of the fixed pixel size
             
         Returns:
             Dictionary with water area information including area_km2, pixel_count, and confidence
@@ -35,25 +59,31 @@ class AreaCalculator:
         if len(image_array.shape) != 3 or image_array.shape[2] != 3:
             raise ValueError("Image array must be RGB format (H, W, 3)")
         
-        # Convert to float for calculations
-        img = image_array.astype(np.float32) / 255.0
+        if image_array.dtype == np.uint8:
+            # Compare channels in place; thresholds mapped to the equivalent uint8 value
+            red_channel, green_channel, blue_channel = (image_array[:, :, c] for c in range(3))
+            blue_threshold = _uint8_threshold(0.3) - 1
+        else:
+            # Convert to float for calculations
+            img = image_array.astype(np.float32) / 255.0
+            red_channel, green_channel, blue_channel = img[:, :, 0], img[:, :, 1], img[:, :, 2]
+            blue_threshold = 0.3
         
         # Simple water detection using blue channel dominance
         # Water typically has higher blue values compared to red and green
-        blue_channel = img[:, :, 2]
-        red_channel = img[:, :, 0]
-        green_channel = img[:, :, 1]
-        
         # Water mask: blue > red and blue > green, with minimum blue threshold
         water_mask = (
             (blue_channel > red_channel) & 
             (blue_channel > green_channel) & 
-            (blue_channel > 0.3)  # Minimum blue threshold
+            (blue_channel > blue_threshold)  # Minimum blue threshold
         )
         
         # Calculate area
         water_pixels = np.sum(water_mask)
-        water_area_m2 = water_pixels * self.pixel_area_m2
+        if pixel_areas_m2 is None:
+            water_area_m2 = water_pixels * self.pixel_area_m2
+        else:
+            water_area_m2 = _masked_area_m2(water_mask, pixel_areas_m2)
         water_area_km2 = water_area_m2 / 1_000_000  # Convert to km²
         
         # Calculate confidence based on how much of the image is detected as water
@@ -71,12 +101,15 @@ class AreaCalculator:
             'confidence': float(confidence)
         }
     
-    def calculate_vegetation_area(self, image_array: np.ndarray) -> dict:
+    def calculate_vegetation_area(self, image_array: np.ndarray,
+                                  pixel_areas_m2: Optional[np.ndarray] = None) -> dict:
         """
         Calculate vegetation area using NDVI-like approach.
         
         Args:
             image_array: RGB image as numpy array (H, W, 3)
+            pixel_areas_m2: Optional per-pixel areas (e.g. a georeferenced
+                per-row table) used instead of the fixed pixel size
             
         Returns:
             Dictionary with vegetation area information including area_km2, pixel_count, and confidence
@@ -84,24 +117,29 @@ class AreaCalculator:
         if len(image_array.shape) != 3 or image_array.shape[2] != 3:
             raise ValueError("Image array must be RGB format (H, W, 3)")
         
-        # Convert to float for calculations
-        img = image_array.astype(np.float32) / 255.0
+        if image_array.dtype == np.uint8:
+            red_channel, green_channel, blue_channel = (image_array[:, :, c] for c in range(3))
+            green_threshold = _uint8_threshold(0.4) - 1
+        else:
+            # Convert to float for calculations
+            img = image_array.astype(np.float32) / 255.0
+            red_channel, green_channel, blue_channel = img[:, :, 0], img[:, :, 1], img[:, :, 2]
+            green_threshold = 0.4
         
         # Simple vegetation detection using green channel dominance
-        green_channel = img[:, :, 1]
-        red_channel = img[:, :, 0]
-        blue_channel = img[:, :, 2]
-        
         # Vegetation mask: green dominant with minimum threshold
         vegetation_mask = (
             (green_channel > red_channel) & 
             (green_channel > blue_channel) & 
-            (green_channel > 0.4)  # Minimum green threshold
+            (green_channel > green_threshold)  # Minimum green threshold
         )
         
         # Calculate area
         vegetation_pixels = np.sum(vegetation_mask)
-        vegetation_area_m2 = vegetation_pixels * self.pixel_area_m2
+        if pixel_areas_m2 is None:
+            vegetation_area_m2 = vegetation_pixels * self.pixel_area_m2
+        else:
+            vegetation_area_m2 = _masked_area_m2(vegetation_mask, pixel_areas_m2)
         vegetation_area_km2 = vegetation_area_m2 / 1_000_000  # Convert to km²
         
         # Calculate confidence and percentage
@@ -117,12 +155,15 @@ class AreaCalculator:
             'confidence': float(confidence)
         }
     
-    def calculate_urban_area(self, image_array: np.ndarray) -> dict:
+    def calculate_urban_area(self, image_array: np.ndarray,
+                             pixel_areas_m2: Optional[np.ndarray] = None) -> dict:
         """
         Calculate urban/built-up area using brightness and color characteristics.
         
         Args:
             image_array: RGB image as numpy array (H, W, 3)
+            pixel_areas_m2: Optional per-pixel areas (e.g. a georeferenced
+                per-row table) used instead of the fixed pixel size
             
         Returns:
             Dictionary with urban area information including area_km2, pixel_count, and confidence
@@ -146,7 +187,10 @@ class AreaCalculator:
         
         # Calculate area
         urban_pixels = np.sum(urban_mask)
-        urban_area_m2 = urban_pixels * self.pixel_area_m2
+        if pixel_areas_m2 is None:
+            urban_area_m2 = urban_pixels * self.pixel_area_m2
+        else:
+            urban_area_m2 = _masked_area_m2(urban_mask, pixel_areas_m2)
         urban_area_km2 = urban_area_m2 / 1_000_000  # Convert to km²
         
         # Calculate confidence and percentage
@@ -162,6 +206,46 @@ class AreaCalculator:
             'confidence': float(confidence)
         }
     
+    def calculate_class_areas(self, class_map: np.ndarray, class_names: list,
+                              pixel_weights: Optional[np.ndarray] = None,
+                              element_areas_m2: Optional[np.ndarray] = None) -> dict:
+        """
+        Calculate per-class areas from a segmentation class map.
+        
+        Args:
+            class_map: Integer class index per pixel (or per cell), any shape
+            class_names: Names for class indices 0..C-1
+            pixel_weights: Optional source pixels represented by each element
+                (same shape as ``class_map``), e.g. cell sizes of a coarse grid
+            element_areas_m2: Optional ground area of each element (broadcastable
+                to ``class_map``); replaces pixel counts times the fixed pixel size
+            
+        Returns:
+            Dictionary per class with area_km2, pixel_count and percentage
+        """
+        counts = np.bincount(
+            class_map.ravel(),
+            weights=None if pixel_weights is None else pixel_weights.ravel(),
+            minlength=len(class_names),
+        )
+        total_pixels = counts.sum()
+        if element_areas_m2 is None:
+            areas_km2 = counts * self.pixel_area_m2 / 1_000_000
+        else:
+            areas_km2 = np.bincount(
+                class_map.ravel(),
+                weights=np.broadcast_to(element_areas_m2, class_map.shape).ravel(),
+                minlength=len(class_names),
+            ) / 1_000_000
+        return {
+            name: {
+                'area_km2': float(areas_km2[i]),
+                'pixel_count': int(round(counts[i])),
+                'percentage': float(counts[i] / total_pixels * 100) if total_pixels else 0.0,
+            }
+            for i, name in enumerate(class_names)
+        }
+    
     def get_pixel_area_km2(self) -> float:
         """Get the area covered by a single pixel in square kilometers."""
         return self.pixel_area_m2 / 1_000_000
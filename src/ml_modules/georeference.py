@@ -0,0 +1,165 @@
+"""
+Georeference Module
+Ground areas from a GeoTIFF's affine transform and CRS instead of a fixed pixel size.
+
+- Projected CRSs (UTM, national grids): every pixel has the planar area
+  ``|det(transform)|`` times the square of the CRS linear unit.
+- Geographic CRSs (degrees): pixel area depends on latitude only, so one
+  table of per-row areas describes the whole raster. Each row is an exact
+  ellipsoidal band area on WGS84.
+- Web Mercator: rows are converted back to latitude and measured the same way,
+  so the strong scale distortion away from the equator is removed.
+
+Tables are cached per layout (transform, raster size, output shape), so a
+scene or tile grid is measured once, whatever the number of pixels.
+"""
+
+import math
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.io import MemoryFile
+except ImportError:  # optional: uploads are treated as not georeferenced
+    rasterio = None
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+_E2 = WGS84_F * (2 - WGS84_F)
+_E = math.sqrt(_E2)
+_B2 = (WGS84_A * (1 - WGS84_F)) ** 2
+
+# Web Mercator is defined on a sphere of the WGS84 semi-major axis
+WEB_MERCATOR_EPSG = (3857, 3785, 900913)
+
+_TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+
+def _band_integral(lat_rad: np.ndarray) -> np.ndarray:
+    """Ellipsoidal area from the equator to ``lat_rad`` per radian of longitude."""
+    s = np.sin(lat_rad)
+    return 0.5 * _B2 * (s / (1 - _E2 * s * s) + np.log((1 + _E * s) / (1 - _E * s)) / (2 * _E))
+
+
+def latitude_band_area_m2(south: float, north: float, lon_width: float) -> float:
+    """WGS84 area in m² between two latitudes over ``lon_width`` degrees of longitude."""
+    edges = _band_integral(np.radians([south, north]))
+    return float(abs(edges[1] - edges[0]) * math.radians(lon_width))
+
+
+def _row_edge_latitudes(kind: str, top: float, step: float, rows: int) -> np.ndarray:
+    """Latitudes (radians) of the ``rows + 1`` row edges."""
+    edges = top + step * np.arange(rows + 1)
+    if kind == "mercator":
+        return 2 * np.arctan(np.exp(edges / WGS84_A)) - math.pi / 2
+    return np.radians(np.clip(edges, -90.0, 90.0))
+
+
+@lru_cache(maxsize=256)
+def _row_areas(kind: str, transform: Tuple[float, ...], unit_m: float, rows: int) -> np.ndarray:
+    """(rows, 1) read-only area in m² of one pixel in each row.
+
+    ``transform`` is (a, b, c, d, e, f) already scaled to the output shape.
+    """
+    a, b, c, d, e, f = transform
+    if kind == "projected":
+        areas = np.full((rows, 1), abs(a * e - b * d) * unit_m ** 2)
+    elif b == 0 and d == 0:
+        # North-up: each row is a latitude band of width |a| in longitude
+        lon_width = math.radians(abs(a)) if kind == "geographic" else abs(a) / WGS84_A
+        bands = np.abs(np.diff(_band_integral(_row_edge_latitudes(kind, f, e, rows))))
+        areas = (bands * lon_width)[:, None]
+    else:
+        # Rotated grids: local scale at each row centre along the first column
+        centers = _row_edge_latitudes(kind, f + e / 2, e, rows)[:-1] if kind == "mercator" else \
+            np.radians(f + d / 2 + e * (np.arange(rows) + 0.5))
+        det = abs(a * e - b * d)
+        if kind == "geographic":
+            areas = det * math.radians(1) ** 2 * _B2 * np.cos(centers) / (1 - _E2 * np.sin(centers) ** 2) ** 2
+        else:
+            areas = det * np.cos(centers) ** 2
+        areas = areas[:, None]
+    areas.flags.writeable = False
+    return areas
+
+
+@lru_cache(maxsize=256)
+def _cell_areas(geo: "GeoReference", shape: Tuple[int, int], stride: int) -> np.ndarray:
+    height, width = shape
+    rows = geo.pixel_areas_m2(shape)[:, 0]
+    band_areas = np.add.reduceat(rows, np.arange(0, height, stride))
+    col_pixels = np.minimum(stride, width - np.arange(0, width, stride))
+    cells = np.outer(band_areas, col_pixels)
+    cells.flags.writeable = False
+    return cells
+
+
+@dataclass(frozen=True)
+class GeoReference:
+    """Affine transform and CRS of a source raster of ``width`` x ``height`` pixels."""
+
+    transform: Tuple[float, float, float, float, float, float]  # a, b, c, d, e, f (rasterio order)
+    width: int
+    height: int
+    crs: str
+    kind: str  # projected | geographic | mercator
+    unit_m: float = 1.0  # metres per CRS linear unit (projected only)
+
+    def _scaled_transform(self, shape: Tuple[int, int]) -> Tuple[float, ...]:
+        a, b, c, d, e, f = self.transform
+        sy, sx = self.height / shape[0], self.width / shape[1]
+        return (a * sx, b * sy, c, d * sx, e * sy, f)
+
+    def pixel_areas_m2(self, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """(H, 1) area in m² of a pixel in each row, for a raster of ``shape``
+        covering this footprint (defaults to the source size). Broadcasts
+        against (H, W) maps.
+        """
+        shape = shape or (self.height, self.width)
+        return _row_areas(self.kind, self._scaled_transform(shape), self.unit_m, shape[0])
+
+    def cell_areas_m2(self, shape: Tuple[int, int], stride: int) -> np.ndarray:
+        """(ceil(H/stride), ceil(W/stride)) area in m² of each grid cell of ``stride``
+        pixels over a raster of ``shape``; edge cells are partial.
+        """
+        return _cell_areas(self, tuple(shape), stride)
+
+    @property
+    def total_area_m2(self) -> float:
+        return float(self.pixel_areas_m2().sum() * self.width)
+
+    @classmethod
+    def from_dataset(cls, dataset) -> Optional["GeoReference"]:
+        """From an open rasterio dataset; None if it carries no CRS or transform."""
+        if dataset.crs is None or dataset.transform.is_identity:
+            return None
+        crs = dataset.crs
+        if crs.is_geographic:
+            kind, unit_m = "geographic", 1.0
+        elif crs.to_epsg() in WEB_MERCATOR_EPSG:
+            kind, unit_m = "mercator", 1.0
+        else:
+            kind, unit_m = "projected", float(crs.linear_units_factor[1])
+        return cls(tuple(dataset.transform)[:6], dataset.width, dataset.height, crs.to_string(), kind, unit_m)
+
+
+def read_georeference(data: bytes) -> Optional[GeoReference]:
+    """GeoReference of an in-memory TIFF, or None for other formats, plain TIFFs,
+    or when rasterio is not installed.
+    """
+    if rasterio is None or data[:4] not in _TIFF_MAGIC:
+        return None
+    try:
+        with warnings.catch_warnings():
+            # Plain TIFFs are expected here and simply have no georeference
+            warnings.simplefilter("ignore", rasterio.errors.NotGeoreferencedWarning)
+            with MemoryFile(data) as memfile, memfile.open() as dataset:
+                return GeoReference.from_dataset(dataset)
+    except rasterio.errors.RasterioError:
+        return None
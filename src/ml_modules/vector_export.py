@@ -0,0 +1,227 @@
+"""
+Vector Export Module
+Change masks as GIS polygons, written feature by feature as GeoJSON or GeoPackage.
+
+Polygons are traced one connected change region at a time, inside the
+region's bounding box, so memory follows the largest region rather than the
+scene. Inside a region, each connected group of equal (from, to) transition
+becomes one feature. Its area and impact attributes are summed from the exact
+cells it covers (one ``np.bincount`` per region), not measured from the
+simplified outline. Geometry is traced in grid-cell units, simplified there
+(tolerance in cells, independent of the CRS) and only then mapped to the
+output coordinates.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import cv2
+
+try:
+    from affine import Affine
+    from rasterio import features as rio_features
+    from rasterio.warp import transform_geom
+    from shapely import affinity
+    from shapely.geometry import MultiPolygon, Polygon, box, mapping, shape
+except ImportError:  # optional: vector export is unavailable
+    rio_features = None
+
+try:
+    import fiona
+except ImportError:  # optional: GeoPackage output is unavailable
+    fiona = None
+
+FEATURE_SCHEMA = {
+    'geometry': 'MultiPolygon',
+    'properties': {
+        'region': 'int',
+        'transition': 'str',
+        'from_class': 'str',
+        'to_class': 'str',
+        'cells': 'int',
+        'area_km2': 'float',
+        'impact_type': 'str',
+        'impact_score': 'float',
+        'critical': 'bool',
+    },
+}
+
+
+def vector_export_available() -> bool:
+    return rio_features is not None
+
+
+def geopackage_available() -> bool:
+    return rio_features is not None and fiona is not None
+
+
+@dataclass
+class ChangeLayer:
+    """Per-cell change grids of one image pair plus how cells map to coordinates."""
+
+    before_map: np.ndarray  # (gh, gw) class index per cell
+    after_map: np.ndarray
+    mask: np.ndarray  # (gh, gw) uint8, 1 = changed
+    class_names: Sequence[str]
+    transform: Any  # Affine from grid cells to output coordinates
+    cell_areas_m2: np.ndarray  # (gh, gw)
+    extent: Tuple[float, float]  # (width, height) of the raster in cells; edge cells are clipped to it
+    crs: Optional[str] = None  # None: coordinates are source image pixels
+    impact_type: Optional[np.ndarray] = None  # (gh, gw) index into impact_labels
+    impact_score: Optional[np.ndarray] = None  # (gh, gw)
+    impact_labels: Sequence[str] = ()
+    critical: Optional[np.ndarray] = None  # (C, C) bool
+
+
+def grid_transform(geo, shape: Tuple[int, int], stride: int, scale: float = 1.0):
+    """Affine from grid cells of ``stride`` decoded pixels to CRS coordinates.
+
+    Without a georeference (``geo`` None) the target is source image pixels.
+    """
+    if rio_features is None:
+        raise RuntimeError("Vector export requires rasterio and shapely")
+    if geo is None:
+        return Affine.scale(stride * scale)
+    return Affine(*geo.transform) * Affine.scale(stride * geo.width / shape[1], stride * geo.height / shape[0])
+
+
+def _as_multipolygon(geom) -> Optional[MultiPolygon]:
+    if isinstance(geom, Polygon):
+        return None if geom.is_empty else MultiPolygon([geom])
+    if isinstance(geom, MultiPolygon):
+        return geom
+    polygons = [g for g in getattr(geom, 'geoms', ()) if isinstance(g, Polygon) and not g.is_empty]
+    return MultiPolygon(polygons) if polygons else None
+
+
+def iter_change_features(layer: ChangeLayer, simplify_tolerance: float = 0.5,
+                         min_cells: int = 1) -> Iterator[Dict[str, Any]]:
+    """GeoJSON-like features with geometry in ``layer.crs``, in region scan order;
+    each is yielded as soon as its region has been traced.
+
+    Args:
+        simplify_tolerance: Douglas-Peucker tolerance in grid cells (0 disables)
+        min_cells: Skip polygons covering fewer cells
+    """
+    if rio_features is None:
+        raise RuntimeError("Vector export requires rasterio and shapely")
+    n_classes = len(layer.class_names)
+    n_impacts = len(layer.impact_labels)
+    t = layer.transform
+    coefficients = [t.a, t.b, t.d, t.e, t.xoff, t.yoff]
+    extent = box(0, 0, *layer.extent)
+
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(
+        np.ascontiguousarray(layer.mask, dtype=np.uint8), connectivity=8, ltype=cv2.CV_32S
+    )
+    for label in range(1, count):
+        x, y, w, h, cells = (int(v) for v in stats[label])
+        if cells < min_cells:
+            continue
+        window = (slice(y, y + h), slice(x, x + w))
+        in_region = labels[window] == label
+        codes = layer.before_map[window].astype(np.int64) * n_classes + layer.after_map[window]
+        areas = layer.cell_areas_m2[window]
+        # Edge cells reach past the raster; only those regions need clipping
+        needs_clip = x + w > layer.extent[0] or y + h > layer.extent[1]
+        origin = Affine.translation(x, y)
+
+        for code in np.unique(codes[in_region]):
+            part = in_region & (codes == code)
+            parts, sub = cv2.connectedComponents(part.astype(np.uint8), connectivity=8, ltype=cv2.CV_32S)
+            flat = sub.ravel()
+            part_cells = np.bincount(flat, minlength=parts)
+            part_area = np.bincount(flat, weights=areas.ravel(), minlength=parts)
+            impact_idx = score = None
+            if layer.impact_type is not None and n_impacts:
+                # Impact type covering the largest area of each part, and the area-weighted score
+                impact_idx = np.bincount(
+                    flat * n_impacts + layer.impact_type[window].ravel(), weights=areas.ravel(),
+                    minlength=parts * n_impacts,
+                ).reshape(parts, n_impacts).argmax(axis=1)
+            if layer.impact_score is not None:
+                score = np.bincount(flat, weights=(areas * layer.impact_score[window]).ravel(), minlength=parts)
+                score = score / np.maximum(part_area, 1e-12)
+
+            from_idx, to_idx = int(code) // n_classes, int(code) % n_classes
+            from_name, to_name = layer.class_names[from_idx], layer.class_names[to_idx]
+            for geom, value in rio_features.shapes(sub, mask=part, connectivity=8, transform=origin):
+                index = int(value)
+                if part_cells[index] < min_cells:
+                    continue
+                polygon = shape(geom)
+                if needs_clip:
+                    polygon = polygon.intersection(extent)
+                if simplify_tolerance > 0:
+                    polygon = polygon.simplify(simplify_tolerance, preserve_topology=True)
+                polygon = _as_multipolygon(affinity.affine_transform(polygon, coefficients))
+                if polygon is None:
+                    continue
+                yield {
+                    'type': 'Feature',
+                    'geometry': mapping(polygon),
+                    'properties': {
+                        'region': label,
+                        'transition': f"{from_name} -> {to_name}",
+                        'from_class': from_name,
+                        'to_class': to_name,
+                        'cells': int(part_cells[index]),
+                        'area_km2': float(part_area[index] / 1_000_000),
+                        'impact_type': None if impact_idx is None else layer.impact_labels[impact_idx[index]],
+                        'impact_score': None if score is None else float(score[index]),
+                        'critical': None if layer.critical is None else bool(layer.critical[from_idx, to_idx]),
+                    },
+                }
+
+
+def reproject_features(features: Iterator[Dict[str, Any]], src_crs: Optional[str],
+                       dst_crs: str = 'EPSG:4326') -> Iterator[Dict[str, Any]]:
+    """Reproject feature geometries lazily; passes features through when ``src_crs`` is None."""
+    for feature in features:
+        if src_crs is not None and src_crs != dst_crs:
+            feature['geometry'] = transform_geom(src_crs, dst_crs, feature['geometry'])
+        yield feature
+
+
+def geojson_chunks(features: Iterator[Dict[str, Any]], crs: Optional[str] = None,
+                   batch_size: int = 256) -> Iterator[bytes]:
+    """A FeatureCollection as byte chunks of ``batch_size`` features.
+
+    ``crs`` adds the (pre-RFC 7946) named-CRS member for non-WGS84 output.
+    """
+    header = {'type': 'FeatureCollection'}
+    if crs is not None and crs != 'EPSG:4326':
+        header['crs'] = {'type': 'name', 'properties': {'name': crs}}
+    yield (json.dumps(header)[:-1] + ', "features": [').encode('utf-8')
+    batch, first = [], True
+    for feature in features:
+        batch.append(json.dumps(feature, separators=(',', ':')))
+        if len(batch) >= batch_size:
+            yield (('' if first else ',') + ','.join(batch)).encode('utf-8')
+            batch, first = [], False
+    if batch:
+        yield (('' if first else ',') + ','.join(batch)).encode('utf-8')
+    yield b']}'
+
+
+def write_geopackage(path: str, features: Iterator[Dict[str, Any]], crs: Optional[str] = None,
+                     layer: str = 'changes', batch_size: int = 256) -> int:
+    """Write features to a GeoPackage layer in batches; returns the feature count."""
+    if not geopackage_available():
+        raise RuntimeError("GeoPackage export requires rasterio, shapely and fiona")
+    written = 0
+    with fiona.open(path, 'w', driver='GPKG', layer=layer, schema=FEATURE_SCHEMA, crs=crs) as sink:
+        batch = []
+        for feature in features:
+            batch.append(feature)
+            if len(batch) >= batch_size:
+                sink.writerecords(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            sink.writerecords(batch)
+            written += len(batch)
+    return written
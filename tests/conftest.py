@@ -0,0 +1,7 @@
+"""Pytest configuration: make ``src`` and ``backend`` importable from the repo root."""
+import pathlib
+import sys
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
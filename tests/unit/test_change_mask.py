@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.ml_modules.change_mask import change_mask, change_regions, transition_matrix
+
+N_CLASSES = 5
+
+
+def _brute_force_transitions(before, after, weights=None, mask=None):
+    totals = np.zeros((N_CLASSES, N_CLASSES))
+    for i, j, w, keep in np.nditer([
+        before, after,
+        np.ones(before.shape) if weights is None else weights,
+        np.ones(before.shape, dtype=bool) if mask is None else mask,
+    ]):
+        if keep:
+            totals[int(i), int(j)] += float(w)
+    return totals
+
+
+@pytest.fixture
+def class_maps():
+    rng = np.random.default_rng(0)
+    before = rng.integers(0, N_CLASSES, size=(37, 23))
+    after = np.where(rng.random((37, 23)) < 0.3, rng.integers(0, N_CLASSES, size=(37, 23)), before)
+    return before, after
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 5, 36, 37, 1024])
+def test_transition_matrix_is_independent_of_chunk_size(class_maps, chunk_rows):
+    before, after = class_maps
+    counts = transition_matrix(before, after, N_CLASSES, chunk_rows=chunk_rows)
+    assert counts.dtype == np.int64
+    np.testing.assert_array_equal(counts, _brute_force_transitions(before, after))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 4, 1024])
+def test_weighted_masked_transition_matrix_is_independent_of_chunk_size(class_maps, chunk_rows):
+    before, after = class_maps
+    rng = np.random.default_rng(1)
+    weights = rng.random(before.shape)
+    mask = rng.random(before.shape) < 0.5
+    result = transition_matrix(before, after, N_CLASSES, weights=weights, mask=mask, chunk_rows=chunk_rows)
+    np.testing.assert_allclose(result, _brute_force_transitions(before, after, weights, mask))
+
+
+def test_change_mask_marks_differing_elements(class_maps):
+    before, after = class_maps
+    np.testing.assert_array_equal(change_mask(before, after, chunk_rows=3), (before != after).astype(np.uint8))
+
+
+@pytest.fixture
+def three_regions():
+    """Regions of 9, 4 and 1 elements, each a single transition."""
+    before = np.zeros((10, 10), dtype=np.int64)
+    after = before.copy()
+    after[0:3, 0:3] = 1
+    after[5:7, 5:7] = 2
+    after[9, 0] = 3
+    return change_mask(before, after), before, after
+
+
+@pytest.mark.parametrize("max_regions, expected_sizes", [
+    (None, [9, 4, 1]),
+    (0, []),
+    (2, [9, 4]),
+    (10, [9, 4, 1]),
+])
+def test_change_regions_max_regions(three_regions, max_regions, expected_sizes):
+    mask, before, after = three_regions
+    regions = change_regions(mask, before, after, N_CLASSES, max_regions=max_regions)
+    assert [region.elements for region in regions] == expected_sizes
+
+
+def test_change_regions_dominant_transition(three_regions):
+    mask, before, after = three_regions
+    largest = change_regions(mask, before, after, N_CLASSES, max_regions=1)[0]
+    assert (largest.from_class, largest.to_class) == (0, 1)
+    assert largest.bbox == (0, 0, 3, 3)
+    assert largest.purity == 1.0
@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pytest
+
+from src.ml_modules.georeference import WGS84_A, WGS84_F, _row_areas, latitude_band_area_m2
+
+# Surface area of the WGS84 ellipsoid
+WGS84_SURFACE_M2 = 5.10065621724e14
+
+
+def _numeric_band_area_m2(south, north, lon_width):
+    """Integrate the ellipsoid area element M(lat) * N(lat) * cos(lat) numerically."""
+    e2 = WGS84_F * (2 - WGS84_F)
+    lat = np.radians(np.linspace(south, north, 200001))
+    w = 1 - e2 * np.sin(lat) ** 2
+    element = WGS84_A ** 2 * (1 - e2) * np.cos(lat) / w ** 2
+    integral = np.sum((element[1:] + element[:-1]) / 2 * np.diff(lat))
+    return float(integral * math.radians(lon_width))
+
+
+def test_whole_ellipsoid_area():
+    assert latitude_band_area_m2(-90, 90, 360) == pytest.approx(WGS84_SURFACE_M2, rel=1e-9)
+
+
+@pytest.mark.parametrize("south, north, lon_width", [(0, 1, 1), (59, 60, 1), (-45, 30, 12.5), (89, 90, 360)])
+def test_latitude_band_area_matches_numeric_integration(south, north, lon_width):
+    expected = _numeric_band_area_m2(south, north, lon_width)
+    assert latitude_band_area_m2(south, north, lon_width) == pytest.approx(expected, rel=1e-7)
+    assert latitude_band_area_m2(north, south, lon_width) == pytest.approx(expected, rel=1e-7)
+
+
+def test_projected_row_areas_are_pixel_size_squared():
+    areas = _row_areas("projected", (10.0, 0.0, 500000.0, 0.0, -10.0, 4000000.0), 1.0, 4)
+    assert areas.shape == (4, 1)
+    np.testing.assert_allclose(areas, 100.0)
+    # Units in feet
+    np.testing.assert_allclose(_row_areas("projected", (1.0, 0.0, 0.0, 0.0, -1.0, 0.0), 0.3048, 2), 0.3048 ** 2)
+
+
+def test_geographic_row_areas_are_latitude_bands():
+    areas = _row_areas("geographic", (0.5, 0.0, 10.0, 0.0, -0.5, 50.0), 1.0, 6)[:, 0]
+    expected = [latitude_band_area_m2(50 - 0.5 * (i + 1), 50 - 0.5 * i, 0.5) for i in range(6)]
+    np.testing.assert_allclose(areas, expected, rtol=1e-12)
+
+
+def test_mercator_row_areas_sum_to_the_covered_band():
+    lat_top = 40.0
+    y_top = WGS84_A * math.log(math.tan(math.pi / 4 + math.radians(lat_top) / 2))
+    pixel = 1000.0
+    rows = 50
+    areas = _row_areas("mercator", (pixel, 0.0, 0.0, 0.0, -pixel, y_top), 1.0, rows)[:, 0]
+    lat_bottom = math.degrees(2 * math.atan(math.exp((y_top - pixel * rows) / WGS84_A)) - math.pi / 2)
+    lon_width = math.degrees(pixel / WGS84_A)
+    assert areas.sum() == pytest.approx(latitude_band_area_m2(lat_bottom, lat_top, lon_width), rel=1e-9)
+    # Mercator pixels shrink on the ground towards the pole
+    assert np.all(np.diff(areas) > 0)
+
+
+def test_row_areas_are_read_only():
+    areas = _row_areas("projected", (10.0, 0.0, 0.0, 0.0, -10.0, 0.0), 1.0, 3)
+    with pytest.raises(ValueError):
+        areas[0, 0] = 1.0
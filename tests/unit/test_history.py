@@ -0,0 +1,26 @@
+from datetime import datetime
+
+import pytest
+
+from backend.history import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("created_at, record_id", [
+    (datetime(2024, 3, 1, 12, 30, 5, 123456), 42),
+    (datetime(1999, 12, 31, 23, 59, 59), 1),
+    (datetime(2030, 1, 1), 2 ** 40),
+])
+def test_cursor_round_trip(created_at, record_id):
+    cursor = encode_cursor(created_at, record_id)
+    assert decode_cursor(cursor) == (created_at, record_id)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 3, 1, 12, 30, 5, 999999), 123456789)
+    assert all(c.isalnum() or c in "-_=" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "MjAyNC0wMy0wMQ==", "!!!"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)